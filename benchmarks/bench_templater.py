@@ -0,0 +1,420 @@
+"""Micro-benchmarks for the dataform templater.
+
+Run from the repository root::
+
+    python benchmarks/bench_templater.py              # every benchmark
+    python benchmarks/bench_templater.py when_args    # selected benchmarks
+
+Each benchmark prints the best of several timed runs. ``import_time`` exits
+with an error when importing the plugin takes longer than
+``--import-budget-ms``.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.arguments import split_arguments
+from sqlfluff_templater_dataform.refs import ref_cache
+
+
+BENCHMARKS = {}
+
+# Wall time allowed for importing the templater on top of sqlfluff itself,
+# which every lint worker pays before templating its first file.
+IMPORT_BUDGET_MS = 15.0
+
+
+def benchmark(func):
+    """Register ``func`` as a benchmark under its own name."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def best_of(func, repeat: int = 5, number: int = 1) -> float:
+    """Return the best time per call of ``func``, in seconds."""
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def make_templater():
+    """Build a dataform templater with fixed project and dataset defaults."""
+    config = FluffConfig(overrides={"dialect": "bigquery", "templater": "dataform"})
+    templater = config.get_templater()
+    templater.project_id = "my_project"
+    templater.dataset_id = "my_dataset"
+    return templater
+
+
+def _legacy_split_when(content):
+    # The character-at-a-time splitter that split_arguments replaced.
+    params = []
+    current_param = ''
+    in_backtick = in_double_quote = in_single_quote = False
+    paren_depth = 0
+    for char in content:
+        if char == '`' and not in_double_quote and not in_single_quote:
+            in_backtick = not in_backtick
+        elif char == '"' and not in_backtick and not in_single_quote:
+            in_double_quote = not in_double_quote
+        elif char == "'" and not in_backtick and not in_double_quote:
+            in_single_quote = not in_single_quote
+        elif char == '(' and not (in_backtick or in_double_quote or in_single_quote):
+            paren_depth += 1
+        elif char == ')' and not (in_backtick or in_double_quote or in_single_quote):
+            paren_depth -= 1
+        elif char == ',' and not (in_backtick or in_double_quote or in_single_quote) and paren_depth == 0:
+            params.append(current_param.strip())
+            current_param = ''
+            continue
+        current_param += char
+    if current_param.strip():
+        params.append(current_param.strip())
+    return params
+
+
+@benchmark
+def when_args():
+    """Split long ``when()`` bodies: legacy character loop vs split_arguments."""
+    for size in (1_000, 10_000, 100_000):
+        clause = "AND updated_at > TIMESTAMP('2020-01-01') OR f(a, b) IN (1, 2)\n"
+        literal = "`WHERE " + clause * (size // len(clause)) + "`"
+        content = f"incremental(), {literal}, {literal}"
+
+        def tokenize():
+            split_arguments.cache_clear()
+            return [content[a:b] for a, b in split_arguments(content)]
+
+        assert tokenize() == _legacy_split_when(content)
+        legacy = best_of(lambda: _legacy_split_when(content))
+        tokenizer = best_of(tokenize)
+        memoized = best_of(lambda: split_arguments(content), number=100)
+        print(
+            f"when_args {len(content):>8} chars: legacy {legacy * 1e3:8.3f}ms  "
+            f"tokenizer {tokenizer * 1e3:8.3f}ms ({legacy / tokenizer:5.1f}x)  "
+            f"memoized {memoized * 1e6:6.2f}us"
+        )
+
+
+
+def refs_heavy_sqlx(tables: int = 300, refs: int = 3000) -> str:
+    """Build a SQLX model that references ``tables`` tables ``refs`` times."""
+    lines = ['config { type: "table" }', "SELECT *", "FROM ${ref('table_0')} AS t0"]
+    for i in range(1, refs):
+        table = i % tables
+        if i % 3 == 0:
+            ref = f"${{ref('dataset_{table % 7}', 'table_{table}')}}"
+        elif i % 3 == 1:
+            ref = f'${{ref({{ schema: "dataset_{table % 7}", name: "table_{table}" }})}}'
+        else:
+            ref = f"${{ref('table_{table}')}}"
+        lines.append(f"JOIN {ref} AS t{i} ON t{i}.id = t0.id")
+    return "\n".join(lines) + "\n"
+
+
+@benchmark
+def ref_resolution():
+    """Resolve a refs-heavy model and report the resolution cache hit rate."""
+    templater = make_templater()
+    sql = refs_heavy_sqlx()
+    hits, misses = ref_cache.hits, ref_cache.misses
+    elapsed = best_of(lambda: templater.replace_ref_with_bq_table(sql))
+    lookups = ref_cache.hits - hits + ref_cache.misses - misses
+    print(
+        f"ref_resolution {sql.count('${ref'):>6} refs: {elapsed * 1e3:8.3f}ms  "
+        f"cache hit rate {(ref_cache.hits - hits) / lookups:.1%}"
+    )
+
+
+def blocks_heavy_sqlx(models: int = 200) -> str:
+    """Build a SQLX file of back-to-back config, js and pre/post operation blocks."""
+    parts = []
+    for i in range(models):
+        parts.append(
+            f'config {{ type: "table", tags: ["t{i}"] }}js {{ const n{i} = {i}; }}'
+            f"pre_operations {{ SET x = {i} }}${{when(incremental(), \"AND true\")}}\n"
+            f"SELECT ${{ref('table_{i}')}}.id, ${{n{i}}} AS n FROM ${{ref('table_{i}')}}\n"
+        )
+    return "".join(parts)
+
+
+@benchmark
+def slice_compaction():
+    """Report slice counts and slicing time with and without compaction."""
+    templater = make_templater()
+    sql = blocks_heavy_sqlx()
+    for compact in (False, True):
+        templater.compact_slices = compact
+        elapsed = best_of(lambda: templater.slice_sqlx_template(sql))
+        _, raw_slices, _ = templater.slice_sqlx_template(sql)
+        print(
+            f"slice_compaction compact_slices={compact!s:<5} "
+            f"{len(raw_slices):>6} slices: {elapsed * 1e3:8.3f}ms"
+        )
+
+
+@benchmark
+def slicing():
+    """Time a full slice of a refs-heavy model against reading its config block only."""
+    templater = make_templater()
+    sql = refs_heavy_sqlx()
+    full = best_of(lambda: templater.slice_sqlx_template(sql))
+    first = best_of(lambda: next(templater.iter_slices(sql)), number=100)
+    print(
+        f"slicing {len(sql):>9} chars: slice_sqlx_template {full * 1e3:8.3f}ms  "
+        f"first slice via iter_slices {first * 1e3:8.3f}ms"
+    )
+
+
+@benchmark
+def engines():
+    """Compare the legacy and scan engines on refs- and blocks-heavy models."""
+    from sqlfluff_templater_dataform.engines import compare_engines
+
+    templater = make_templater()
+    for label, sql in (("refs_heavy", refs_heavy_sqlx(refs=600)), ("blocks_heavy", blocks_heavy_sqlx())):
+        comparison = compare_engines(templater, sql)
+        print(
+            f"engines {label:<12} legacy {comparison.baseline_seconds * 1e3:9.3f}ms  "
+            f"scan {comparison.candidate_seconds * 1e3:8.3f}ms  "
+            f"{comparison.speedup:6.1f}x  equivalent={comparison.equivalent} tolerated={comparison.tolerated}"
+        )
+
+
+@benchmark
+def large_file_tier():
+    """Slice big files with the default scanner and the large file tier."""
+    templater = make_templater()
+    cases = (
+        ("refs_heavy", refs_heavy_sqlx()),
+        ("unterminated", "config { ${self()} " * 2000),
+    )
+    for label, sql in cases:
+        for threshold in (0, 1):
+            templater.large_file_threshold = threshold
+            elapsed = best_of(lambda: templater.slice_sqlx_template(sql), repeat=1)
+            tier = "large" if threshold else "default"
+            print(f"large_file_tier {label:<12} {tier:<7} {len(sql):>9} chars: {elapsed * 1e3:9.3f}ms")
+
+
+@benchmark
+def construct_memo():
+    """Slice generated models sharing long blocks, with and without the memo."""
+    from sqlfluff_templater_dataform.memo import construct_memo
+
+    js_block = "js {\n" + "".join(
+        f"  const f{i} = (x) => {{ if (x) {{ return {{ v: [x, {{ w: {i} }}] }}; }} }};\n"
+        for i in range(200)
+    ) + "}\n"
+    when = "${when(incremental(), `WHERE ts > (SELECT MAX(ts) FROM ${self()})`)}\n"
+    models = [
+        f"config {{ type: \"incremental\" }}\n{js_block}"
+        f"pre_operations {{\n{js_block}}}\nSELECT c{i} FROM ${{ref('t{i}')}}\n{when}"
+        for i in range(200)
+    ]
+    templater = make_templater()
+    for size in (0, 1024):
+        templater.construct_memo = construct_memo if size else None
+        construct_memo.maxsize = size
+        construct_memo.start_run()
+        hits, misses = construct_memo.hits, construct_memo.misses
+        elapsed = best_of(lambda: [templater.slice_sqlx_template(m) for m in models], repeat=3)
+        lookups = construct_memo.hits - hits + construct_memo.misses - misses
+        rate = (construct_memo.hits - hits) / lookups if lookups else 0.0
+        label = "memo" if size else "no memo"
+        print(f"construct_memo {label:<7} {len(models)} models: {elapsed * 1e3:8.2f}ms, hit rate {rate:.1%}")
+
+
+@benchmark
+def slice_table():
+    """Serialize a refs-heavy model's slices as a SliceTable and with pickle."""
+    import pickle
+
+    from sqlfluff_templater_dataform.slices import SliceTable
+
+    templater = make_templater()
+    sql = refs_heavy_sqlx()
+    slicing = templater.slice_sqlx_template(sql)
+    table = SliceTable.from_slices(sql, *slicing)
+    data = table.to_bytes()
+    to_bytes = best_of(table.to_bytes, number=100)
+    from_bytes = best_of(lambda: SliceTable.from_bytes(data), number=100)
+    pickled = pickle.dumps(slicing)
+    pickle_time = best_of(lambda: pickle.dumps(slicing), repeat=3)
+    print(
+        f"slice_table {len(table)} slices: {len(data)} bytes, to_bytes {to_bytes * 1e6:.1f}us, "
+        f"from_bytes {from_bytes * 1e6:.1f}us; pickled slices {len(pickled)} bytes "
+        f"in {pickle_time * 1e6:.1f}us"
+    )
+
+
+@benchmark
+def incremental_variants():
+    """Slice an incremental model twice against deriving its second variant."""
+    templater = make_templater()
+    sql = (
+        'config { type: "incremental" }\n'
+        + refs_heavy_sqlx()
+        + "${when(incremental(), `WHERE ts > (SELECT MAX(ts) FROM ${self()})`)}\n"
+    )
+    twice = best_of(lambda: (templater.slice_sqlx_template(sql), templater.slice_sqlx_template(sql)))
+    derived = best_of(lambda: list(templater.slice_sqlx_variants(sql)))
+    print(
+        f"incremental_variants two scans: {twice * 1e3:.3f}ms, "
+        f"one scan and a derived variant: {derived * 1e3:.3f}ms"
+    )
+
+
+def js_heavy_sqlx(index: int) -> str:
+    """Build a SQLX model which uses JS expressions in many SQL positions."""
+    return (
+        'config { type: "table" }\n'
+        'js { const days = 7; const unit = "DAY"; const pct = 10; }\n'
+        f"SELECT ${{cols}}, '${{label}}' AS label_{index}\n"
+        "FROM ${source} TABLESAMPLE SYSTEM (${pct} PERCENT)\n"
+        "JOIN ${dims}.dim USING (id)\n"
+        "WHERE env = ${env}\n"
+        "  AND ts > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL ${days} ${unit})\n"
+        "  AND EXTRACT(${part} FROM ts) > 0\n"
+        "LIMIT ${limit}\n"
+    )
+
+
+@benchmark
+def js_placeholders():
+    """Parse JS-heavy models with bare and context-aware placeholders.
+
+    An unparsable section ends the parse of its statement early, so parse
+    times are only comparable alongside how much SQL was left unparsed.
+    """
+    from sqlfluff.core import FluffConfig, Linter
+
+    models = [js_heavy_sqlx(i) for i in range(40)]
+    for context_placeholders in (False, True):
+        config = FluffConfig(
+            configs={"templater": {"dataform": {
+                "project_id": "p", "dataset_id": "d",
+                "context_placeholders": context_placeholders,
+            }}},
+            overrides={"dialect": "bigquery", "templater": "dataform"},
+        )
+        linter = Linter(config=config)
+        start = time.perf_counter()
+        unparsable = unparsed_chars = 0
+        for i, sql in enumerate(models):
+            tree = linter.parse_string(sql, fname=f"model_{i}.sqlx").tree
+            for segment in tree.recursive_crawl("unparsable"):
+                unparsable += 1
+                unparsed_chars += len(segment.raw)
+        elapsed = time.perf_counter() - start
+        print(
+            f"js_placeholders context_placeholders={context_placeholders!s:<5} "
+            f"{len(models)} models: parse {elapsed * 1e3:8.1f}ms  "
+            f"{unparsable} unparsable sections ({unparsed_chars} chars)"
+        )
+
+
+@benchmark
+def project_index():
+    """Build a 10k-model project index and time lookups in the mapped file."""
+    from sqlfluff_templater_dataform.index import ProjectIndex, build_index, write_index
+
+    entries = [(f"model_{i}", ("", f"dataset_{i % 50}")) for i in range(10000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.bin")
+        build = best_of(lambda: build_index(entries))
+        write_index(path, build_index(entries))
+        index = ProjectIndex(path)
+        names = [name for name, _ in entries[::7]]
+        lookup = best_of(lambda: [index.get(name) for name in names]) / len(names)
+        size = os.path.getsize(path)
+        index.close()
+    print(
+        f"project_index {len(entries):>6} models: build {build * 1e3:8.3f}ms  "
+        f"lookup {lookup * 1e6:6.2f}us  {size / 1024:.0f}KiB mapped"
+    )
+
+
+def plugin_import_times(pycache_prefix: str) -> dict:
+    """Import the templater in a fresh interpreter under ``-X importtime``.
+
+    sqlfluff's own modules are imported first, as they are by the plugin
+    manager, so only what the plugin adds is measured.
+
+    Returns:
+        Self time in microseconds of each module the plugin import loaded,
+        plus the cumulative time of the whole import under ``None``.
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run(
+        [
+            sys.executable, "-X", "importtime", "-X", f"pycache_prefix={pycache_prefix}",
+            "-c", "import sqlfluff.core.plugin.host; import sqlfluff_templater_dataform.templater",
+        ],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    measuring = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        name = module.strip()
+        # Nested imports are indented by two spaces per level.
+        top_level = len(module) - len(module.lstrip()) == 1
+        if name == "sqlfluff.core.plugin.host" and top_level:
+            measuring = True
+        elif measuring:
+            times[name] = int(self_us)
+            if top_level:
+                times[None] = int(cumulative_us)
+    return times
+
+
+@benchmark
+def import_time(budget_ms: float = IMPORT_BUDGET_MS):
+    """Time the plugin import with warm bytecode caches, against a budget."""
+    with tempfile.TemporaryDirectory() as pycache_prefix:
+        plugin_import_times(pycache_prefix)  # write the bytecode caches
+        runs = [plugin_import_times(pycache_prefix) for _ in range(5)]
+    best = min(runs, key=lambda times: times[None])
+    total_ms = best[None] / 1e3
+    slowest = sorted(
+        ((us, name) for name, us in best.items() if name is not None), reverse=True
+    )[:5]
+    print(
+        f"import_time {len(best) - 1:>3} modules: {total_ms:8.3f}ms "
+        f"(budget {budget_ms:g}ms)  slowest: "
+        + ", ".join(f"{name} {us / 1e3:.2f}ms" for us, name in slowest)
+    )
+    if total_ms > budget_ms:
+        sys.exit(f"import_time: plugin import took {total_ms:.3f}ms, over the {budget_ms:g}ms budget")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help=", ".join(sorted(BENCHMARKS)))
+    parser.add_argument(
+        "--import-budget-ms", type=float, default=IMPORT_BUDGET_MS,
+        help=f"fail import_time above this many milliseconds (default {IMPORT_BUDGET_MS:g})",
+    )
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    for name in args.names or BENCHMARKS:
+        if name == "import_time":
+            import_time(args.import_budget_ms)
+        else:
+            BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
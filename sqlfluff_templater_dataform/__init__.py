@@ -1,10 +1,21 @@
 """Defines the hook endpoints for the dataform templater plugin."""
 
 from sqlfluff.core.plugin import hookimpl
-from sqlfluff_templater_dataform.templater import DataformTemplater
 
 
 @hookimpl
 def get_templaters():
     """Get templaters."""
+    # Imported on first use so that loading the plugin stays cheap.
+    from sqlfluff_templater_dataform.templater import DataformTemplater
+
     return [DataformTemplater]
+
+
+def __getattr__(name):
+    """Import ``DataformTemplater`` when it is first accessed."""
+    if name == "DataformTemplater":
+        from sqlfluff_templater_dataform.templater import DataformTemplater
+
+        return DataformTemplater
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
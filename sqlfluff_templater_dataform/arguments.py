@@ -0,0 +1,75 @@
+"""Argument tokenizer shared by ``ref()``, ``when()`` and object-notation refs.
+
+Dataform call arguments are JavaScript, so a comma only separates arguments
+when it is outside string and template literals and outside any ``()``,
+``[]`` or ``{}`` nesting. Rather than walking the text one character at a
+time, a single compiled pattern hops straight to the next quote, bracket or
+comma and skips whole literals in one step.
+"""
+import re
+from functools import lru_cache
+from typing import Tuple
+
+
+# Literals are matched whole (an unterminated one runs to the end of the
+# text); everything else the tokenizer cares about is a single character.
+_ARGUMENT_TOKEN_PATTERN = re.compile(
+    r'''
+      `[^`\\]*(?:\\.[^`\\]*)*`?
+    | "[^"\\]*(?:\\.[^"\\]*)*"?
+    | '[^'\\]*(?:\\.[^'\\]*)*'?
+    | [(\[{]
+    | [)\]}]
+    | ,
+    ''',
+    re.VERBOSE | re.DOTALL,
+)
+
+ArgumentSpans = Tuple[Tuple[int, int], ...]
+
+
+@lru_cache(maxsize=4096)
+def split_arguments(text: str) -> ArgumentSpans:
+    """Split a JavaScript argument list into top-level arguments.
+
+    Args:
+        text: The text between the parentheses of a call, or between the
+            braces of an object literal.
+
+    Returns:
+        A ``(start, end)`` offset pair into ``text`` for each argument, with
+        surrounding whitespace excluded. A trailing empty argument (as left
+        by a trailing comma) is dropped. Results are memoized by ``text``.
+    """
+    spans = []
+    depth = 0
+    arg_start = 0
+    for match in _ARGUMENT_TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if token == ',':
+            if depth == 0:
+                spans.append(_strip_span(text, arg_start, match.start()))
+                arg_start = match.end()
+        elif token in '([{':
+            depth += 1
+        elif token in ')]}':
+            depth -= 1
+    last = _strip_span(text, arg_start, len(text))
+    if last[0] != last[1]:
+        spans.append(last)
+    return tuple(spans)
+
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def unquote(value: str) -> str:
+    """Remove one pair of matching single or double quotes around ``value``."""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    return value
@@ -0,0 +1,95 @@
+"""Circuit breaker which stops templating a tree that keeps failing.
+
+A project-wide problem (bad templater settings, an unsupported construct in
+a shared include) makes every file fail the same way, and each one still
+pays for templating and a doomed parse. The breaker counts consecutive
+files whose templating raised or fell back to literal SQL for an unterminated
+block or expression. Once ``sequential_fail_limit`` is reached it logs one
+summary warning and every later file of the run is skipped with
+``SQLFluffSkipFile``. A successfully templated file resets the count.
+
+Lint workers build a new templater for every file, so the state is kept per
+process. The breaker is armed by ``sequence_files`` in the process that
+starts a run and is always armed in worker processes. Templating a string
+through the Python API outside of a run never trips it.
+"""
+import logging
+from typing import List, Tuple
+
+from sqlfluff.core.errors import SQLFluffSkipFile
+from sqlfluff.core.plugin.host import is_main_process
+
+
+# Instantiate the templater logger
+templater_logger = logging.getLogger("sqlfluff.templater")
+
+
+class CircuitBreaker:
+    """Count consecutive templating failures and skip files once tripped.
+
+    Args:
+        limit: Number of consecutive failures which opens the breaker. Zero
+            disables it.
+    """
+
+    def __init__(self, limit: int = 3):
+        self.limit = limit
+        self.failures = 0
+        self.is_open = False
+        self.skipped = 0
+        self._armed = False
+        self._recent: List[Tuple[str, str]] = []
+
+    @property
+    def armed(self) -> bool:
+        """Whether failures are counted in this process."""
+        return self.limit > 0 and (self._armed or not is_main_process.get())
+
+    def start_run(self) -> None:
+        """Close the breaker and arm it for a new run."""
+        self.failures = 0
+        self.is_open = False
+        self.skipped = 0
+        self._armed = True
+        self._recent = []
+
+    def check(self, fname: str) -> None:
+        """Raise ``SQLFluffSkipFile`` for ``fname`` if the breaker is open."""
+        if self.is_open and self.armed:
+            self.skipped += 1
+            raise SQLFluffSkipFile(
+                f"Skipping {fname!r}: the dataform templater stopped after "
+                f"{self.limit} consecutive templating failures."
+            )
+
+    def record_success(self) -> None:
+        """Reset the count of consecutive failures."""
+        self.failures = 0
+        self._recent.clear()
+
+    def record_failure(self, fname: str, reason: str) -> bool:
+        """Count a failed file.
+
+        Returns:
+            True if this failure opened the breaker.
+        """
+        if not self.armed or self.is_open:
+            return False
+        self.failures += 1
+        self._recent = self._recent[-(self.limit - 1):] if self.limit > 1 else []
+        self._recent.append((fname, reason))
+        if self.failures < self.limit:
+            return False
+        self.is_open = True
+        templater_logger.warning(
+            "Dataform templater: %s consecutive files failed to template, "
+            "skipping the remaining files. Raise or disable "
+            "sequential_fail_limit in [sqlfluff:templater:dataform] to "
+            "template them anyway. Last failures:\n%s",
+            self.failures,
+            "\n".join(f"  {name}: {why}" for name, why in self._recent),
+        )
+        return True
+
+
+circuit_breaker = CircuitBreaker()
@@ -0,0 +1,196 @@
+"""Template a whole Dataform project and dump the output as JSON Lines.
+
+Installed as the ``sqlfluff-dataform-compile`` console script::
+
+    sqlfluff-dataform-compile definitions/ -o compiled.jsonl --processes 8
+
+Settings are read from the ``.sqlfluff`` (or other sqlfluff config files) of
+the directory it is run from and of each file's directory on the way to it,
+exactly as ``sqlfluff lint`` would, so the output is what the linter sees. Each ``.sqlx`` file becomes one line::
+
+    {"fname": ..., "templated_sql": ..., "slices": [[type, src_start,
+     src_stop, templated_start, templated_stop], ...]}
+
+or ``{"fname": ..., "skipped": reason}`` / ``{"fname": ..., "error": ...}``.
+Lines are written in file order as soon as they are ready, so memory does not
+grow with the size of the project. Workers send each file's slicing to the
+main process as a serialized ``SliceTable``, which is far cheaper to pickle
+than sqlfluff's slice objects. Throughput is reported on stderr.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Sequence
+
+from sqlfluff.core import FluffConfig
+from sqlfluff.core.errors import SQLFluffSkipFile
+
+from sqlfluff_templater_dataform.slices import SLICE_TYPES, SliceTable
+
+if TYPE_CHECKING:  # pragma: no cover
+    from sqlfluff_templater_dataform.templater import DataformTemplater
+
+
+def iter_sqlx_files(paths: Sequence[str]) -> Iterator[str]:
+    """Yield the ``.sqlx`` files under ``paths`` in sorted order.
+
+    Files given explicitly are yielded whatever their extension.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith(".sqlx"):
+                    yield os.path.join(root, name)
+
+
+# Per-process state, set up once by each pool worker.
+_config: Optional[FluffConfig] = None
+_templater: Optional["DataformTemplater"] = None
+# Directory -> the config of the files in it, nested config files included.
+_dir_configs: Dict[str, FluffConfig] = {}
+
+
+def _init_worker(config: FluffConfig) -> None:
+    global _config, _templater
+    _config = config
+    _templater = config.get_templater()
+    _dir_configs.clear()
+
+
+def _config_for(fname: str) -> FluffConfig:
+    """Return the config of ``fname``, as ``sqlfluff lint`` resolves it."""
+    directory = os.path.dirname(fname) or "."
+    config = _dir_configs.get(directory)
+    if config is None:
+        config = _dir_configs[directory] = _config.make_child_from_path(
+            fname, require_dialect=False
+        )
+    return config
+
+
+def compile_file(fname: str) -> Dict[str, Any]:
+    """Template ``fname`` with the worker's templater.
+
+    Returns:
+        The record for the file, with its size in ``"bytes"`` and its
+        serialized ``SliceTable`` in ``"table"`` (see ``_json_record``).
+    """
+    record: Dict[str, Any] = {"fname": fname}
+    try:
+        with open(fname, encoding="utf-8") as f:
+            in_str = f.read()
+        record["bytes"] = len(in_str.encode("utf-8"))
+        templated_file, _ = _templater.process(
+            fname=fname, in_str=in_str, config=_config_for(fname)
+        )
+    except SQLFluffSkipFile as err:
+        record["skipped"] = str(err)
+        return record
+    except Exception as err:
+        record["error"] = f"{type(err).__name__}: {err}"
+        return record
+    record["table"] = SliceTable.from_templated_file(templated_file).to_bytes()
+    return record
+
+
+def _json_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the serialized table of a record with its JSON fields."""
+    data = record.pop("table", None)
+    if data is not None:
+        table = SliceTable.from_bytes(data)
+        record["templated_sql"] = table.templated_str
+        record["slices"] = [
+            [SLICE_TYPES[kind], *offsets]
+            for kind, *offsets in zip(
+                table.kinds,
+                table.source_starts,
+                table.source_stops,
+                table.templated_starts,
+                table.templated_stops,
+            )
+        ]
+    return record
+
+
+def main(argv=None) -> int:
+    """Entry point of ``sqlfluff-dataform-compile``."""
+    parser = argparse.ArgumentParser(
+        prog="sqlfluff-dataform-compile",
+        description="Template Dataform SQLX files and write the templated SQL "
+        "and slice maps as JSON Lines.",
+    )
+    parser.add_argument("paths", nargs="+", help="SQLX files or directories")
+    parser.add_argument(
+        "-o", "--output", default="-", help="output file, '-' for stdout (default)"
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=os.cpu_count() or 1,
+        help="number of worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=16, help="files handed to a worker at a time"
+    )
+    args = parser.parse_args(argv)
+
+    config = FluffConfig.from_path(
+        os.getcwd(), overrides={"templater": "dataform"}, require_dialect=False
+    )
+    fnames = list(iter_sqlx_files(args.paths))
+    # Builds the project index, if one is configured, before any worker starts.
+    config.get_templater().sequence_files(fnames, config=config)
+
+    start = time.perf_counter()
+    counts = {"files": 0, "bytes": 0, "skipped": 0, "error": 0}
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    pool = None
+    try:
+        if args.processes > 1 and len(fnames) > 1:
+            # Spawned, as sqlfluff's own workers are: sequence_files may have
+            # started read-ahead threads, whose locks a fork would copy.
+            pool = multiprocessing.get_context("spawn").Pool(
+                min(args.processes, len(fnames)), initializer=_init_worker, initargs=(config,)
+            )
+            records = pool.imap(compile_file, fnames, chunksize=args.chunksize)
+        else:
+            _init_worker(config)
+            records = map(compile_file, fnames)
+        for record in records:
+            counts["files"] += 1
+            counts["bytes"] += record.pop("bytes", 0)
+            for outcome in ("skipped", "error"):
+                if outcome in record:
+                    counts[outcome] += 1
+            out.write(json.dumps(_json_record(record)))
+            out.write("\n")
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    else:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(
+        f"Compiled {counts['files']} files ({counts['bytes'] / 1e6:.1f}MB) in "
+        f"{elapsed:.2f}s: {counts['files'] / elapsed:.0f} files/s, "
+        f"{counts['bytes'] / 1e6 / elapsed:.1f}MB/s. "
+        f"{counts['skipped']} skipped, {counts['error']} errors.",
+        file=sys.stderr,
+    )
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
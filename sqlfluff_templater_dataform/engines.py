@@ -0,0 +1,693 @@
+"""Slicing engines and a differential check between them.
+
+``slice_sqlx_template`` hands the actual slicing to an engine chosen by the
+``engine`` setting in the ``[sqlfluff:templater:dataform]`` section:
+
+``scan``
+    The default. Built on ``DataformTemplater.iter_slices``.
+
+``legacy``
+    The original slicer, kept as the reference for new engines. It runs
+    whole-file replacement passes for the templated string and rescans the
+    rest of the file for every construct.
+
+Engines are functions of ``(templater, sql)`` returning the same
+``(templated_sql, raw_slices, templated_slices)`` tuple as
+``slice_sqlx_template``. The legacy engine resolves constructs with its own
+copy of the original helpers, so a comparison against it checks how
+constructs are found and replaced as well as how a file is cut into slices.
+
+``compare_engines`` runs two engines on the same input and reports whether
+they agree and how fast each was. The one difference it tolerates, a
+baseline string which disagrees with the baseline's own slices, is reported
+as ``tolerated`` rather than as a match. Running this module checks whole
+trees::
+
+    python -m sqlfluff_templater_dataform.engines definitions/ --candidate scan
+"""
+import argparse
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+
+from sqlfluff.core.templaters.base import RawFileSlice, TemplatedFileSlice
+
+if TYPE_CHECKING:  # pragma: no cover
+    from sqlfluff_templater_dataform.templater import DataformTemplater
+
+
+SliceResult = Tuple[str, List[RawFileSlice], List[TemplatedFileSlice]]
+Engine = Callable[["DataformTemplater", str], SliceResult]
+
+DEFAULT_ENGINE = "scan"
+
+
+def scan_engine(templater: "DataformTemplater", sql: str) -> SliceResult:
+    """Collect ``iter_slices`` into lists and join the templated text."""
+    raw_slices = []
+    templated_slices = []
+    pieces = []
+    for raw_slice, templated_slice, text in templater.iter_slices(sql):
+        raw_slices.append(raw_slice)
+        templated_slices.append(templated_slice)
+        pieces.append(text)
+    return ''.join(pieces), raw_slices, templated_slices
+
+
+# Patterns of the original templater, which the legacy engine slices by.
+CONFIG_BLOCK_PATTERN = r'config\s*\{(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*\}'
+PRE_OPERATION_BLOCK_PATTERN = r'pre_operations\s*\{(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*\}'
+POST_OPERATION_BLOCK_PATTERN = r'post_operations\s*\{(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*\}'
+JS_BLOCK_PATTERN = r'\s*js\s*\{(?:[^{}]|\{[^{}]*\})*\}'
+JS_EXPRESSION_PATTERN_IN_SQL = r'\$\{'
+REF_PATTERN = r'(?s)\$\{\s*ref\((.*?)\)\s*\}'
+SELF_PATTERN = r'\$\{\s*self\(\s*\)\s*\}'
+INCREMENTAL_CONDITION_PATTERN = r'\$\{\s*when\((.*?)\)\s*\}'
+
+
+class _Baseline:
+    """The construct helpers of the original templater, as first written.
+
+    The legacy engine resolves constructs with these rather than with the
+    templater's current methods, so that comparing an engine against it
+    also checks every later change to how constructs are found and
+    replaced. They are kept verbatim and are not to be optimised.
+    """
+
+    def __init__(self, project_id, dataset_id):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+
+    def replace_blocks(self, in_str: str) -> str:
+        """Remove all Dataform blocks from the SQL string.
+
+        This method identifies and removes config, pre_operations, post_operations,
+        and js blocks from the input string. It uses a brace-counting approach to
+        handle blocks with arbitrary nesting depth, ensuring that blocks containing
+        complex JavaScript code with deeply nested braces are correctly identified
+        and removed in their entirety.
+
+        The algorithm:
+        1. Search for block start patterns (keyword followed by {)
+        2. Use find_block_end() to locate the matching closing brace
+        3. Remove the entire block (including nested content)
+        4. Repeat until no more blocks are found
+
+        This approach is robust against JavaScript code with unlimited nesting levels,
+        unlike regex-based methods that are limited to fixed recursion depths.
+
+        Args:
+            in_str: The input SQLX string containing Dataform blocks
+
+        Returns:
+            The input string with all Dataform blocks removed
+        """
+        block_keywords = ['config', 'pre_operations', 'post_operations', 'js']
+        for keyword in block_keywords:
+            pattern = rf'{re.escape(keyword)}\s*\{{'
+            while True:
+                match = re.search(pattern, in_str)
+                if not match:
+                    break
+                start = match.end() - 1  # position of {
+                end = self.find_block_end(in_str, start)
+                if end != -1:
+                    in_str = in_str[:match.start()] + in_str[end:]
+                else:
+                    break  # invalid, stop
+        return in_str
+
+    def find_block_end(self, sql: str, start: int) -> int:
+        """Find the end of a block starting with { at position start.
+
+        This method implements a brace-counting algorithm to find the matching
+        closing brace for a block that starts with an opening brace at the given
+        position. It correctly handles arbitrary nesting levels by maintaining
+        a counter that increments for each '{' and decrements for each '}'.
+
+        The algorithm ensures that nested blocks are properly traversed, making
+        it robust for complex JavaScript code with deeply nested structures like:
+        - Nested function calls
+        - Conditional statements within conditionals
+        - Object literals with nested objects
+        - Array literals with complex expressions
+
+        Args:
+            sql: The SQL string to search in
+            start: The position of the opening brace '{' that starts the block
+
+        Returns:
+            The position after the matching closing brace '}', or -1 if no
+            matching brace is found (malformed input)
+        """
+        brace_count = 0
+        i = start
+        while i < len(sql):
+            if sql[i] == '{':
+                brace_count += 1
+            elif sql[i] == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    return i + 1  # include the }
+            i += 1
+        return -1  # not found
+
+    def find_expression_end(self, sql: str, start: int) -> int:
+        """Find the end of a JavaScript expression starting with ${ at position start.
+
+        This method implements a brace-counting algorithm to find the matching
+        closing brace for a JavaScript expression that starts with ${ at the given
+        position. It correctly handles arbitrary nesting levels by maintaining
+        a counter that increments for each '{' and decrements for each '}'.
+
+        The algorithm ensures that nested expressions are properly traversed, making
+        it robust for complex JavaScript expressions with deeply nested structures like:
+        - Nested function calls with object parameters
+        - Conditional expressions within expressions
+        - Object literals with nested objects
+        - Array literals with complex expressions
+
+        Args:
+            sql: The SQL string to search in
+            start: The position of the opening { in ${ that starts the expression
+
+        Returns:
+            The position after the matching closing brace '}', or -1 if no
+            matching brace is found (malformed input)
+        """
+        brace_count = 0
+        i = start
+        while i < len(sql):
+            if sql[i:i+2] == '${':
+                brace_count += 1
+                i += 1  # skip the $
+            elif sql[i] == '{':
+                brace_count += 1
+            elif sql[i] == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    return i + 1  # include the }
+            i += 1
+        return -1  # not found
+
+    def replace_ref_with_bq_table(self, sql):
+        """ A regular expression to handle ref function calls that include spaces. """
+        pattern = re.compile(REF_PATTERN)
+        def ref_to_table(match):
+            # Extract the content inside ref() using the captured group
+            ref_content = match.group(1)  # Use the captured group instead of manual extraction
+            
+            # Check if it's object notation: { name: "name", schema: "schema", database: "database" }
+            if ref_content.strip().startswith('{') and ref_content.strip().endswith('}'):
+                # Parse object notation with simpler string parsing
+                obj_content = ref_content.strip()[1:-1]  # Remove { and }
+                parts = {}
+                
+                # Split by commas and parse each key-value pair
+                for pair in obj_content.split(','):
+                    pair = pair.strip()
+                    if ':' in pair:
+                        # Find the first colon and split
+                        colon_pos = pair.find(':')
+                        key = pair[:colon_pos].strip()
+                        value = pair[colon_pos + 1:].strip()
+                        # Remove quotes if present
+                        if (value.startswith('"') and value.endswith('"')) or \
+                           (value.startswith("'") and value.endswith("'")):
+                            value = value[1:-1]
+                        parts[key] = value
+                
+                # Debug: if parsing failed, return original
+                if not parts:
+                    return match.group(0)
+                
+                # Extract values with fallbacks
+                project_id = parts.get('database', self.project_id)
+                dataset = parts.get('schema', self.dataset_id)
+                model_name = parts.get('name', '')
+                
+            else:
+                # Handle variadic arguments: "database", "schema", "name" or "schema", "name" or "name"
+                # Split by commas, trim whitespace, and remove quotes
+                parts = [part.strip().strip('"\'') for part in ref_content.split(',')]
+                
+                if len(parts) == 3:
+                    # 3 elements: database, schema, name
+                    project_id = parts[0]
+                    dataset = parts[1]
+                    model_name = parts[2]
+                elif len(parts) == 2:
+                    # 2 elements: schema, name
+                    dataset = parts[0]
+                    model_name = parts[1]
+                    project_id = self.project_id
+                else:
+                    # 1 element: name only
+                    model_name = parts[0]
+                    dataset = self.dataset_id
+                    project_id = self.project_id
+            
+            # Ensure we have a valid model_name
+            if not model_name:
+                return match.group(0)  # Return original if no valid name found
+            
+            # Sanitize identifiers to ensure they're valid for BigQuery
+            # BigQuery identifiers can contain letters, numbers, and underscores
+            # They must start with a letter or underscore
+            def sanitize_identifier(identifier):
+                if not identifier:
+                    return identifier
+                # Replace invalid characters with underscores
+                sanitized = re.sub(r'[^a-zA-Z0-9_-]', '_', str(identifier))
+                # Ensure it starts with a letter or underscore
+                if sanitized and sanitized[0].isdigit():
+                    sanitized = '_' + sanitized
+                return sanitized
+            
+            project_id = sanitize_identifier(project_id)
+            dataset = sanitize_identifier(dataset)
+            model_name = sanitize_identifier(model_name)
+                
+            result = f"`{project_id}.{dataset}.{model_name}`"
+            return result
+
+        return re.sub(pattern, ref_to_table, sql)
+
+    def replace_self_with_bq_table(self, sql):
+        """ A regular expression to handle self function calls. """
+        pattern = re.compile(SELF_PATTERN)
+        def self_to_table(match):
+            return f"`{self.project_id}.{self.dataset_id}.self`"
+
+        return re.sub(pattern, self_to_table, sql)
+
+    def _process_when_content(self, content: str) -> str:
+        # Split by comma, but be careful with quoted strings
+        params = []
+        current_param = ''
+        in_backtick = False
+        in_double_quote = False
+        in_single_quote = False
+        paren_depth = 0
+        
+        i = 0
+        while i < len(content):
+            char = content[i]
+            if char == '`' and not in_double_quote and not in_single_quote:
+                in_backtick = not in_backtick
+            elif char == '"' and not in_backtick and not in_single_quote:
+                in_double_quote = not in_double_quote
+            elif char == "'" and not in_backtick and not in_double_quote:
+                in_single_quote = not in_single_quote
+            elif char == '(' and not in_backtick and not in_double_quote and not in_single_quote:
+                paren_depth += 1
+            elif char == ')' and not in_backtick and not in_double_quote and not in_single_quote:
+                paren_depth -= 1
+            elif char == ',' and not in_backtick and not in_double_quote and not in_single_quote and paren_depth == 0:
+                params.append(current_param.strip())
+                current_param = ''
+                i += 1
+                continue
+            current_param += char
+            i += 1
+        
+        if current_param.strip():
+            params.append(current_param.strip())
+        
+        # Remove the condition (first parameter)
+        if len(params) > 1:
+            value_params = params[1:]
+        else:
+            value_params = params
+        
+        if len(value_params) == 0:
+            return ''  # No value parameters
+        elif len(value_params) == 1:
+            # Single value parameter: return empty (non-incremental mode)
+            return ''
+        else:
+            # Multiple value parameters: return the last one (fallback)
+            return value_params[-1]
+
+    def replace_incremental_condition(self, sql: str) -> str:
+        """Replace incremental conditions with their fallback values or empty.
+        
+        This method uses brace-counting to handle when expressions that contain
+        nested template literals or function calls.
+        """
+        result = []
+        i = 0
+        pattern = re.compile(r'\$\{\s*when\(')
+        while i < len(sql):
+            match = pattern.match(sql, i)
+            if match:
+                start_idx = i
+                expr_start = sql.find('{', start_idx)
+                end = self.find_expression_end(sql, expr_start)
+                if end != -1:
+                    match_raw = sql[start_idx:end]
+                    # We need to extract the content inside when(...)
+                    first_paren = sql.find('(', start_idx)
+                    content = match_raw[first_paren - start_idx + 1:]
+                    content = content.rstrip()
+                    if content.endswith('}'):
+                        content = content[:-1].rstrip()
+                    if content.endswith(')'):
+                        content = content[:-1]
+                    
+                    replaced_val = self._process_when_content(content)
+                    result.append(replaced_val)
+                    i = end
+                    continue
+            result.append(sql[i])
+            i += 1
+        return ''.join(result)
+
+    def replace_js_expressions(self, sql: str) -> str:
+        """Replace JavaScript expressions with placeholders.
+        
+        This method uses brace-counting to properly handle expressions
+        with nested braces like ${func({param: 'value'})}.
+        """
+        result = []
+        i = 0
+        while i < len(sql):
+            if sql[i:i+2] == '${' and not (
+                sql[i:i+6] == '${ref(' or 
+                sql[i:i+7] == '${self(' or
+                sql[i:i+6] == '${when('
+            ):
+                # Found a JS expression, find its end
+                expr_start = i + 1  # position of {
+                end = self.find_expression_end(sql, expr_start)
+                if end != -1:
+                    result.append("js_expression")
+                    i = end
+                    continue
+            result.append(sql[i])
+            i += 1
+        return ''.join(result)
+
+
+def legacy_engine(templater: "DataformTemplater", sql: str) -> SliceResult:
+    """Slice ``sql`` the way the templater originally did.
+
+    The templated string comes from whole-file replacement passes, and the
+    slices from a loop which searches the remainder of the file for every
+    kind of construct at each step. Constructs are found and resolved by
+    the original helpers vendored in ``_Baseline``, which know nothing of
+    the ref cache, the project index or placeholders; only the templater's
+    ``project_id`` and ``dataset_id`` are used. Where a construct is
+    replaced differently as a whole than by the global passes, the string
+    does not agree with the slices; ``compare_engines`` reports that
+    separately. ``preserve_width`` is not supported, and JS expressions
+    always become the bare ``js_expression`` placeholder.
+    """
+    baseline = _Baseline(templater.project_id, templater.dataset_id)
+    templater.malformed_fallbacks = 0
+    replaced_sql = baseline.replace_blocks(sql)
+    replaced_sql = baseline.replace_self_with_bq_table(replaced_sql)
+    replaced_sql = baseline.replace_ref_with_bq_table(replaced_sql)
+    replaced_sql = baseline.replace_incremental_condition(replaced_sql)
+    replaced_sql = baseline.replace_js_expressions(replaced_sql)
+
+    block_patterns = [
+        CONFIG_BLOCK_PATTERN,
+        PRE_OPERATION_BLOCK_PATTERN,
+        POST_OPERATION_BLOCK_PATTERN,
+        JS_BLOCK_PATTERN,
+    ]
+    patterns = block_patterns + [
+        REF_PATTERN,
+        SELF_PATTERN,
+        INCREMENTAL_CONDITION_PATTERN,
+        JS_EXPRESSION_PATTERN_IN_SQL,
+    ]
+
+    raw_slices = []
+    templated_slices = []
+    current_idx = 0
+    templated_idx = 0
+    block_idx = 0
+    malformed_starts = set()
+
+    while current_idx < len(sql):
+        next_match = None
+        next_match_start = None
+        next_match_end = None
+
+        for pattern in patterns:
+            if pattern in block_patterns:
+                # Find the block start, then its matching }
+                match = re.search(
+                    r'(config|pre_operations|post_operations|js)\s*\{', sql[current_idx:]
+                )
+                if not match:
+                    continue
+                match_start = current_idx + match.start()
+                end = baseline.find_block_end(sql, current_idx + match.end() - 1)
+            elif pattern == INCREMENTAL_CONDITION_PATTERN:
+                match = re.search(r'\$\{\s*when\(', sql[current_idx:])
+                if not match:
+                    continue
+                match_start = current_idx + match.start()
+                end = baseline.find_expression_end(sql, sql.find('{', match_start))
+            elif pattern == JS_EXPRESSION_PATTERN_IN_SQL:
+                match = re.search(r'\$\{', sql[current_idx:])
+                if not match:
+                    continue
+                match_start = current_idx + match.start()
+                end = baseline.find_expression_end(sql, current_idx + match.end() - 1)
+            else:
+                match = re.search(pattern, sql[current_idx:])
+                if not match:
+                    continue
+                match_start = current_idx + match.start()
+                end = current_idx + match.end()
+            if end == -1:
+                malformed_starts.add(match_start)
+                continue  # unterminated, skip
+
+            if not next_match or match_start < next_match_start:
+                next_match = match
+                next_match_start = match_start
+                next_match_end = end
+
+        if not next_match:
+            raw_slices.append(RawFileSlice(
+                raw=sql[current_idx:],
+                slice_type='literal',
+                source_idx=current_idx,
+                block_idx=block_idx
+            ))
+            templated_slices.append(TemplatedFileSlice(
+                slice_type='literal',
+                source_slice=slice(current_idx, len(sql)),
+                templated_slice=slice(templated_idx, templated_idx + len(sql) - current_idx)
+            ))
+            break
+
+        if next_match_start > current_idx:
+            raw_slices.append(RawFileSlice(
+                raw=sql[current_idx:next_match_start],
+                slice_type='literal',
+                source_idx=current_idx,
+                block_idx=block_idx
+            ))
+            templated_slices.append(TemplatedFileSlice(
+                slice_type='literal',
+                source_slice=slice(current_idx, next_match_start),
+                templated_slice=slice(templated_idx, templated_idx + (next_match_start - current_idx))
+            ))
+            templated_idx += (next_match_start - current_idx)
+            block_idx += 1
+
+        match_raw = sql[next_match_start:next_match_end]
+        if re.match(r'\$\{\s*ref\(', match_raw):
+            replacement = baseline.replace_ref_with_bq_table(match_raw)
+        elif re.match(r'\$\{\s*self\(', match_raw):
+            replacement = baseline.replace_self_with_bq_table(match_raw)
+        elif re.match(r'\$\{\s*when\(', match_raw):
+            pre = baseline.replace_ref_with_bq_table(
+                baseline.replace_self_with_bq_table(match_raw)
+            )
+            replacement = baseline.replace_incremental_condition(pre)
+        elif match_raw.startswith('${') and "when(" not in match_raw and 'ref(' not in match_raw and 'self(' not in match_raw:
+            replacement = baseline.replace_js_expressions(match_raw)
+        else:
+            # Blocks (config, pre_operations, post_operations, js)
+            replacement = ''
+
+        raw_slices.append(RawFileSlice(
+            raw=match_raw,
+            slice_type='templated',
+            source_idx=next_match_start,
+            block_idx=block_idx
+        ))
+        templated_slices.append(TemplatedFileSlice(
+            slice_type='templated',
+            source_slice=slice(next_match_start, next_match_end),
+            templated_slice=slice(templated_idx, templated_idx + len(replacement))
+        ))
+        templated_idx += len(replacement)
+        current_idx = next_match_end
+        block_idx += 1
+
+    templater.malformed_fallbacks = len(malformed_starts)
+    return replaced_sql, raw_slices, templated_slices
+
+
+ENGINES: Dict[str, Engine] = {
+    "scan": scan_engine,
+    "legacy": legacy_engine,
+}
+
+
+def is_self_consistent(in_str: str, result: SliceResult) -> bool:
+    """Whether a templated string is exactly what its slices describe.
+
+    Literal slices must copy their source, and consecutive templated slices
+    must tile the whole templated string.
+    """
+    templated_sql, _, templated_slices = result
+    position = 0
+    for templated_slice in templated_slices:
+        if templated_slice.templated_slice.start != position:
+            return False
+        position = templated_slice.templated_slice.stop
+        if templated_slice.slice_type == 'literal' and (
+            templated_sql[templated_slice.templated_slice]
+            != in_str[templated_slice.source_slice]
+        ):
+            return False
+    return position == len(templated_sql)
+
+
+@dataclass
+class EngineComparison:
+    """Outcome of running two engines on the same input."""
+
+    baseline: str
+    candidate: str
+    slices_match: bool
+    templated_match: bool
+    baseline_consistent: bool
+    candidate_consistent: bool
+    baseline_seconds: float
+    candidate_seconds: float
+
+    @property
+    def equivalent(self) -> bool:
+        """Whether the engines produced the same slices and templated string."""
+        return self.slices_match and self.templated_match
+
+    @property
+    def tolerated(self) -> bool:
+        """Whether the engines differ only in a string the baseline got wrong.
+
+        The slices match, but the baseline's templated string disagrees with
+        its own slices (its global passes replace something its slicer left
+        alone) while the candidate's agrees with them. The candidate's string
+        is the one sqlfluff can map, so this is not a mismatch, but it is
+        counted separately from equivalent files rather than passed as one.
+        """
+        return (
+            self.slices_match
+            and not self.templated_match
+            and not self.baseline_consistent
+            and self.candidate_consistent
+        )
+
+    @property
+    def speedup(self) -> float:
+        """How many times faster the candidate was than the baseline."""
+        return self.baseline_seconds / max(self.candidate_seconds, 1e-9)
+
+
+def _timed_run(engine: Engine, templater: "DataformTemplater", sql: str) -> Tuple[SliceResult, float]:
+    start = time.perf_counter()
+    result = engine(templater, sql)
+    return result, time.perf_counter() - start
+
+
+def compare_engines(
+    templater: "DataformTemplater",
+    sql: str,
+    baseline: str = "legacy",
+    candidate: str = DEFAULT_ENGINE,
+) -> EngineComparison:
+    """Run engines ``baseline`` and ``candidate`` on ``sql`` and compare them.
+
+    Both run with bare ``js_expression`` placeholders and with operations
+    blocks removed, which is all the legacy engine knows; placeholders do not
+    change where slices fall.
+    """
+    context_placeholders = templater.context_placeholders
+    lint_operations = templater.lint_operations
+    templater.context_placeholders = False
+    templater.lint_operations = False
+    try:
+        expected, baseline_seconds = _timed_run(ENGINES[baseline], templater, sql)
+        actual, candidate_seconds = _timed_run(ENGINES[candidate], templater, sql)
+    finally:
+        templater.context_placeholders = context_placeholders
+        templater.lint_operations = lint_operations
+    return EngineComparison(
+        baseline=baseline,
+        candidate=candidate,
+        slices_match=expected[1:] == actual[1:],
+        templated_match=expected[0] == actual[0],
+        baseline_consistent=is_self_consistent(sql, expected),
+        candidate_consistent=is_self_consistent(sql, actual),
+        baseline_seconds=baseline_seconds,
+        candidate_seconds=candidate_seconds,
+    )
+
+
+def main(argv=None) -> int:
+    """Compare two engines on every ``.sqlx`` file under the given paths."""
+    parser = argparse.ArgumentParser(
+        prog="python -m sqlfluff_templater_dataform.engines",
+        description="Check that two dataform templater engines slice files identically.",
+    )
+    parser.add_argument("paths", nargs="+", help="SQLX files or directories")
+    parser.add_argument("--baseline", default="legacy", choices=sorted(ENGINES))
+    parser.add_argument("--candidate", default=DEFAULT_ENGINE, choices=sorted(ENGINES))
+    parser.add_argument("--project-id", default="project")
+    parser.add_argument("--dataset-id", default="dataset")
+    args = parser.parse_args(argv)
+
+    from sqlfluff_templater_dataform.compile import iter_sqlx_files
+    from sqlfluff_templater_dataform.templater import DataformTemplater
+
+    templater = DataformTemplater()
+    templater.project_id = args.project_id
+    templater.dataset_id = args.dataset_id
+    files = list(iter_sqlx_files(args.paths))
+    mismatches = tolerated = 0
+    baseline_seconds = candidate_seconds = 0.0
+    for fname in files:
+        with open(fname, encoding="utf-8") as f:
+            comparison = compare_engines(templater, f.read(), args.baseline, args.candidate)
+        baseline_seconds += comparison.baseline_seconds
+        candidate_seconds += comparison.candidate_seconds
+        if comparison.tolerated:
+            tolerated += 1
+            print(f"TOLERATED {fname}: {args.baseline} templated string disagrees with its slices")
+        elif not comparison.equivalent:
+            mismatches += 1
+            print(f"MISMATCH {fname}: slices_match={comparison.slices_match} "
+                  f"templated_match={comparison.templated_match}")
+    print(
+        f"{len(files)} files, {mismatches} mismatches, {tolerated} tolerated. "
+        f"{args.baseline} {baseline_seconds * 1e3:.1f}ms, "
+        f"{args.candidate} {candidate_seconds * 1e3:.1f}ms "
+        f"({baseline_seconds / max(candidate_seconds, 1e-9):.1f}x)"
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""Project index of model locations, shared by lint workers through mmap.
+
+Dataform resolves ``${ref("name")}`` to the dataset and project the
+referenced model is published to, which its own ``config`` block may set
+with ``schema`` and ``database`` (and a ``name`` overriding the file name).
+When ``project_index_path`` is set in the ``[sqlfluff:templater:dataform]``
+section, ``sequence_files`` reads those settings from every file of the run
+once, in the process that starts it, and writes them to a compact read-only
+file. Every process, including each ``--processes`` worker, maps that file
+and binary-searches it in place, so the index is neither rebuilt nor copied
+per worker and memory stays flat as the number of processes grows.
+
+The file is a sorted string table::
+
+    b"DFX1" | count: u32 | offsets: (2 * count + 1) x u32 | strings
+
+String ``2 * i`` is the ``i``-th model name and string ``2 * i + 1`` its
+location, ``"<database>\\x00<schema>"`` with an empty part for a setting left
+to the project default. Offsets are absolute and little-endian, and string
+``k`` spans ``offsets[k]:offsets[k + 1]``. Only models which override their
+schema or database are stored. A name declared with conflicting locations
+is left out, so refs to it keep the defaults.
+"""
+import mmap
+import os
+import re
+import struct
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlfluff_templater_dataform.arguments import split_arguments, unquote
+
+
+MAGIC = b"DFX1"
+_HEADER = struct.Struct("<4sI")
+_OFFSET = struct.Struct("<I")
+_OFFSET_PAIR = struct.Struct("<II")
+
+_CONFIG_START = re.compile(r'config\s*\{')
+_BRACE = re.compile(r'[{}]')
+_IDENTIFIER_KEY = re.compile(r'["\']?(\w+)["\']?$')
+
+Location = Tuple[str, str]
+
+
+def read_model_location(sql: str, fname: str) -> Optional[Tuple[str, Location]]:
+    """Read the name and ``(database, schema)`` a SQLX model is published to.
+
+    Only the top-level ``name``, ``schema`` and ``database`` keys of the
+    ``config`` block are read, and only string literal values are used.
+
+    Returns:
+        ``(name, (database, schema))``, or None when the model leaves both
+        its schema and database to the project defaults.
+    """
+    match = _CONFIG_START.search(sql)
+    if not match:
+        return None
+    depth = 0
+    for brace in _BRACE.finditer(sql, match.end() - 1):
+        depth += 1 if brace.group() == '{' else -1
+        if depth == 0:
+            break
+    else:
+        return None  # Unterminated config block.
+    body = sql[match.end():brace.start()]
+    settings = {}
+    for start, stop in split_arguments(body):
+        key, sep, value = body[start:stop].partition(':')
+        key_match = _IDENTIFIER_KEY.match(key.strip())
+        value = value.strip()
+        if sep and key_match and len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+            settings[key_match.group(1)] = unquote(value) if value[0] != '`' else value[1:-1]
+    database = settings.get("database", "")
+    schema = settings.get("schema", "")
+    if not database and not schema:
+        return None
+    name = settings.get("name") or os.path.splitext(os.path.basename(fname))[0]
+    return name, (database, schema)
+
+
+def build_index(entries: Iterable[Tuple[str, Location]]) -> bytes:
+    """Serialize ``(name, (database, schema))`` entries to the index format."""
+    locations: Dict[str, Optional[Location]] = {}
+    for name, location in entries:
+        if locations.setdefault(name, location) != location:
+            locations[name] = None  # Declared twice, differently.
+    strings = []
+    for name, location in sorted(
+        (name.encode(), location) for name, location in locations.items() if location
+    ):
+        strings.append(name)
+        strings.append("\x00".join(location).encode())
+    count = len(strings) // 2
+    data_start = _HEADER.size + _OFFSET.size * (len(strings) + 1)
+    offsets = [data_start]
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+    return b"".join([
+        _HEADER.pack(MAGIC, count),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        *strings,
+    ])
+
+
+def write_index(path: str, content: bytes) -> None:
+    """Atomically replace the index at ``path``."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class ProjectIndex:
+    """Read-only view of an index file, mapped into memory.
+
+    Args:
+        path: Index written by ``write_index``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            # An empty file cannot be mapped, and is not a valid index.
+            if stat.st_size < _HEADER.size:
+                raise ValueError(f"{path!r} is not a dataform project index")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path!r} is not a dataform project index")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _string(self, k: int) -> bytes:
+        start, end = _OFFSET_PAIR.unpack_from(self._map, _HEADER.size + _OFFSET.size * k)
+        return self._map[start:end]
+
+    def get(self, name: str) -> Optional[Location]:
+        """Return the ``(database, schema)`` of model ``name``, if indexed."""
+        target = name.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = self._string(2 * mid)
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                database, _, schema = self._string(2 * mid + 1).decode().partition("\x00")
+                return database, schema
+        return None
+
+    def close(self) -> None:
+        """Unmap the index file."""
+        self._map.close()
+
+
+# Mapped indexes by path, least recently used first. One run maps one per
+# Dataform project it lints (see ``sqlfluff_templater_dataform.projects``).
+_indexes: "OrderedDict[str, ProjectIndex]" = OrderedDict()
+MAX_MAPPED_INDEXES = 32
+
+
+def get_project_index(path: str) -> Optional[ProjectIndex]:
+    """Return the mapped index at ``path``, remapping it if it was rewritten.
+
+    Returns:
+        None if there is no valid index at ``path``.
+    """
+    index = _indexes.get(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if index is not None and index.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+        _indexes.move_to_end(path)
+        return index
+    try:
+        new_index = ProjectIndex(path)
+    except (OSError, ValueError):
+        return None
+    if index is not None:
+        index.close()
+    _indexes[path] = new_index
+    _indexes.move_to_end(path)
+    if len(_indexes) > MAX_MAPPED_INDEXES:
+        _indexes.popitem(last=False)[1].close()
+    return new_index
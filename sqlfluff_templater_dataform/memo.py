@@ -0,0 +1,123 @@
+"""Run-scoped memo of Dataform constructs repeated across files.
+
+Generated projects repeat the same long ``js {}`` blocks, operations blocks
+and ``${when()}`` expressions in hundreds of files. The memo keeps, for the
+length of a run:
+
+* extents: the raw text of each block or expression whose end was found by
+  brace counting. Brace counting only depends on the text from the opener
+  on, so where a file has the same text at a construct's start, the
+  construct ends at the same offset, and one ``str.startswith`` replaces the
+  brace-by-brace scan. Candidates are looked up by the first
+  ``EXTENT_KEY_SIZE`` characters, and only constructs at least that long
+  are kept.
+* replacements: the templated text of a ``${when()}`` or JS expression,
+  keyed by its raw text and whatever else the replacement depends on.
+
+Both are LRU maps, bounded in entries and, as a construct can be as long
+as the file, in the characters they hold (``MAX_MEMO_CHARS``); a construct
+longer than that bound is not kept. They are emptied when a run starts.
+Lookups of replacements, and of extents long enough to be kept, count
+towards the hit rate; an extent is counted as a miss when it is added.
+"""
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+EXTENT_KEY_SIZE = 64
+MAX_MEMO_CHARS = 4 * 1024 * 1024
+
+
+class ConstructMemo:
+    """Bounded memo of construct extents and replacements.
+
+    Args:
+        maxsize: Number of extents, and of replacements, kept.
+        max_chars: Characters of raw and templated text kept, across both.
+    """
+
+    def __init__(self, maxsize: int = 1024, max_chars: int = MAX_MEMO_CHARS):
+        self.maxsize = maxsize
+        self.max_chars = max_chars
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        # Values are stored with the characters they account for.
+        self._extents: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._replacements: "OrderedDict[Hashable, Tuple[str, int]]" = OrderedDict()
+
+    def start_run(self) -> None:
+        """Forget every construct, keeping the hit and miss counts."""
+        self._extents.clear()
+        self._replacements.clear()
+        self.chars = 0
+
+    def extent(self, sql: str, start: int) -> Optional[int]:
+        """Return the end of a known construct at ``sql[start:]``, if any."""
+        key = sql[start:start + EXTENT_KEY_SIZE]
+        if len(key) < EXTENT_KEY_SIZE:
+            return None
+        entry = self._extents.get(key)
+        if entry is not None and sql.startswith(entry[0], start):
+            self.hits += 1
+            self._extents.move_to_end(key)
+            return start + entry[1]
+        return None
+
+    def add_extent(self, sql: str, start: int, end: int) -> None:
+        """Remember that the construct at ``sql[start:]`` ends at ``end``.
+
+        Called after a failed lookup, so the lookup is counted as a miss
+        here, and only for constructs long enough to be kept.
+        """
+        if end - start < EXTENT_KEY_SIZE:
+            return
+        self.misses += 1
+        self._put(self._extents, sql[start:start + EXTENT_KEY_SIZE], sql[start:end], end - start)
+
+    def replacement(self, key: Hashable) -> Optional[str]:
+        """Return the replacement stored under ``key``, if any."""
+        entry = self._replacements.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._replacements.move_to_end(key)
+        return entry[0]
+
+    def add_replacement(self, key: Hashable, replacement: str) -> None:
+        """Store the replacement of the construct described by ``key``."""
+        parts = key if isinstance(key, tuple) else (key,)
+        size = len(replacement) + sum(len(part) for part in parts if isinstance(part, str))
+        self._put(self._replacements, key, replacement, size)
+
+    def _put(self, entries: OrderedDict, key: Hashable, value: str, size: int) -> None:
+        if size > self.max_chars:
+            return
+        previous = entries.pop(key, None)
+        if previous is not None:
+            self.chars -= previous[1]
+        entries[key] = (value, size)
+        self.chars += size
+        if len(entries) > self.maxsize:
+            self.chars -= entries.popitem(last=False)[1][1]
+        while self.chars > self.max_chars:
+            # Evict from the map added to, then from the other once only
+            # the new entry is left.
+            others = self._replacements if entries is self._extents else self._extents
+            victims = entries if len(entries) > 1 else others
+            self.chars -= victims.popitem(last=False)[1][1]
+
+    def stats(self) -> Dict[str, float]:
+        """Return the hit and miss counts, the entries kept and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._extents) + len(self._replacements),
+            "chars": self.chars,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+construct_memo = ConstructMemo()
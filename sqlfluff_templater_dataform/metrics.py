@@ -0,0 +1,231 @@
+"""Prometheus textfile metrics for the dataform templater.
+
+When ``metrics_textfile_path`` is set in the ``[sqlfluff:templater:dataform]``
+section the templater counts its work and, at the end of the run, writes the
+totals in the Prometheus text exposition format so that node-exporter's
+textfile collector can scrape them.
+
+As with the timing report, parallel lint workers cannot hand their counters
+back in memory, and sqlfluff terminates them without running their exit
+hooks. After every file, each process appends what its counters gained
+since the previous file, as one JSON line, to
+``<metrics_textfile_path>.shards/<pid>.jsonl``. The file is kept open, so
+this is a single ``os.write``. The process which sequenced the files sums
+the lines of every shard and replaces the textfile atomically when it
+exits.
+"""
+import atexit
+import bisect
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlfluff.core.plugin.host import is_main_process
+
+from sqlfluff_templater_dataform.report import atomic_write
+
+
+METRIC_PREFIX = "sqlfluff_dataform_templater"
+SHARD_SUFFIX = ".jsonl"
+
+# name -> help text. Counters with a label are keyed "name{label=value}".
+COUNTERS = {
+    "files_templated_total": "Files templated by the dataform templater.",
+    "fast_path_hits_total": "Files templated without any Dataform construct to resolve.",
+    "cache_hits_total": "Templater cache hits, by cache.",
+    "cache_misses_total": "Templater cache misses, by cache.",
+    "placeholder_substitutions_total": "JavaScript expressions replaced by a placeholder.",
+    "skipped_files_total": "Files skipped by the templater.",
+    "malformed_block_fallbacks_total": "Unterminated blocks or expressions left as literal SQL.",
+    "circuit_breaker_trips_total": "Runs stopped after sequential_fail_limit consecutive failures.",
+}
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+class TemplaterMetrics:
+    """Counters and a latency histogram for one templater run.
+
+    Args:
+        path: Destination textfile, which should end in ``.prom`` to be
+            picked up by node-exporter.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.shard_dir = f"{path}.shards"
+        self.counters: Dict[str, float] = {}
+        self.latency_buckets: List[int] = [0] * len(LATENCY_BUCKETS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self._coordinating = False
+        self._lock = threading.Lock()
+        # The shard kept open, with the pid it was opened by, and the
+        # snapshot written to it so far.
+        self._shard: Optional[Tuple[int, int]] = None
+        self._written = self._empty_snapshot()
+
+    def inc(self, name: str, amount: float = 1, cache: Optional[str] = None) -> None:
+        """Increment counter ``name``, optionally labelled with a cache name."""
+        if cache is not None:
+            name = f'{name}{{cache="{cache}"}}'
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_cache_stats(self, cache: str, hits: int, misses: int) -> None:
+        """Record the cumulative hit and miss counts of a process-wide cache."""
+        self.counters[f'cache_hits_total{{cache="{cache}"}}'] = hits
+        self.counters[f'cache_misses_total{{cache="{cache}"}}'] = misses
+
+    def observe_latency(self, seconds: float) -> None:
+        """Add one templating duration to the latency histogram."""
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        if index < len(LATENCY_BUCKETS):
+            self.latency_buckets[index] += 1
+        self.latency_count += 1
+        self.latency_sum += seconds
+
+    def start_run(self) -> None:
+        """Make this process responsible for writing the textfile at exit."""
+        if self._coordinating:
+            return
+        self._coordinating = True
+        self._close_shard()
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        atexit.register(self.write)
+
+    @staticmethod
+    def _empty_snapshot() -> dict:
+        return {
+            "counters": {},
+            "latency_buckets": [0] * len(LATENCY_BUCKETS),
+            "latency_count": 0,
+            "latency_sum": 0.0,
+        }
+
+    def _snapshot(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "latency_buckets": list(self.latency_buckets),
+            "latency_count": self.latency_count,
+            "latency_sum": self.latency_sum,
+        }
+
+    def flush(self) -> None:
+        """Append what this process's counters gained to its shard."""
+        if not self._coordinating and is_main_process.get():
+            # Templated without sequence_files (e.g. the Python API).
+            self.start_run()
+        self._append()
+
+    def _append(self) -> None:
+        with self._lock:
+            snapshot = self._snapshot()
+            written = self._written
+            delta = {
+                "counters": {
+                    name: value - written["counters"].get(name, 0)
+                    for name, value in snapshot["counters"].items()
+                    if value != written["counters"].get(name, 0)
+                },
+                "latency_buckets": [
+                    now - before
+                    for now, before in zip(snapshot["latency_buckets"], written["latency_buckets"])
+                ],
+                "latency_count": snapshot["latency_count"] - written["latency_count"],
+                "latency_sum": snapshot["latency_sum"] - written["latency_sum"],
+            }
+            os.write(self._shard_fd(), (json.dumps(delta) + "\n").encode("utf-8"))
+            self._written = snapshot
+
+    def _shard_fd(self) -> int:
+        pid = os.getpid()
+        if self._shard is None or self._shard[0] != pid:
+            # A forked worker opens its own shard rather than the parent's.
+            os.makedirs(self.shard_dir, exist_ok=True)
+            path = os.path.join(self.shard_dir, f"{pid}{SHARD_SUFFIX}")
+            self._shard = (pid, os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644))
+        return self._shard[1]
+
+    def _close_shard(self) -> None:
+        if self._shard is not None and self._shard[0] == os.getpid():
+            os.close(self._shard[1])
+        self._shard = None
+
+    def collect(self) -> dict:
+        """Sum the snapshots of every process."""
+        total = self._empty_snapshot()
+        if not os.path.isdir(self.shard_dir):
+            return total
+        for shard in os.listdir(self.shard_dir):
+            if not shard.endswith(SHARD_SUFFIX):
+                continue
+            with open(os.path.join(self.shard_dir, shard), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            for line in lines:
+                try:
+                    snapshot = json.loads(line)
+                except ValueError:
+                    # A line cut short by a worker killed while writing it.
+                    continue
+                self._add(total, snapshot)
+        return total
+
+    @staticmethod
+    def _add(total: dict, snapshot: dict) -> None:
+        for name, value in snapshot["counters"].items():
+            total["counters"][name] = total["counters"].get(name, 0) + value
+        for i, value in enumerate(snapshot["latency_buckets"]):
+            total["latency_buckets"][i] += value
+        total["latency_count"] += snapshot["latency_count"]
+        total["latency_sum"] += snapshot["latency_sum"]
+
+    def render(self, total: dict) -> str:
+        """Render summed metrics in the Prometheus text exposition format."""
+        lines = []
+        samples: Dict[str, List[Tuple[str, float]]] = {}
+        for sample, value in total["counters"].items():
+            samples.setdefault(sample.split("{", 1)[0], []).append((sample, value))
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for sample, value in sorted(samples.get(name, [(name, 0)])):
+                lines.append(f"{METRIC_PREFIX}_{sample} {value:g}")
+
+        name = f"{METRIC_PREFIX}_latency_seconds"
+        lines.append(f"# HELP {name} Wall time spent templating one file.")
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, total["latency_buckets"]):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {total["latency_count"]}')
+        lines.append(f"{name}_sum {total['latency_sum']:.6f}")
+        lines.append(f"{name}_count {total['latency_count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Merge the shards and atomically replace the textfile."""
+        self._append()
+        atomic_write(self.path, self.render(self.collect()))
+        self._close_shard()
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+        self._coordinating = False
+        # The next run's shard starts from nothing, and so counts this
+        # process's totals again, as the textfile did.
+        self._written = self._empty_snapshot()
+
+
+_metrics: Dict[str, TemplaterMetrics] = {}
+
+
+def get_metrics(path: str) -> TemplaterMetrics:
+    """Return the process-wide metrics for ``path``, creating them on first use."""
+    metrics = _metrics.get(path)
+    if metrics is None:
+        metrics = _metrics[path] = TemplaterMetrics(path)
+    return metrics
@@ -0,0 +1,64 @@
+"""cProfile dumps of files which are slow or large to template.
+
+Phase timings show that a file is slow, not where the time goes. With
+``outlier_profile_dir`` set in the ``[sqlfluff:templater:dataform]`` section,
+a file whose templating took over ``outlier_profile_ms`` milliseconds, or
+which is over ``outlier_profile_bytes`` characters, is templated a second
+time under ``cProfile`` and the stats are written to
+``<outlier_profile_dir>/<source path>.pstats``, with path separators turned
+into ``__``. Files under the thresholds are never profiled, so the cost is
+one extra templating per outlier.
+
+The dump is of that second pass, not of the one timed. It runs without the
+construct memo and with an empty ref cache, so it shows the full cost of
+the file as if it were the first of the run, and its lookups are left out
+of the cache hit counts.
+
+At most ``outlier_profile_limit`` dumps are kept in the directory. The
+limit is checked against the files already there, so it holds across the
+worker processes of a run and across runs; clear the directory to collect
+new profiles.
+"""
+import cProfile
+import logging
+import os
+import re
+from typing import Callable, Optional
+
+# Instantiate the templater logger
+templater_logger = logging.getLogger("sqlfluff.templater")
+
+PROFILE_SUFFIX = ".pstats"
+_UNSAFE_CHARS = re.compile(r'[^\w.-]')
+
+
+def profile_path(directory: str, fname: str) -> str:
+    """Return where the profile of ``fname`` is written in ``directory``."""
+    path = os.path.relpath(os.path.abspath(fname))
+    if path.startswith(os.pardir):
+        path = os.path.abspath(fname).lstrip(os.sep)
+    name = _UNSAFE_CHARS.sub('_', path.replace(os.sep, '__'))
+    return os.path.join(directory, name + PROFILE_SUFFIX)
+
+
+def is_outlier(elapsed_ms: float, size: int, min_ms: float, min_size: int) -> bool:
+    """Return whether a file crosses either threshold; a zero one is off."""
+    return bool((min_ms and elapsed_ms >= min_ms) or (min_size and size >= min_size))
+
+
+def dump_profile(directory: str, fname: str, limit: int, func: Callable, *args) -> Optional[str]:
+    """Call ``func`` under cProfile and write the stats for ``fname``.
+
+    Returns:
+        The path written, or None if ``limit`` dumps are already in
+        ``directory``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = profile_path(directory, fname)
+    existing = sum(1 for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX))
+    if existing >= limit and not os.path.exists(path):
+        return None
+    profiler = cProfile.Profile()
+    profiler.runcall(func, *args)
+    profiler.dump_stats(path)
+    return path
@@ -0,0 +1,70 @@
+"""Placeholders for JavaScript expressions, chosen from the surrounding SQL.
+
+The value of a ``${...}`` expression is only known to Dataform, so the
+templater stands in a placeholder for it. A bare identifier is valid almost
+anywhere, but not everywhere: ``INTERVAL ${n} ${unit}`` or ``TABLESAMPLE
+SYSTEM (${pct} PERCENT)`` become unparsable, and sqlfluff's recovery from
+unparsable sections is slow. ``placeholder_for`` looks at the text just
+before and after the expression and picks a placeholder of the matching
+kind: a table name, a number, a date part, a string or a column.
+
+At most ``_LOOKBEHIND`` characters before the expression are examined, so
+the cost per expression is bounded. Whether the expression is inside a
+string, quoted name or comment is judged from its own line, but the keyword
+before it may be on an earlier line within that window, as in
+``FROM\n  ${t}``.
+"""
+import re
+
+
+IDENTIFIER = "js_expression"
+TABLE = "`js_expression`"
+NUMBER = "0"
+DATE_PART = "DAY"
+STRING = "'js_expression'"
+
+_LOOKBEHIND = 200
+
+# Quoted strings, identifiers and comments closed on the line, then comment
+# starts and lone quotes, which run past the expression.
+_QUOTING_REGEX = re.compile(
+    r"'(?:\\.|[^'\\\n])*'|\"(?:\\.|[^\"\\\n])*\"|`[^`\n]*`|/\*.*?\*/|--|#|/\*|['\"`]"
+)
+_OPEN_QUOTING = frozenset(("--", "#", "/*", "'", '"', "`"))
+# Words, other ${...} expressions and single punctuation characters.
+_TOKEN_REGEX = re.compile(r"\$\{[^{}]*\}|\w+|[^\s\w]")
+
+_TABLE_KEYWORDS = frozenset(("FROM", "JOIN", "INTO", "UPDATE", "MERGE", "TABLE", "VIEW"))
+_NUMBER_KEYWORDS = frozenset(("LIMIT", "OFFSET", "INTERVAL"))
+_STRING_OPERATORS = frozenset(("=", "<", ">", "LIKE"))
+
+
+def _is_quoted(line: str) -> bool:
+    """Whether the end of ``line`` is inside a string, quoted name or comment."""
+    return any(token in _OPEN_QUOTING for token in _QUOTING_REGEX.findall(line))
+
+
+def placeholder_for(sql: str, start: int, end: int) -> str:
+    """Pick the placeholder for the JS expression ``sql[start:end]``."""
+    window_start = max(0, start - _LOOKBEHIND)
+    before = sql[max(sql.rfind('\n', window_start, start) + 1, window_start):start]
+    if _is_quoted(before):
+        return IDENTIFIER
+    following = sql[end:end + 1]
+    if (before[-1:].isalnum() or before[-1:] in ('_', '.')
+            or following.isalnum() or following in ('_', '`', '$')):
+        # Part of a longer name, such as tbl_${suffix} or ${prefix}_tbl.
+        return IDENTIFIER
+
+    tokens = _TOKEN_REGEX.findall(sql, window_start, start)[-2:]
+    previous = tokens[-1].upper() if tokens else ""
+    before_previous = tokens[0].upper() if len(tokens) == 2 else ""
+    if previous in _TABLE_KEYWORDS:
+        return TABLE
+    if previous in _NUMBER_KEYWORDS or (previous == "(" and before_previous == "SYSTEM"):
+        return NUMBER
+    if before_previous == "INTERVAL" or (previous == "(" and before_previous == "EXTRACT"):
+        return DATE_PART
+    if previous in _STRING_OPERATORS and following != ".":
+        return STRING
+    return IDENTIFIER
@@ -0,0 +1,89 @@
+"""Phase timing instrumentation for the dataform templater.
+
+Timing is opt-in through the ``profile_phases`` setting in the
+``[sqlfluff:templater:dataform]`` section. When it is disabled the templater
+holds no timer at all and the phase hooks reduce to a ``None`` check.
+"""
+import atexit
+import logging
+from typing import Dict, Optional
+
+
+# Instantiate the templater logger
+templater_logger = logging.getLogger("sqlfluff.templater")
+
+
+class PhaseTimer:
+    """Accumulate wall time spent in each templating phase.
+
+    Durations are measured with ``time.perf_counter_ns`` and kept in
+    nanoseconds. Each phase is recorded both against the file currently being
+    templated and against the totals for the whole run, so a slow file can be
+    reported on its own while the run summary shows where time goes overall.
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+        self.files = 0
+        self._current: Dict[str, int] = {}
+
+    def add(self, phase: str, elapsed_ns: int) -> None:
+        """Record ``elapsed_ns`` nanoseconds against ``phase``."""
+        self._current[phase] = self._current.get(phase, 0) + elapsed_ns
+        self.totals[phase] = self.totals.get(phase, 0) + elapsed_ns
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def current_total(self) -> int:
+        """Return the nanoseconds recorded so far against the current file."""
+        return sum(self._current.values())
+
+    def finish_file(self, fname: str) -> Dict[str, int]:
+        """Close the timings of the current file and log them at debug level.
+
+        Returns:
+            The per-phase timings of the file that was just finished.
+        """
+        timings, self._current = self._current, {}
+        self.files += 1
+        templater_logger.debug(
+            "Dataform templater phases for %s: %s",
+            fname,
+            ", ".join(f"{phase}={ns / 1e6:.3f}ms" for phase, ns in timings.items()),
+        )
+        return timings
+
+    def summary(self) -> str:
+        """Render the aggregated timings as a human readable table."""
+        lines = [f"Dataform templater phase summary ({self.files} files):"]
+        grand_total = sum(self.totals.values()) or 1
+        for phase, total in sorted(self.totals.items(), key=lambda item: -item[1]):
+            lines.append(
+                f"  {phase:<16} {total / 1e6:>10.3f}ms "
+                f"{100 * total / grand_total:>5.1f}% "
+                f"({self.calls[phase]} calls)"
+            )
+        return "\n".join(lines)
+
+    def dump(self) -> None:
+        """Log the run summary, if anything was timed."""
+        if self.totals:
+            templater_logger.debug(self.summary())
+
+
+_phase_timer: Optional[PhaseTimer] = None
+
+
+def get_phase_timer() -> PhaseTimer:
+    """Return the process-wide phase timer, creating it on first use.
+
+    sqlfluff builds a fresh templater for each file in parallel workers, so
+    the timer lives at module level to aggregate over the whole run. The
+    summary is dumped when the process exits.
+    """
+    global _phase_timer
+    if _phase_timer is None:
+        _phase_timer = PhaseTimer()
+        atexit.register(_phase_timer.dump)
+    return _phase_timer
+
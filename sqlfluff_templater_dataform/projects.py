@@ -0,0 +1,169 @@
+"""Discovery of the Dataform project each file belongs to.
+
+A repository can hold several Dataform projects, each in a directory with its
+own ``workflow_settings.yaml`` (or, for Dataform 2, ``dataform.json``) which
+sets the default project and dataset of its models. With ``discover_projects``
+set in the ``[sqlfluff:templater:dataform]`` section, every file is templated
+with the defaults of the nearest such directory above it, falling back to the
+``project_id`` / ``dataset_id`` settings for anything the project leaves out
+and for files outside any project.
+
+Finding a root walks up from the file's directory. Every directory visited
+is remembered for the rest of the run, so each is looked at once however
+many files it holds. Each project keeps its own ``${ref()}`` resolution cache
+(and, with ``project_index_path``, its own index), so files of different
+projects do not evict each other's entries. Only the most recently used
+``MAX_PROJECTS`` projects are kept.
+"""
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from sqlfluff_templater_dataform.refs import RefResolutionCache
+
+
+WORKFLOW_SETTINGS = "workflow_settings.yaml"
+LEGACY_SETTINGS = "dataform.json"
+MAX_PROJECTS = 32
+# A top-level ``key: value`` line, without any trailing comment.
+_YAML_SCALAR_REGEX = re.compile(r"^(\w+)[ \t]*:[ \t]*([^#\n]*?)[ \t]*(?:#.*)?$", re.MULTILINE)
+
+
+@dataclass
+class DataformProject:
+    """A Dataform project root, its defaults and its per-project state."""
+
+    root: str
+    project_id: Optional[str] = None
+    dataset_id: Optional[str] = None
+    ref_cache: RefResolutionCache = field(default_factory=RefResolutionCache)
+
+
+def read_project_defaults(root: str) -> Tuple[Optional[str], Optional[str]]:
+    """Read the default ``(project, dataset)`` of the project at ``root``.
+
+    ``workflow_settings.yaml`` keys are ``defaultProject`` and
+    ``defaultDataset``; ``dataform.json`` keys are ``defaultDatabase`` and
+    ``defaultSchema``. Only these top-level scalars are needed, so the YAML
+    file is read line by line rather than with a YAML parser. Unreadable
+    files give no defaults.
+    """
+    try:
+        with open(os.path.join(root, WORKFLOW_SETTINGS), encoding="utf-8") as f:
+            settings = dict(_YAML_SCALAR_REGEX.findall(f.read()))
+        project_key, dataset_key = "defaultProject", "defaultDataset"
+    except OSError:
+        try:
+            with open(os.path.join(root, LEGACY_SETTINGS), encoding="utf-8") as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if not isinstance(settings, dict):
+            return None, None
+        project_key, dataset_key = "defaultDatabase", "defaultSchema"
+    return (
+        _unquote(settings.get(project_key)) or None,
+        _unquote(settings.get(dataset_key)) or None,
+    )
+
+
+def _unquote(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    return value
+
+
+class ProjectRegistry:
+    """Per-process cache of directory to project root, and of projects.
+
+    Args:
+        max_projects: Number of projects whose state is kept.
+    """
+
+    def __init__(self, max_projects: int = MAX_PROJECTS):
+        self.max_projects = max_projects
+        self._roots: Dict[str, Optional[str]] = {}
+        self._projects: "OrderedDict[str, DataformProject]" = OrderedDict()
+        self.ref_cache_size = 4096
+        self.directories_walked = 0
+        # Lookups of the ref caches of projects no longer kept.
+        self._dropped_hits = 0
+        self._dropped_misses = 0
+
+    def start_run(self) -> None:
+        """Forget the directories walked, to see settings files added since."""
+        self._roots.clear()
+        while self._projects:
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        _, project = self._projects.popitem(last=False)
+        self._dropped_hits += project.ref_cache.hits
+        self._dropped_misses += project.ref_cache.misses
+
+    def ref_cache_counts(self) -> Tuple[int, int]:
+        """Return the hits and misses of every project's ref cache so far."""
+        hits, misses = self._dropped_hits, self._dropped_misses
+        for project in self._projects.values():
+            hits += project.ref_cache.hits
+            misses += project.ref_cache.misses
+        return hits, misses
+
+    def find_root(self, directory: str) -> Optional[str]:
+        """Return the nearest directory at or above ``directory`` with settings."""
+        directory = os.path.abspath(directory)
+        visited = []
+        root: Optional[str] = None
+        while True:
+            if directory in self._roots:
+                root = self._roots[directory]
+                break
+            visited.append(directory)
+            self.directories_walked += 1
+            if os.path.isfile(os.path.join(directory, WORKFLOW_SETTINGS)) or os.path.isfile(
+                os.path.join(directory, LEGACY_SETTINGS)
+            ):
+                root = directory
+                break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+        for path in visited:
+            self._roots[path] = root
+        return root
+
+    def project_for(self, fname: str) -> Optional[DataformProject]:
+        """Return the project ``fname`` belongs to, if any."""
+        root = self.find_root(os.path.dirname(fname) or ".")
+        if root is None:
+            return None
+        project = self._projects.get(root)
+        if project is None:
+            project = DataformProject(
+                root, *read_project_defaults(root), RefResolutionCache(self.ref_cache_size)
+            )
+            self._projects[root] = project
+            if len(self._projects) > self.max_projects:
+                self._drop_oldest()
+        else:
+            self._projects.move_to_end(root)
+        return project
+
+
+def project_index_path(base_path: str, root: Optional[str]) -> str:
+    """Return where the index of the project at ``root`` is written."""
+    if root is None:
+        return base_path
+    digest = hashlib.sha1(root.encode()).hexdigest()[:12]
+    return f"{base_path}.{digest}"
+
+
+project_registry = ProjectRegistry()
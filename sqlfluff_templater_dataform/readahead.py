@@ -0,0 +1,193 @@
+"""Background read-ahead of the files of a lint run.
+
+sqlfluff reads each file just before templating it, one after the other,
+which on a network filesystem leaves the linter waiting on every small
+``.sqlx`` file in turn. ``sequence_files`` sees the whole list up front, so
+with ``read_ahead_bytes`` set it starts a few reader threads which read the
+files in lint order, advising the kernel with ``posix_fadvise`` where
+available. By the time sqlfluff opens a file its content is in the page
+cache (or the NFS client cache), in the process that reads it and in any
+worker forked from the same host.
+
+Contents are not kept: the budget bounds how many bytes are read ahead of
+the file being templated, and each file templated advances the window. The
+readers start with the first file templated in the process which sequenced
+the files. With ``--processes N`` templating happens in workers, which are
+handed one file at a time and so cannot read ahead, and which the main
+process's readers cannot see; there the readers never start. How much read
+time was done in the background is logged when the process exits.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlfluff.core.plugin.host import is_main_process
+
+# Instantiate the templater logger
+templater_logger = logging.getLogger("sqlfluff.templater")
+
+_CHUNK_SIZE = 1 << 16
+
+
+class ReadAhead:
+    """Read ``fnames`` in the background, at most ``budget_bytes`` ahead.
+
+    Args:
+        fnames: Files in the order they will be templated.
+        budget_bytes: Bytes read but not yet claimed before readers wait.
+        threads: Number of reader threads.
+    """
+
+    def __init__(self, fnames: List[str], budget_bytes: int, threads: int = 4):
+        self.fnames = fnames
+        self.budget_bytes = budget_bytes
+        self.threads = threads
+        self.started = False
+        self._owner_pid = os.getpid()
+        self._next = 0
+        self._ahead_bytes = 0
+        # Per file: None while being read, then (size, read seconds).
+        self._read: Dict[str, Optional[tuple]] = {}
+        self._claimed = set()
+        self._stopped = False
+        self._condition = threading.Condition()
+        self.files_read = 0
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self.hidden_seconds = 0.0
+        self.ready = 0
+        self.in_flight = 0
+        self.missed = 0
+
+    def start(self) -> "ReadAhead":
+        """Start the reader threads."""
+        self.started = True
+        for i in range(self.threads):
+            threading.Thread(
+                target=self._run, name=f"dataform-read-ahead-{i}", daemon=True
+            ).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop reading; threads finish the file they are on."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _take_next(self) -> Optional[str]:
+        with self._condition:
+            while True:
+                if self._stopped or self._next >= len(self.fnames):
+                    return None
+                if self._ahead_bytes >= self.budget_bytes:
+                    self._condition.wait()
+                    continue
+                fname = self.fnames[self._next]
+                self._next += 1
+                if fname not in self._claimed:  # Else it is already templated.
+                    self._read[fname] = None
+                    return fname
+
+    def _run(self) -> None:
+        buffer = bytearray(_CHUNK_SIZE)
+        while True:
+            fname = self._take_next()
+            if fname is None:
+                return
+            start = time.perf_counter()
+            size = 0
+            try:
+                with open(fname, "rb") as f:
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    while True:
+                        n = f.readinto(buffer)
+                        if not n:
+                            break
+                        size += n
+            except OSError:
+                pass
+            elapsed = time.perf_counter() - start
+            with self._condition:
+                self.files_read += 1
+                self.bytes_read += size
+                self.read_seconds += elapsed
+                if fname in self._claimed:
+                    del self._read[fname]
+                else:
+                    self._read[fname] = (size, elapsed)
+                    self._ahead_bytes += size
+
+    def claim(self, fname: str) -> None:
+        """Note that ``fname`` is being templated, freeing its budget.
+
+        The first claim starts the readers, unless it comes from a worker
+        process, where they are of no use.
+        """
+        if not self.started:
+            if os.getpid() != self._owner_pid or not is_main_process.get():
+                return
+            self.start()
+        with self._condition:
+            if fname in self._claimed:
+                return
+            self._claimed.add(fname)
+            if fname not in self._read:
+                self.missed += 1
+                return
+            entry = self._read[fname]
+            if entry is None:
+                self.in_flight += 1  # The reader drops it when done.
+                return
+            del self._read[fname]
+            size, elapsed = entry
+            self.ready += 1
+            self.hidden_seconds += elapsed
+            self._ahead_bytes -= size
+            self._condition.notify_all()
+
+    def summary(self) -> str:
+        """Describe how much reading was done ahead of templating."""
+        return (
+            f"Dataform read-ahead: {self.files_read} files, "
+            f"{self.bytes_read / 1e6:.1f}MB read in {self.read_seconds:.3f}s in the background; "
+            f"{self.ready} files were ready when templated ({self.hidden_seconds:.3f}s of "
+            f"reads hidden), {self.in_flight} still being read, {self.missed} not reached."
+        )
+
+    def dump(self) -> None:
+        """Stop reading and log the summary."""
+        self.stop()
+        if self.files_read:
+            templater_logger.info(self.summary())
+
+
+_read_ahead: Optional[ReadAhead] = None
+
+
+def start_read_ahead(fnames: List[str], budget_bytes: int) -> ReadAhead:
+    """Set up reading ahead for a new run, stopping any previous one.
+
+    The readers start when the first file is claimed (see ``ReadAhead.claim``).
+    """
+    global _read_ahead
+    if _read_ahead is not None:
+        _read_ahead.dump()
+    _read_ahead = ReadAhead(fnames, budget_bytes)
+    return _read_ahead
+
+
+def get_read_ahead() -> Optional[ReadAhead]:
+    """Return the read-ahead of the current run in this process, if any."""
+    return _read_ahead
+
+
+def _dump_at_exit() -> None:
+    if _read_ahead is not None:
+        _read_ahead.dump()
+
+
+atexit.register(_dump_at_exit)
@@ -0,0 +1,83 @@
+"""Resolution of ``${ref()}`` arguments to BigQuery table names.
+
+A project references the same few hundred tables thousands of times, so the
+fully qualified names are built once per process and shared: the resolution
+cache maps a ``(project, dataset, name)`` tuple to an interned
+`` `project.dataset.name` `` string.
+"""
+import re
+import sys
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+
+# BigQuery identifiers can contain letters, numbers, and underscores
+# (dashes are allowed in project ids).
+_INVALID_IDENTIFIER_CHARS = re.compile(r'[^a-zA-Z0-9_-]')
+
+
+def sanitize_identifier(identifier):
+    """Make ``identifier`` valid for BigQuery.
+
+    Invalid characters are replaced with underscores and a leading digit is
+    prefixed with an underscore. Empty values are returned unchanged.
+    """
+    if not identifier:
+        return identifier
+    # Replace invalid characters with underscores
+    sanitized = _INVALID_IDENTIFIER_CHARS.sub('_', str(identifier))
+    # Ensure it starts with a letter or underscore
+    if sanitized and sanitized[0].isdigit():
+        sanitized = '_' + sanitized
+    return sanitized
+
+
+class RefResolutionCache:
+    """Bounded LRU cache of resolved, interned table names.
+
+    Entries are keyed by the resolved project, dataset and name, so they
+    stay valid when the default project or dataset changes between files;
+    the size bound alone limits how many are kept. Hit and miss counts are
+    kept for the lifetime of the cache.
+
+    Args:
+        maxsize: Maximum number of table names kept.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+
+    def resolve(self, project_id, dataset, model_name) -> str:
+        """Return the quoted table name for the given ref components."""
+        key = (project_id, dataset, model_name)
+        table = self._entries.get(key)
+        if table is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return table
+        self.misses += 1
+        table = sys.intern(
+            f"`{sanitize_identifier(project_id)}"
+            f".{sanitize_identifier(dataset)}"
+            f".{sanitize_identifier(model_name)}`"
+        )
+        self._entries[key] = table
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return table
+
+    def stats(self) -> Dict[str, float]:
+        """Return the hit, miss and size counts and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+ref_cache = RefResolutionCache()
@@ -0,0 +1,198 @@
+"""Per-file timing report for the dataform templater.
+
+When ``timing_report_path`` is set in the ``[sqlfluff:templater:dataform]``
+section, every templated file contributes one record (wall time, input size,
+slice count and construct counts). The report is written as JSON or CSV,
+chosen by the file extension, sorted slowest first.
+
+``sqlfluff lint --processes N`` templates files in worker processes which are
+forked before the templater sees the file list, so records cannot be passed
+back in memory. Instead each process appends its records to its own shard in
+``<timing_report_path>.shards/`` and the process which sequenced the files
+merges the shards into the final report when it exits.
+"""
+import atexit
+import csv
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlfluff.core.plugin.host import is_main_process
+from sqlfluff.core.templaters.base import RawFileSlice
+
+
+# Instantiate the templater logger
+templater_logger = logging.getLogger("sqlfluff.templater")
+
+REPORT_FIELDS = [
+    "path",
+    "wall_ms",
+    "input_size",
+    "slices",
+    "refs",
+    "selfs",
+    "whens",
+    "js_expressions",
+    "blocks",
+]
+
+_REF_START = re.compile(r'\$\{\s*ref\(')
+_SELF_START = re.compile(r'\$\{\s*self\(')
+_WHEN_START = re.compile(r'\$\{\s*when\(')
+
+
+def count_constructs(sql: str, constructs: Iterable[Tuple[int, int]]) -> Dict[str, int]:
+    """Count the Dataform constructs of ``sql`` by kind.
+
+    Args:
+        sql: The source of the file.
+        constructs: The ``(start, end)`` of each construct found by the
+            scanner, as from ``DataformTemplater.construct_spans``. Unlike
+            the final slices, these are neither merged by ``compact_slices``
+            nor split up by ``lint_operations``.
+    """
+    counts = {"refs": 0, "selfs": 0, "whens": 0, "js_expressions": 0, "blocks": 0}
+    for start, _ in constructs:
+        if _REF_START.match(sql, start):
+            counts["refs"] += 1
+        elif _SELF_START.match(sql, start):
+            counts["selfs"] += 1
+        elif _WHEN_START.match(sql, start):
+            counts["whens"] += 1
+        elif sql.startswith('${', start):
+            counts["js_expressions"] += 1
+        else:
+            counts["blocks"] += 1
+    return counts
+
+
+def atomic_write(path: str, content: str) -> None:
+    """Write ``content`` to ``path`` so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class TimingReport:
+    """Collect per-file templating records and write the slowest-files report.
+
+    Args:
+        path: Destination of the report. A ``.csv`` extension selects CSV,
+            anything else JSON.
+        top_n: Number of slowest files listed in the summary.
+    """
+
+    def __init__(self, path: str, top_n: int = 10):
+        self.path = path
+        self.top_n = top_n
+        self.shard_dir = f"{path}.shards"
+        self._coordinating = False
+        self._lock = threading.Lock()
+
+    def start_run(self) -> None:
+        """Make this process responsible for merging the report at exit.
+
+        Any shards left behind by a previous run are discarded.
+        """
+        if self._coordinating:
+            return
+        self._coordinating = True
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        atexit.register(self.write)
+
+    def record(
+        self,
+        fname: str,
+        wall_ns: int,
+        in_str: str,
+        raw_slices: Sequence[RawFileSlice],
+        constructs: Iterable[Tuple[int, int]] = (),
+    ) -> None:
+        """Append the record of one templated file to this process's shard.
+
+        ``constructs`` are the spans counted by ``count_constructs``.
+        """
+        if not self._coordinating and is_main_process.get():
+            # Templated without sequence_files (e.g. the Python API).
+            self.start_run()
+        record = {
+            "path": fname,
+            "wall_ms": round(wall_ns / 1e6, 3),
+            "input_size": len(in_str),
+            "slices": len(raw_slices),
+        }
+        record.update(count_constructs(in_str, constructs))
+        line = json.dumps(record) + "\n"
+        shard_path = os.path.join(self.shard_dir, f"{os.getpid()}.jsonl")
+        with self._lock:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            with open(shard_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def collect(self) -> List[dict]:
+        """Read the records of every process, slowest first."""
+        records = []
+        if os.path.isdir(self.shard_dir):
+            for shard in sorted(os.listdir(self.shard_dir)):
+                with open(os.path.join(self.shard_dir, shard), encoding="utf-8") as f:
+                    records.extend(json.loads(line) for line in f if line.strip())
+        records.sort(key=lambda record: record["wall_ms"], reverse=True)
+        return records
+
+    def render(self, records: List[dict]) -> str:
+        """Render the records in the format selected by the report path."""
+        if self.path.lower().endswith(".csv"):
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+            return buffer.getvalue()
+        return json.dumps(
+            {
+                "files": len(records),
+                "total_wall_ms": round(sum(r["wall_ms"] for r in records), 3),
+                "slowest": records[:self.top_n],
+                "records": records,
+            },
+            indent=2,
+        )
+
+    def write(self) -> Optional[List[dict]]:
+        """Merge the shards, write the report and log the slowest files."""
+        records = self.collect()
+        if not records:
+            return None
+        atomic_write(self.path, self.render(records))
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+        self._coordinating = False
+        templater_logger.info(
+            "Dataform templater timing report written to %s. Slowest files:\n%s",
+            self.path,
+            "\n".join(
+                f"  {r['wall_ms']:>10.3f}ms {r['input_size']:>9} chars "
+                f"{r['slices']:>6} slices  {r['path']}"
+                for r in records[:self.top_n]
+            ),
+        )
+        return records
+
+
+_reports: Dict[str, TimingReport] = {}
+
+
+def get_timing_report(path: str, top_n: int = 10) -> TimingReport:
+    """Return the process-wide report for ``path``, creating it on first use."""
+    report = _reports.get(path)
+    if report is None:
+        report = _reports[path] = TimingReport(path, top_n)
+    report.top_n = top_n
+    return report
@@ -0,0 +1,130 @@
+"""Templater settings, resolved once per config rather than once per file.
+
+Every file is templated with the settings of the ``[sqlfluff:templater:dataform]``
+section of its own config, which sqlfluff builds from every ``.sqlfluff``
+file between the project root and the file's directory, so a nested config
+can override any of them. ``TemplaterSettings`` holds one resolved and
+validated set of values, and ``settings_cache`` hands out the same instance
+for:
+
+* the same ``FluffConfig`` object, without reading the config at all. The
+  objects are held through weak references, so the cache does not keep them
+  alive.
+* a different ``FluffConfig`` whose section has the same content, with a
+  single section lookup. sqlfluff builds a new config object for every file
+  it lints, so this is the usual case: all the files of a directory, and of
+  every directory sharing its settings, resolve to one instance.
+"""
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Mapping, Optional, Tuple
+
+from sqlfluff.core.errors import SQLFluffUserError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from sqlfluff.core import FluffConfig
+
+
+ENGINE_NAMES = ("scan", "legacy")
+
+
+@dataclass(frozen=True)
+class TemplaterSettings:
+    """Values of the ``[sqlfluff:templater:dataform]`` section, with defaults."""
+
+    project_id: Optional[str] = None
+    dataset_id: Optional[str] = None
+    profile_phases: bool = False
+    timing_report_path: Optional[str] = None
+    timing_report_top_n: int = 10
+    metrics_textfile_path: Optional[str] = None
+    preserve_width: bool = False
+    compact_slices: bool = False
+    context_placeholders: bool = True
+    engine: str = "scan"
+    large_file_threshold: int = 1_000_000
+    max_file_size: int = 0
+    project_index_path: Optional[str] = None
+    discover_projects: bool = False
+    lint_operations: bool = False
+    outlier_profile_dir: Optional[str] = None
+    outlier_profile_ms: float = 1000.0
+    outlier_profile_bytes: int = 0
+    outlier_profile_limit: int = 20
+    read_ahead_bytes: int = 0
+    sequential_fail_limit: int = 3
+    ref_cache_size: int = 4096
+    construct_memo_size: int = 1024
+
+    @classmethod
+    def from_section(cls, section: Optional[Mapping[str, Any]]) -> "TemplaterSettings":
+        """Resolve and validate the settings of a config section.
+
+        Unknown keys are ignored, as sqlfluff does for other templaters.
+        """
+        values = {
+            name: section[name] for name in cls.__dataclass_fields__ if section and name in section
+        }
+        settings = cls(**values)
+        if settings.engine not in ENGINE_NAMES:
+            raise SQLFluffUserError(
+                f"Unknown dataform templater engine {settings.engine!r}, "
+                "expected 'scan' or 'legacy'."
+            )
+        for option in ("preserve_width", "lint_operations"):
+            if settings.engine == "legacy" and getattr(settings, option):
+                raise SQLFluffUserError(
+                    f"The legacy dataform templater engine does not support {option}."
+                )
+        return settings
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class SettingsCache:
+    """Resolved settings by config object and by section content.
+
+    Args:
+        maxsize: Number of distinct sections kept. The cache is emptied
+            when it is exceeded, which only happens with unusually many
+            distinct nested configs.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._by_config: "weakref.WeakKeyDictionary[FluffConfig, TemplaterSettings]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._by_section: Dict[Hashable, TemplaterSettings] = {}
+        self.resolved = 0
+
+    def get(self, config: "FluffConfig", section: Tuple[str, ...]) -> TemplaterSettings:
+        """Return the settings of ``section`` in ``config``."""
+        settings = self._by_config.get(config)
+        if settings is not None:
+            return settings
+        values = config.get_section(section)
+        key = _freeze(values)
+        settings = self._by_section.get(key)
+        if settings is None:
+            settings = TemplaterSettings.from_section(values)
+            self.resolved += 1
+            if len(self._by_section) >= self.maxsize:
+                self._by_section.clear()
+            self._by_section[key] = settings
+        self._by_config[config] = settings
+        return settings
+
+    def clear(self) -> None:
+        """Forget every resolved setting."""
+        self._by_config.clear()
+        self._by_section.clear()
+
+
+settings_cache = SettingsCache()
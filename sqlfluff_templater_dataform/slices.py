@@ -0,0 +1,284 @@
+"""Helpers for the raw and templated slice lists of a SQLX file."""
+import struct
+import sys
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+from sqlfluff.core.templaters.base import RawFileSlice, TemplatedFile, TemplatedFileSlice
+
+
+def merge_adjacent_slices(
+    raw_slices: Sequence[RawFileSlice],
+    templated_slices: Sequence[TemplatedFileSlice],
+) -> Tuple[List[RawFileSlice], List[TemplatedFileSlice]]:
+    """Merge neighbouring slices where the source mapping stays exact.
+
+    Two neighbouring slices are merged when both are literal, or when both
+    are templated and at least one of them renders to nothing (for example
+    a ``config`` block directly followed by a ``js`` block, or by a
+    ``${ref()}``). The merged slice maps the combined source range to the
+    combined templated range, so every remaining slice boundary is one of
+    the original boundaries. Templated output is never merged into literal
+    SQL, which would stop sqlfluff from fixing it, and ``block_start`` and
+    ``block_end`` slices are never merged, as sqlfluff indents by them.
+
+    Args:
+        raw_slices: The raw slices, in source order.
+        templated_slices: The templated slices matching ``raw_slices``.
+
+    Returns:
+        A tuple of the compacted raw slices and templated slices, with the
+        raw slices' ``block_idx`` renumbered.
+    """
+    compact_raw: List[RawFileSlice] = []
+    compact_templated: List[TemplatedFileSlice] = []
+    for raw_slice, templated_slice in zip(raw_slices, templated_slices):
+        if compact_templated:
+            previous = compact_templated[-1]
+            if templated_slice.slice_type in ('literal', 'templated') and (
+                previous.slice_type == templated_slice.slice_type
+            ) and (
+                templated_slice.slice_type == 'literal'
+                or previous.templated_slice.start == previous.templated_slice.stop
+                or templated_slice.templated_slice.start == templated_slice.templated_slice.stop
+            ):
+                previous_raw = compact_raw[-1]
+                compact_raw[-1] = RawFileSlice(
+                    raw=previous_raw.raw + raw_slice.raw,
+                    slice_type=previous_raw.slice_type,
+                    source_idx=previous_raw.source_idx,
+                    block_idx=previous_raw.block_idx,
+                )
+                compact_templated[-1] = TemplatedFileSlice(
+                    slice_type=previous.slice_type,
+                    source_slice=slice(
+                        previous.source_slice.start, templated_slice.source_slice.stop
+                    ),
+                    templated_slice=slice(
+                        previous.templated_slice.start, templated_slice.templated_slice.stop
+                    ),
+                )
+                continue
+        compact_raw.append(RawFileSlice(
+            raw=raw_slice.raw,
+            slice_type=raw_slice.slice_type,
+            source_idx=raw_slice.source_idx,
+            block_idx=len(compact_raw),
+        ))
+        compact_templated.append(templated_slice)
+    return compact_raw, compact_templated
+
+
+SLICE_TYPES = ('literal', 'templated', 'block_start', 'block_end')
+_TABLE_MAGIC = b"DFT1"
+# Magic, slice count, string count, source and strings byte lengths.
+_TABLE_HEADER = struct.Struct("<4sIIII")
+
+
+class SliceTable:
+    """Compact table of the slices of a templated SQLX file.
+
+    Slices are stored as parallel ``array`` columns: the slice type (its
+    index in ``SLICE_TYPES``), source and templated offsets, and for
+    templated slices an index into a table of distinct replacement strings
+    (-1 for literal slices, whose text is the source's). A file holds a few
+    ints per slice instead of two NamedTuples and a ``slice`` per offset
+    pair, and the whole table serializes to bytes with a handful of
+    ``array.tobytes`` calls. sqlfluff's slice lists and ``TemplatedFile`` are
+    built from it on demand.
+    """
+
+    __slots__ = (
+        "source",
+        "kinds",
+        "source_starts",
+        "source_stops",
+        "templated_starts",
+        "templated_stops",
+        "text_ids",
+        "strings",
+    )
+
+    def __init__(self, source: str):
+        self.source = source
+        self.kinds = array('b')
+        self.source_starts = array('i')
+        self.source_stops = array('i')
+        self.templated_starts = array('i')
+        self.templated_stops = array('i')
+        self.text_ids = array('i')
+        self.strings: List[str] = []
+
+    @classmethod
+    def from_slices(
+        cls,
+        source: str,
+        templated_str: str,
+        raw_slices: Sequence[RawFileSlice],
+        templated_slices: Sequence[TemplatedFileSlice],
+    ) -> "SliceTable":
+        """Build the table of a slicing, as returned by ``slice_sqlx_template``."""
+        table = cls(source)
+        string_ids: Dict[str, int] = {}
+        for raw_slice, templated_slice in zip(raw_slices, templated_slices):
+            source_slice = templated_slice.source_slice
+            templated = templated_slice.templated_slice
+            if templated_slice.slice_type == 'literal':
+                table.kinds.append(0)
+                table.text_ids.append(-1)
+            else:
+                text = templated_str[templated]
+                text_id = string_ids.get(text)
+                if text_id is None:
+                    text_id = string_ids[text] = len(table.strings)
+                    table.strings.append(text)
+                table.kinds.append(SLICE_TYPES.index(templated_slice.slice_type))
+                table.text_ids.append(text_id)
+            table.source_starts.append(source_slice.start)
+            table.source_stops.append(source_slice.stop)
+            table.templated_starts.append(templated.start)
+            table.templated_stops.append(templated.stop)
+        return table
+
+    @classmethod
+    def from_templated_file(cls, templated_file: TemplatedFile) -> "SliceTable":
+        """Build the table of a ``TemplatedFile``."""
+        return cls.from_slices(
+            templated_file.source_str,
+            templated_file.templated_str,
+            templated_file.raw_sliced,
+            templated_file.sliced_file,
+        )
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SliceTable):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @property
+    def templated_str(self) -> str:
+        """The templated SQL."""
+        source = self.source
+        strings = self.strings
+        return ''.join(
+            source[start:stop] if text_id < 0 else strings[text_id]
+            for start, stop, text_id in zip(self.source_starts, self.source_stops, self.text_ids)
+        )
+
+    def slices(self) -> Tuple[List[RawFileSlice], List[TemplatedFileSlice]]:
+        """Build sqlfluff's raw and templated slice lists."""
+        raw_slices = []
+        templated_slices = []
+        source = self.source
+        for block_idx, (kind, start, stop, templated_start, templated_stop) in enumerate(zip(
+            self.kinds,
+            self.source_starts,
+            self.source_stops,
+            self.templated_starts,
+            self.templated_stops,
+        )):
+            slice_type = SLICE_TYPES[kind]
+            raw_slices.append(RawFileSlice(
+                raw=source[start:stop], slice_type=slice_type, source_idx=start, block_idx=block_idx
+            ))
+            templated_slices.append(TemplatedFileSlice(
+                slice_type=slice_type,
+                source_slice=slice(start, stop),
+                templated_slice=slice(templated_start, templated_stop),
+            ))
+        return raw_slices, templated_slices
+
+    def templated_file(self, fname: str) -> TemplatedFile:
+        """Build the ``TemplatedFile`` of ``fname``."""
+        raw_slices, templated_slices = self.slices()
+        return TemplatedFile(
+            source_str=self.source,
+            templated_str=self.templated_str,
+            fname=fname,
+            sliced_file=templated_slices,
+            raw_sliced=raw_slices,
+        )
+
+    def to_bytes(self) -> bytes:
+        """Serialize the table.
+
+        The format is a header, the int columns (little-endian int32), the
+        slice types, the UTF-8 byte length of each string, then the UTF-8
+        source and strings.
+        """
+        source = self.source.encode("utf-8")
+        encoded = [string.encode("utf-8") for string in self.strings]
+        strings = b"".join(encoded)
+        lengths = array('i', [len(string) for string in encoded])
+        columns = [
+            self.source_starts,
+            self.source_stops,
+            self.templated_starts,
+            self.templated_stops,
+            self.text_ids,
+            lengths,
+        ]
+        if sys.byteorder == "big":  # pragma: no cover
+            columns = [array('i', column) for column in columns]
+            for column in columns:
+                column.byteswap()
+        return b"".join([
+            _TABLE_HEADER.pack(
+                _TABLE_MAGIC, len(self.kinds), len(encoded), len(source), len(strings)
+            ),
+            *(column.tobytes() for column in columns),
+            self.kinds.tobytes(),
+            source,
+            strings,
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SliceTable":
+        """Deserialize a table written by ``to_bytes``.
+
+        Raises:
+            ValueError: If ``data`` is not a serialized table.
+        """
+        view = memoryview(data)
+        if len(view) < _TABLE_HEADER.size:
+            raise ValueError("Not a serialized slice table")
+        magic, count, string_count, source_size, strings_size = _TABLE_HEADER.unpack_from(view)
+        expected = _TABLE_HEADER.size + 21 * count + 4 * string_count + source_size + strings_size
+        if magic != _TABLE_MAGIC or len(view) != expected:
+            raise ValueError("Not a serialized slice table")
+
+        offset = _TABLE_HEADER.size
+
+        def take(size: int) -> memoryview:
+            nonlocal offset
+            chunk = view[offset:offset + size]
+            offset += size
+            return chunk
+
+        columns = []
+        for size in (count,) * 5 + (string_count,):
+            column = array('i')
+            column.frombytes(take(4 * size))
+            if sys.byteorder == "big":  # pragma: no cover
+                column.byteswap()
+            columns.append(column)
+        kinds = take(count)
+        table = cls(str(take(source_size), "utf-8"))
+        table.kinds.frombytes(kinds)
+        (
+            table.source_starts,
+            table.source_stops,
+            table.templated_starts,
+            table.templated_stops,
+            table.text_ids,
+            lengths,
+        ) = columns
+        strings = bytes(take(strings_size))
+        start = 0
+        for length in lengths:
+            table.strings.append(strings[start:start + length].decode("utf-8"))
+            start += length
+        return table
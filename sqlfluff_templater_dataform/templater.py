@@ -1,17 +1,37 @@
+import bisect
 import logging
 import os
 import os.path
 import re
+import time
 from typing import (
+    TYPE_CHECKING,
+    Iterator,
     List,
     Optional,
+    Set,
     Tuple,
 )
 from sqlfluff.core.templaters.base import RawTemplater, TemplatedFile, large_file_check, RawFileSlice, TemplatedFileSlice
-from sqlfluff.cli.formatters import OutputStreamFormatter
-from sqlfluff.core import FluffConfig
 from sqlfluff.core.errors import SQLFluffSkipFile
 
+from sqlfluff_templater_dataform.arguments import split_arguments, unquote
+from sqlfluff_templater_dataform.breaker import circuit_breaker
+from sqlfluff_templater_dataform.memo import ConstructMemo, construct_memo
+from sqlfluff_templater_dataform.placeholders import IDENTIFIER, placeholder_for
+from sqlfluff_templater_dataform.refs import RefResolutionCache, ref_cache
+from sqlfluff_templater_dataform.settings import TemplaterSettings, settings_cache
+from sqlfluff_templater_dataform.slices import SliceTable, merge_adjacent_slices
+
+if TYPE_CHECKING:  # pragma: no cover
+    from sqlfluff.cli.formatters import OutputStreamFormatter
+    from sqlfluff.core import FluffConfig
+
+    from sqlfluff_templater_dataform.index import ProjectIndex
+    from sqlfluff_templater_dataform.metrics import TemplaterMetrics
+    from sqlfluff_templater_dataform.profiling import PhaseTimer
+    from sqlfluff_templater_dataform.report import TimingReport
+
 
 # Instantiate the templater logger
 templater_logger = logging.getLogger("sqlfluff.templater")
@@ -26,6 +46,109 @@ REF_PATTERN = r'(?s)\$\{\s*ref\((.*?)\)\s*\}'
 SELF_PATTERN = r'\$\{\s*self\(\s*\)\s*\}'
 INCREMENTAL_CONDITION_PATTERN = r'\$\{\s*when\((.*?)\)\s*\}'
 
+_REF_REGEX = re.compile(REF_PATTERN)
+_SELF_REGEX = re.compile(SELF_PATTERN)
+_BLOCK_START_REGEX = re.compile(r'(config|pre_operations|post_operations|js)\s*\{')
+_WHEN_START_REGEX = re.compile(r'\$\{\s*when\(')
+_JS_EXPRESSION_START_REGEX = re.compile(JS_EXPRESSION_PATTERN_IN_SQL)
+_REF_START_REGEX = re.compile(r'\$\{\s*ref\(')
+_SELF_START_REGEX = re.compile(r'\$\{\s*self\(')
+# Construct kinds in the order they win ties at the same offset.
+_CONSTRUCT_KINDS = ('block', 'ref', 'self', 'when', 'js')
+_NON_NEWLINE_REGEX = re.compile(r'[^\n]')
+_BRACE_REGEX = re.compile(r'[{}]')
+# Tokens of the large file scanner: construct openers and bare braces.
+_LARGE_FILE_TOKEN_REGEX = re.compile(
+    r'(config|pre_operations|post_operations|js)\s*\{|\$\{|[{}]'
+)
+_OPERATIONS_START_REGEX = re.compile(r'(pre|post)_operations\s*\{')
+# Block comments, up to the end of the file for an unterminated one.
+_BLOCK_COMMENT_REGEX = re.compile(r'/\*.*?(?:\*/|\Z)', re.S)
+_BLOCK_KEYWORD_REGEXES = [
+    re.compile(rf'{keyword}\s*\{{')
+    for keyword in ('config', 'pre_operations', 'post_operations', 'js')
+]
+
+
+def fit_to_width(replacement: str, raw: str, comment: str = '') -> str:
+    """Pad ``replacement`` up to the width of ``raw``.
+
+    The padding is a ``/* ... */`` comment which reproduces the newlines and
+    indentation of the part of ``raw`` it stands in for, so the line count is
+    kept too. sqlfluff measures and reindents whitespace that comes from a
+    templated slice against the whole slice, so a comment is used rather
+    than bare blanks. Replacements which are already as wide as ``raw`` are
+    returned as is, and when there is no room for a comment the replacement
+    is padded with blanks and the newlines of ``raw``, which keeps the line
+    count at the cost of some width if need be.
+
+    ``comment`` is the marker of the comment the construct is in, if any
+    (``'/*'`` or ``'--'``), as from ``_comment_at``. There the padding is
+    blanks and newlines, as a nested ``*/`` would end a block comment early.
+    In a line comment it is blanks only, as a newline would end the comment
+    and turn the rest of its line into SQL; the line count is not kept.
+    """
+    width = len(raw)
+    if len(replacement) >= width:
+        return replacement
+    if comment == '--':
+        return replacement.ljust(width)
+    if comment:
+        return _blank_padding(replacement, raw)
+    comment_body = _NON_NEWLINE_REGEX.sub(' ', raw[len(replacement) + 2:width - 2])
+    # Newlines under the replacement and the comment markers move into the
+    # body, at its start and end respectively.
+    lost_head = raw.count('\n', 0, len(replacement) + 2) - replacement.count('\n')
+    lost_tail = raw.count('\n', width - 2)
+    if width - len(replacement) < 4 or comment_body.count(' ') < lost_head + lost_tail:
+        return _blank_padding(replacement, raw)
+    if lost_head > 0:
+        comment_body = comment_body.replace(' ', '\n', lost_head)
+    if lost_tail > 0:
+        comment_body = comment_body[::-1].replace(' ', '\n', lost_tail)[::-1]
+    return replacement + '/*' + comment_body + '*/'
+
+
+def _blank_padding(replacement: str, raw: str) -> str:
+    """Pad ``replacement`` with blanks and the newlines of ``raw`` it stands in for."""
+    padding = _NON_NEWLINE_REGEX.sub(' ', raw[len(replacement):])
+    lost = raw.count('\n', 0, len(replacement)) - replacement.count('\n')
+    if lost > 0:
+        padding = '\n' * lost + padding.replace(' ', '', lost)
+    return replacement + padding
+
+
+def _comment_at(sql: str, idx: int, comments: Tuple[List[int], List[int]]) -> str:
+    """Return the marker of the comment ``sql[idx]`` is in, or ``''``.
+
+    Args:
+        comments: The starts and ends of the block comments of ``sql``, as
+            from ``_block_comments``.
+
+    Quotes are not tracked, so a comment marker inside a string counts too;
+    that only costs the construct its comment padding.
+    """
+    starts, ends = comments
+    i = bisect.bisect_right(starts, idx) - 1
+    if i >= 0 and idx < ends[i]:
+        return '/*'
+    line = sql[sql.rfind('\n', 0, idx) + 1:idx]
+    return '--' if '--' in line or '#' in line else ''
+
+
+def _block_comments(sql: str) -> Tuple[List[int], List[int]]:
+    """Return the starts and ends of the block comments of ``sql``."""
+    spans = [match.span() for match in _BLOCK_COMMENT_REGEX.finditer(sql)]
+    return [start for start, _ in spans], [end for _, end in spans]
+
+
+def _delimiter_after(previous: str) -> str:
+    """Return the statement delimiter to add after SQL ending with ``previous``."""
+    if not previous or previous.rstrip().endswith(';'):
+        return ''
+    return ';'
+
+
 class DataformTemplater(RawTemplater):
     """A templater for Dataform SQLX files.
 
@@ -67,28 +190,190 @@ class DataformTemplater(RawTemplater):
         self.dataset_id = None
         self.working_dir = os.getcwd()
         self._sequential_fails = 0
+        self.phase_timer: Optional["PhaseTimer"] = None
+        self.timing_report: Optional["TimingReport"] = None
+        self.metrics: Optional["TemplaterMetrics"] = None
+        self.malformed_fallbacks = 0
+        self.preserve_width = False
+        self.compact_slices = False
+        self.engine = "scan"
+        self.context_placeholders = True
+        self.large_file_threshold = 1_000_000
+        self.max_file_size = 0
+        self.project_index_path: Optional[str] = None
+        self.project_index: Optional["ProjectIndex"] = None
+        self.read_ahead_bytes = 0
+        self.discover_projects = False
+        self.lint_operations = False
+        # ``(sql, templated_sql, raw_slices, templated_slices)`` of the last
+        # file sliced, before compaction, to derive its other variants from.
+        self._last_slicing: Optional[tuple] = None
+        # ``(start, end)`` of each construct of the last file sliced.
+        self.construct_spans: List[Tuple[int, int]] = []
+        # ``(sql, block comments)`` of the last text padded by ``preserve_width``.
+        self._comments: Optional[tuple] = None
+        self.ref_cache: RefResolutionCache = ref_cache
+        self.construct_memo: Optional[ConstructMemo] = construct_memo
+        self.settings = TemplaterSettings()
         super().__init__(**kwargs)
 
     def _setup_config(self, config: Optional["FluffConfig"] = None):
-        """Set up configuration for the templater."""
+        """Set up configuration for the templater.
+
+        Settings are resolved once per config (see
+        ``sqlfluff_templater_dataform.settings``) and applied to this
+        templater as a whole, so a nested config which turns an option off
+        does not inherit the state of a previous file.
+        """
         if config:
             self.sqlfluff_config = config
-            
+
         if self.sqlfluff_config:
-            self.project_id = self.sqlfluff_config.get(
-                "project_id", section=(self.templater_selector, self.name)
+            self._apply_settings(
+                settings_cache.get(self.sqlfluff_config, (self.templater_selector, self.name))
             )
-            self.dataset_id = self.sqlfluff_config.get(
-                "dataset_id", section=(self.templater_selector, self.name)
+
+    def _apply_settings(self, settings: TemplaterSettings) -> None:
+        self.settings = settings
+        self.project_id = settings.project_id
+        self.dataset_id = settings.dataset_id
+        if settings.profile_phases:
+            from sqlfluff_templater_dataform.profiling import get_phase_timer
+
+            self.phase_timer = get_phase_timer()
+        else:
+            self.phase_timer = None
+        if settings.timing_report_path:
+            from sqlfluff_templater_dataform.report import get_timing_report
+
+            self.timing_report = get_timing_report(
+                settings.timing_report_path, settings.timing_report_top_n
             )
+        else:
+            self.timing_report = None
+        if settings.metrics_textfile_path:
+            from sqlfluff_templater_dataform.metrics import get_metrics
+
+            self.metrics = get_metrics(settings.metrics_textfile_path)
+        else:
+            self.metrics = None
+        self.preserve_width = settings.preserve_width
+        self.compact_slices = settings.compact_slices
+        self.context_placeholders = settings.context_placeholders
+        self.engine = settings.engine
+        self.large_file_threshold = settings.large_file_threshold
+        self.max_file_size = settings.max_file_size
+        self.project_index_path = settings.project_index_path
+        if not settings.project_index_path:
+            self.project_index = None
+        self.read_ahead_bytes = settings.read_ahead_bytes
+        self.discover_projects = settings.discover_projects
+        self.lint_operations = settings.lint_operations
+        self.ref_cache = ref_cache
+        circuit_breaker.limit = settings.sequential_fail_limit
+        ref_cache.maxsize = settings.ref_cache_size
+        construct_memo.maxsize = settings.construct_memo_size
+        self.construct_memo = construct_memo if settings.construct_memo_size else None
+        if settings.discover_projects:
+            from sqlfluff_templater_dataform.projects import project_registry
+
+            project_registry.ref_cache_size = settings.ref_cache_size
+
+    def _use_project(self, fname: str) -> Optional[str]:
+        """Template ``fname`` with the defaults and state of its Dataform project.
+
+        Values the project does not set keep their configured value. Returns
+        the project root, or None for a file outside any project.
+        """
+        from sqlfluff_templater_dataform.projects import project_registry
+
+        project = project_registry.project_for(fname)
+        if project is None:
+            return None
+        self.project_id = project.project_id or self.project_id
+        self.dataset_id = project.dataset_id or self.dataset_id
+        self.ref_cache = project.ref_cache
+        return project.root
+
+    def _timed(self, phase: str, func, *args, **kwargs):
+        """Call ``func``, recording its duration when phase timing is on."""
+        timer = self.phase_timer
+        if timer is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter_ns()
+        result = func(*args, **kwargs)
+        timer.add(phase, time.perf_counter_ns() - start)
+        return result
 
     def sequence_files(
         self, fnames: List[str], config=None, formatter=None
     ) -> List[str]:
         self._setup_config(config)
+        circuit_breaker.start_run()
+        construct_memo.start_run()
+        if self.discover_projects:
+            from sqlfluff_templater_dataform.projects import project_registry
+
+            project_registry.start_run()
+        if self.project_index_path:
+            self._timed("project_index", self.write_project_index, fnames)
+        if self.read_ahead_bytes:
+            from sqlfluff_templater_dataform.readahead import start_read_ahead
+
+            start_read_ahead(fnames, self.read_ahead_bytes)
+        if self.timing_report is not None:
+            self.timing_report.start_run()
+        if self.metrics is not None:
+            self.metrics.start_run()
         return fnames
 
-    @large_file_check
+    def write_project_index(self, fnames: List[str]) -> None:
+        """Index where the models in ``fnames`` are published.
+
+        The index is written to ``project_index_path`` for every process of
+        the run to map (see ``sqlfluff_templater_dataform.index``). With
+        ``discover_projects``, each Dataform project gets its own index of
+        its own files, next to that path.
+        """
+        from sqlfluff_templater_dataform.index import (
+            build_index,
+            read_model_location,
+            write_index,
+        )
+
+        files_by_root = {None: fnames}
+        if self.discover_projects:
+            from sqlfluff_templater_dataform.projects import project_registry
+
+            files_by_root = {}
+            for fname in fnames:
+                root = project_registry.find_root(os.path.dirname(fname) or ".")
+                files_by_root.setdefault(root, []).append(fname)
+        for root, root_fnames in files_by_root.items():
+            entries = []
+            for fname in root_fnames:
+                try:
+                    with open(fname, encoding="utf-8", errors="replace") as f:
+                        location = read_model_location(f.read(), fname)
+                except OSError:
+                    continue
+                if location is not None:
+                    entries.append(location)
+            path = self._project_index_path(root)
+            write_index(path, build_index(entries))
+            templater_logger.info(
+                "Dataform project index of %s files written to %s (%s models with "
+                "their own schema or database).",
+                len(root_fnames), path, len(entries),
+            )
+
+    def _project_index_path(self, root: Optional[str]) -> str:
+        if root is None:
+            return self.project_index_path
+        from sqlfluff_templater_dataform.projects import project_index_path
+
+        return project_index_path(self.project_index_path, root)
+
     def process(
         self,
         *,
@@ -96,21 +381,191 @@ class DataformTemplater(RawTemplater):
         in_str: Optional[str] = None,
         config: Optional["FluffConfig"] = None,
         formatter: Optional["OutputStreamFormatter"] = None,
+    ):
+        try:
+            start = time.perf_counter()
+            result = self._process(
+                fname=fname, in_str=in_str, config=config, formatter=formatter
+            )
+            if self.settings.outlier_profile_dir and in_str:
+                self._profile_outlier(fname, in_str, (time.perf_counter() - start) * 1e3)
+            return result
+        except SQLFluffSkipFile:
+            # large_file_check raises before the config has been read.
+            self._setup_config(config)
+            if self.metrics is not None:
+                self.metrics.inc("skipped_files_total")
+                self.metrics.flush()
+            raise
+
+    def process_with_variants(
+        self,
+        *,
+        in_str: str,
+        fname: str,
+        config: Optional["FluffConfig"] = None,
+        formatter: Optional["OutputStreamFormatter"] = None,
+    ):
+        """Yield the non-incremental rendering, then the incremental one.
+
+        The incremental rendering is only produced for files with a
+        ``${when(incremental(), ...)}``, from the slices of the first, as in
+        ``slice_sqlx_variants``. sqlfluff lints as many variants as its
+        ``render_variant_limit`` setting allows, 1 by default, and asks for
+        the second only when that is raised.
+        """
+        self._last_slicing = None
+        yield self.process(in_str=in_str, fname=fname, config=config, formatter=formatter)
+        last_slicing, self._last_slicing = self._last_slicing, None
+        if last_slicing is None or last_slicing[0] is not in_str:
+            return  # Not sliced, such as an empty file.
+        _, replaced_sql, raw_slices, templated_slices = last_slicing
+        incremental = self._timed(
+            "variants", self.incremental_slices, replaced_sql, raw_slices, templated_slices
+        )
+        if incremental is not None:
+            incremental_sql, incremental_slices = incremental
+            raw_slices, incremental_slices = self._compact(raw_slices, incremental_slices)
+            yield TemplatedFile(
+                source_str=in_str,
+                templated_str=incremental_sql,
+                fname=fname,
+                sliced_file=incremental_slices,
+                raw_sliced=raw_slices,
+            ), []
+
+    @large_file_check
+    def _process(
+        self,
+        *,
+        fname: str,
+        in_str: Optional[str] = None,
+        config: Optional["FluffConfig"] = None,
+        formatter: Optional["OutputStreamFormatter"] = None,
     ):
         if in_str is None:
           return TemplatedFile(source_str='', fname=fname), []
 
+        process_start = time.perf_counter_ns()
         self._setup_config(config)
+        if self.phase_timer is not None:
+            self.phase_timer.add("setup_config", time.perf_counter_ns() - process_start)
+        if self.max_file_size and len(in_str) > self.max_file_size:
+            raise SQLFluffSkipFile(
+                f"Skipping {fname!r}: {len(in_str)} characters is over the "
+                f"dataform templater's max_file_size of {self.max_file_size}. "
+                "Raise it in [sqlfluff:templater:dataform], or set it to 0 to "
+                "template the file anyway."
+            )
+        if self.read_ahead_bytes:
+            from sqlfluff_templater_dataform.readahead import get_read_ahead
 
-        templated_sql, raw_slices, templated_slices = self.slice_sqlx_template(in_str)
+            read_ahead = get_read_ahead()
+            if read_ahead is not None:
+                read_ahead.claim(fname)
+        circuit_breaker.check(fname)
+        project_root = self._use_project(fname) if self.discover_projects else None
+        if self.project_index_path:
+            from sqlfluff_templater_dataform.index import get_project_index
+
+            self.project_index = get_project_index(self._project_index_path(project_root))
+
+        try:
+            templated_sql, raw_slices, templated_slices = self.slice_sqlx_template(in_str)
 
+            templated_file = self._timed(
+                "templated_file",
+                TemplatedFile,
+                source_str=in_str,
+                templated_str=templated_sql,
+                fname=fname,
+                sliced_file=templated_slices,
+                raw_sliced=raw_slices,
+            )
+        except Exception as err:
+            self._record_failure(fname, f"{type(err).__name__}: {err}")
+            raise
+        if self.malformed_fallbacks:
+            self._record_failure(
+                fname,
+                f"{self.malformed_fallbacks} unterminated block(s) or expression(s) "
+                "left as literal SQL",
+            )
+        else:
+            circuit_breaker.record_success()
+        if self.phase_timer is not None:
+            self.phase_timer.finish_file(fname)
+        elapsed_ns = time.perf_counter_ns() - process_start
+        if self.timing_report is not None:
+            self.timing_report.record(
+                fname, elapsed_ns, in_str, raw_slices, self.construct_spans
+            )
+        if self.metrics is not None:
+            self.metrics.inc("files_templated_total")
+            self.metrics.observe_latency(elapsed_ns / 1e9)
+            hits, misses = ref_cache.hits, ref_cache.misses
+            if self.discover_projects:
+                from sqlfluff_templater_dataform.projects import project_registry
+
+                project_hits, project_misses = project_registry.ref_cache_counts()
+                hits, misses = hits + project_hits, misses + project_misses
+            self.metrics.set_cache_stats("ref", hits, misses)
+            self.metrics.set_cache_stats("construct", construct_memo.hits, construct_memo.misses)
+            self.metrics.flush()
+        return templated_file, []
+
+    def _profile_outlier(self, fname: str, in_str: str, elapsed_ms: float) -> None:
+        """Template ``fname`` again under cProfile if it is an outlier.
+
+        See ``sqlfluff_templater_dataform.outliers``. Timers and metrics are
+        off for the profiled pass, so the file is only counted once, and so
+        is the construct memo, which would otherwise serve every construct
+        from the first pass and hide the scans it saves. Refs are resolved
+        through an empty cache of the pass's own, which keeps the pass's
+        lookups out of the run's hit counts.
+        """
+        from sqlfluff_templater_dataform.outliers import dump_profile, is_outlier
+
+        settings = self.settings
+        if not is_outlier(
+            elapsed_ms, len(in_str), settings.outlier_profile_ms, settings.outlier_profile_bytes
+        ):
+            return
+        phase_timer, metrics, memo = self.phase_timer, self.metrics, self.construct_memo
+        refs = self.ref_cache
+        self.phase_timer = self.metrics = self.construct_memo = None
+        self.ref_cache = RefResolutionCache(settings.ref_cache_size)
+        try:
+            path = dump_profile(
+                settings.outlier_profile_dir,
+                fname,
+                settings.outlier_profile_limit,
+                self._template,
+                fname,
+                in_str,
+            )
+        finally:
+            self.phase_timer, self.metrics, self.construct_memo = phase_timer, metrics, memo
+            self.ref_cache = refs
+        if path is not None:
+            templater_logger.info(
+                "Dataform templater: %s took %.1fms for %s characters, profile written to %s",
+                fname, elapsed_ms, len(in_str), path,
+            )
+
+    def _template(self, fname: str, in_str: str) -> TemplatedFile:
+        templated_sql, raw_slices, templated_slices = self.slice_sqlx_template(in_str)
         return TemplatedFile(
             source_str=in_str,
             templated_str=templated_sql,
             fname=fname,
             sliced_file=templated_slices,
             raw_sliced=raw_slices,
-        ), []
+        )
+
+    def _record_failure(self, fname: str, reason: str) -> None:
+        if circuit_breaker.record_failure(fname, reason) and self.metrics is not None:
+            self.metrics.inc("circuit_breaker_trips_total")
 
     def replace_blocks(self, in_str: str) -> str:
         """Remove all Dataform blocks from the SQL string.
@@ -136,11 +591,9 @@ class DataformTemplater(RawTemplater):
         Returns:
             The input string with all Dataform blocks removed
         """
-        block_keywords = ['config', 'pre_operations', 'post_operations', 'js']
-        for keyword in block_keywords:
-            pattern = rf'{re.escape(keyword)}\s*\{{'
+        for pattern in _BLOCK_KEYWORD_REGEXES:
             while True:
-                match = re.search(pattern, in_str)
+                match = pattern.search(in_str)
                 if not match:
                     break
                 start = match.end() - 1  # position of {
@@ -175,15 +628,14 @@ class DataformTemplater(RawTemplater):
             matching brace is found (malformed input)
         """
         brace_count = 0
-        i = start
-        while i < len(sql):
-            if sql[i] == '{':
+        # Hop from brace to brace rather than visiting every character.
+        for brace in _BRACE_REGEX.finditer(sql, start):
+            if brace.group() == '{':
                 brace_count += 1
-            elif sql[i] == '}':
+            else:
                 brace_count -= 1
                 if brace_count == 0:
-                    return i + 1  # include the }
-            i += 1
+                    return brace.end()  # include the }
         return -1  # not found
 
     def find_expression_end(self, sql: str, start: int) -> int:
@@ -209,24 +661,12 @@ class DataformTemplater(RawTemplater):
             The position after the matching closing brace '}', or -1 if no
             matching brace is found (malformed input)
         """
-        brace_count = 0
-        i = start
-        while i < len(sql):
-            if sql[i:i+2] == '${':
-                brace_count += 1
-                i += 1  # skip the $
-            elif sql[i] == '{':
-                brace_count += 1
-            elif sql[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    return i + 1  # include the }
-            i += 1
-        return -1  # not found
+        # A nested ${ opens one level, just like a bare {, so only the
+        # braces themselves need counting.
+        return self.find_block_end(sql, start)
 
     def replace_ref_with_bq_table(self, sql):
         """ A regular expression to handle ref function calls that include spaces. """
-        pattern = re.compile(REF_PATTERN)
         def ref_to_table(match):
             # Extract the content inside ref() using the captured group
             ref_content = match.group(1)  # Use the captured group instead of manual extraction
@@ -237,18 +677,14 @@ class DataformTemplater(RawTemplater):
                 obj_content = ref_content.strip()[1:-1]  # Remove { and }
                 parts = {}
                 
-                # Split by commas and parse each key-value pair
-                for pair in obj_content.split(','):
-                    pair = pair.strip()
+                # Split into key-value pairs and parse each one
+                for start, end in split_arguments(obj_content):
+                    pair = obj_content[start:end]
                     if ':' in pair:
                         # Find the first colon and split
                         colon_pos = pair.find(':')
                         key = pair[:colon_pos].strip()
-                        value = pair[colon_pos + 1:].strip()
-                        # Remove quotes if present
-                        if (value.startswith('"') and value.endswith('"')) or \
-                           (value.startswith("'") and value.endswith("'")):
-                            value = value[1:-1]
+                        value = unquote(pair[colon_pos + 1:].strip())
                         parts[key] = value
                 
                 # Debug: if parsing failed, return original
@@ -256,16 +692,25 @@ class DataformTemplater(RawTemplater):
                     return match.group(0)
                 
                 # Extract values with fallbacks
-                project_id = parts.get('database', self.project_id)
-                dataset = parts.get('schema', self.dataset_id)
                 model_name = parts.get('name', '')
+                if 'schema' in parts:
+                    project_id = parts.get('database', self.project_id)
+                    dataset = parts['schema']
+                else:
+                    project_id, dataset = self._model_location(model_name)
+                    project_id = parts.get('database', project_id)
                 
             else:
                 # Handle variadic arguments: "database", "schema", "name" or "schema", "name" or "name"
-                # Split by commas, trim whitespace, and remove quotes
-                parts = [part.strip().strip('"\'') for part in ref_content.split(',')]
+                # Split into arguments and remove quotes
+                parts = [
+                    ref_content[start:end].strip('"\'')
+                    for start, end in split_arguments(ref_content)
+                ]
                 
-                if len(parts) == 3:
+                if not parts:
+                    return match.group(0)
+                elif len(parts) == 3:
                     # 3 elements: database, schema, name
                     project_id = parts[0]
                     dataset = parts[1]
@@ -278,76 +723,48 @@ class DataformTemplater(RawTemplater):
                 else:
                     # 1 element: name only
                     model_name = parts[0]
-                    dataset = self.dataset_id
-                    project_id = self.project_id
+                    project_id, dataset = self._model_location(model_name)
             
             # Ensure we have a valid model_name
             if not model_name:
                 return match.group(0)  # Return original if no valid name found
             
-            # Sanitize identifiers to ensure they're valid for BigQuery
-            # BigQuery identifiers can contain letters, numbers, and underscores
-            # They must start with a letter or underscore
-            def sanitize_identifier(identifier):
-                if not identifier:
-                    return identifier
-                # Replace invalid characters with underscores
-                sanitized = re.sub(r'[^a-zA-Z0-9_-]', '_', str(identifier))
-                # Ensure it starts with a letter or underscore
-                if sanitized and sanitized[0].isdigit():
-                    sanitized = '_' + sanitized
-                return sanitized
-            
-            project_id = sanitize_identifier(project_id)
-            dataset = sanitize_identifier(dataset)
-            model_name = sanitize_identifier(model_name)
-                
-            result = f"`{project_id}.{dataset}.{model_name}`"
-            return result
+            # Sanitized, interned `project.dataset.table`, shared across files
+            return self.ref_cache.resolve(project_id, dataset, model_name)
+
+        return _REF_REGEX.sub(ref_to_table, sql)
 
-        return re.sub(pattern, ref_to_table, sql)
+    def _model_location(self, model_name: str) -> Tuple[Optional[str], Optional[str]]:
+        """Return the project and dataset a ref to ``model_name`` resolves to.
+
+        Models in the project index keep their own database and schema, and
+        everything else falls back to the configured defaults.
+        """
+        if self.project_index is not None:
+            location = self.project_index.get(model_name)
+            if location is not None:
+                database, schema = location
+                return database or self.project_id, schema or self.dataset_id
+        return self.project_id, self.dataset_id
 
     def replace_self_with_bq_table(self, sql):
         """ A regular expression to handle self function calls. """
-        pattern = re.compile(SELF_PATTERN)
         def self_to_table(match):
             return f"`{self.project_id}.{self.dataset_id}.self`"
 
-        return re.sub(pattern, self_to_table, sql)
+        return _SELF_REGEX.sub(self_to_table, sql)
 
-    def _process_when_content(self, content: str) -> str:
+    def _process_when_content(self, content: str, incremental: bool = False) -> str:
         # Split by comma, but be careful with quoted strings
-        params = []
-        current_param = ''
-        in_backtick = False
-        in_double_quote = False
-        in_single_quote = False
-        paren_depth = 0
-        
-        i = 0
-        while i < len(content):
-            char = content[i]
-            if char == '`' and not in_double_quote and not in_single_quote:
-                in_backtick = not in_backtick
-            elif char == '"' and not in_backtick and not in_single_quote:
-                in_double_quote = not in_double_quote
-            elif char == "'" and not in_backtick and not in_double_quote:
-                in_single_quote = not in_single_quote
-            elif char == '(' and not in_backtick and not in_double_quote and not in_single_quote:
-                paren_depth += 1
-            elif char == ')' and not in_backtick and not in_double_quote and not in_single_quote:
-                paren_depth -= 1
-            elif char == ',' and not in_backtick and not in_double_quote and not in_single_quote and paren_depth == 0:
-                params.append(current_param.strip())
-                current_param = ''
-                i += 1
-                continue
-            current_param += char
-            i += 1
-        
-        if current_param.strip():
-            params.append(current_param.strip())
-        
+        params = [content[start:end] for start, end in split_arguments(content)]
+
+        if incremental and len(params) > 1 and params[0] == 'incremental()':
+            # The value Dataform renders in incremental runs, as SQL.
+            value = params[1]
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '`"\'':
+                value = value[1:-1]
+            return self.replace_js_expressions(value)
+
         # Remove the condition (first parameter)
         if len(params) > 1:
             value_params = params[1:]
@@ -363,38 +780,41 @@ class DataformTemplater(RawTemplater):
             # Multiple value parameters: return the last one (fallback)
             return value_params[-1]
 
-    def replace_incremental_condition(self, sql: str) -> str:
+    def replace_incremental_condition(self, sql: str, incremental: bool = False) -> str:
         """Replace incremental conditions with their fallback values or empty.
         
         This method uses brace-counting to handle when expressions that contain
         nested template literals or function calls.
+
+        With ``incremental``, ``${when(incremental(), ...)}`` is replaced with
+        its value for incremental runs instead, unquoted.
         """
+        # Text between expressions is copied in whole chunks.
         result = []
         i = 0
-        pattern = re.compile(r'\$\{\s*when\(')
-        while i < len(sql):
-            match = pattern.match(sql, i)
-            if match:
-                start_idx = i
-                expr_start = sql.find('{', start_idx)
-                end = self.find_expression_end(sql, expr_start)
-                if end != -1:
-                    match_raw = sql[start_idx:end]
-                    # We need to extract the content inside when(...)
-                    first_paren = sql.find('(', start_idx)
-                    content = match_raw[first_paren - start_idx + 1:]
-                    content = content.rstrip()
-                    if content.endswith('}'):
-                        content = content[:-1].rstrip()
-                    if content.endswith(')'):
-                        content = content[:-1]
-                    
-                    replaced_val = self._process_when_content(content)
-                    result.append(replaced_val)
-                    i = end
-                    continue
-            result.append(sql[i])
-            i += 1
+        for match in _WHEN_START_REGEX.finditer(sql):
+            start_idx = match.start()
+            if start_idx < i:
+                continue  # inside the expression just replaced
+            expr_start = sql.find('{', start_idx)
+            end = self.find_expression_end(sql, expr_start)
+            if end == -1:
+                continue  # unterminated, left as is
+            # We need to extract the content inside when(...)
+            first_paren = sql.find('(', start_idx)
+            content = sql[first_paren + 1:end]
+            content = content.rstrip()
+            if content.endswith('}'):
+                content = content[:-1].rstrip()
+            if content.endswith(')'):
+                content = content[:-1]
+
+            result.append(sql[i:start_idx])
+            result.append(self._process_when_content(content, incremental))
+            i = end
+        if not result:
+            return sql
+        result.append(sql[i:])
         return ''.join(result)
 
     def replace_js_expressions(self, sql: str) -> str:
@@ -402,26 +822,497 @@ class DataformTemplater(RawTemplater):
         
         This method uses brace-counting to properly handle expressions
         with nested braces like ${func({param: 'value'})}.
+
+        With ``context_placeholders``, each placeholder is picked by
+        ``placeholder_for`` from the SQL around it in ``sql``.
         """
+        # Text between expressions is copied in whole chunks, and a lone
+        # expression returns the shared placeholder string itself.
         result = []
         i = 0
-        while i < len(sql):
-            if sql[i:i+2] == '${' and not (
-                sql[i:i+6] == '${ref(' or 
-                sql[i:i+7] == '${self(' or
-                sql[i:i+6] == '${when('
-            ):
+        start = sql.find('${')
+        while start != -1:
+            # ${when(...)} is resolved before this pass, so only ref() and
+            # self() calls are left alone.
+            if not sql.startswith(('${ref(', '${self('), start):
                 # Found a JS expression, find its end
-                expr_start = i + 1  # position of {
-                end = self.find_expression_end(sql, expr_start)
+                end = self.find_expression_end(sql, start + 1)
                 if end != -1:
-                    result.append("js_expression")
+                    if start > i:
+                        result.append(sql[i:start])
+                    result.append(
+                        placeholder_for(sql, start, end) if self.context_placeholders else IDENTIFIER
+                    )
                     i = end
+                    start = sql.find('${', end)
                     continue
-            result.append(sql[i])
-            i += 1
+            start = sql.find('${', start + 1)
+        if not result:
+            return sql
+        if i < len(sql):
+            result.append(sql[i:])
         return ''.join(result)
 
+    def _find_construct(self, kind: str, sql: str, pos: int) -> Optional[Tuple[int, int]]:
+        """Find the first construct of ``kind`` starting at or after ``pos``.
+
+        Returns:
+            A ``(start, end)`` pair, where ``end`` is -1 if the construct is
+            never closed, or None if there is no such construct.
+        """
+        if kind == 'ref' or kind == 'self':
+            match = (_REF_REGEX if kind == 'ref' else _SELF_REGEX).search(sql, pos)
+            return (match.start(), match.end()) if match else None
+        if kind == 'block':
+            match = _BLOCK_START_REGEX.search(sql, pos)
+            if not match:
+                return None
+            return match.start(), self._timed(
+                "blocks", self._construct_end, sql, match.start(), match.end() - 1
+            )
+        if kind == 'when':
+            match = _WHEN_START_REGEX.search(sql, pos)
+            if not match:
+                return None
+            expr_start = sql.find('{', match.start())
+            return match.start(), self._construct_end(sql, match.start(), expr_start)
+        match = _JS_EXPRESSION_START_REGEX.search(sql, pos)
+        if not match:
+            return None
+        return match.start(), self._construct_end(sql, match.start(), match.end() - 1)
+
+    def _comment_at(self, sql: str, idx: int) -> str:
+        """Return the comment ``sql[idx]`` is in, for ``fit_to_width``."""
+        if self._comments is None or self._comments[0] is not sql:
+            self._comments = (sql, _block_comments(sql))
+        return _comment_at(sql, idx, self._comments[1])
+
+    def _construct_end(self, sql: str, start: int, brace: int) -> int:
+        """Return the end of the construct at ``start`` whose first brace is at ``brace``.
+
+        Constructs seen earlier in the run are recognised by their text
+        through the construct memo, and others are brace-counted.
+        """
+        memo = self.construct_memo
+        if memo is not None:
+            end = memo.extent(sql, start)
+            if end is not None:
+                return end
+        end = self.find_block_end(sql, brace)
+        if memo is not None and end != -1:
+            memo.add_extent(sql, start, end)
+        return end
+
+    def iter_slices(self, sql: str) -> Iterator[Tuple[RawFileSlice, TemplatedFileSlice, str]]:
+        """Slice SQLX content lazily, in source order.
+
+        This is the engine behind ``slice_sqlx_template``: each step yields
+        the next raw slice, its templated slice and the templated text for
+        it, so a caller which only needs the leading config block or the
+        first few constructs can stop without the rest of the file being
+        scanned or resolved. Joining the yielded texts gives the templated
+        SQL.
+
+        Constructs are found by ``_iter_constructs``, or for files over
+        ``large_file_threshold`` characters by the linear-time
+        ``_iter_large_file_constructs``. Where two constructs start at the same offset, blocks win
+        over ``${ref()}``, ``${self()}``, ``${when()}`` and plain JS
+        expressions, in that order. A block or expression that is never
+        closed is left as literal SQL and counted in
+        ``malformed_fallbacks`` once the file has been fully sliced. The
+        ``(start, end)`` of every construct found is kept in
+        ``construct_spans``.
+
+        Args:
+            sql: The raw SQLX string to slice
+
+        Yields:
+            ``(raw_slice, templated_slice, templated_text)`` tuples.
+        """
+        self.malformed_fallbacks = 0
+        spans = self.construct_spans = []
+        if '{' not in sql:
+            # Every Dataform construct opens with a brace, so there is
+            # nothing to resolve and the whole file is one literal slice.
+            if self.metrics is not None:
+                self.metrics.inc("fast_path_hits_total")
+            if sql:
+                yield (
+                    RawFileSlice(raw=sql, slice_type='literal', source_idx=0, block_idx=0),
+                    TemplatedFileSlice(
+                        slice_type='literal',
+                        source_slice=slice(0, len(sql)),
+                        templated_slice=slice(0, len(sql)),
+                    ),
+                    sql,
+                )
+            return
+
+        preserve_width = self.preserve_width
+        lint_operations = self.lint_operations
+        malformed_starts = set()
+        if self.large_file_threshold and len(sql) > self.large_file_threshold:
+            constructs = self._iter_large_file_constructs(sql, malformed_starts)
+        else:
+            constructs = self._iter_constructs(sql, malformed_starts)
+        current_idx = 0
+        templated_idx = 0
+        block_idx = 0
+        placeholders = 0
+        # The last templated text with SQL in it, for operations blocks to
+        # tell whether a statement delimiter is needed.
+        previous = ''
+
+        for next_start, next_end in constructs:
+            spans.append((next_start, next_end))
+            operations = lint_operations and _OPERATIONS_START_REGEX.match(sql, next_start)
+            lead_start = next_start
+            if next_start > current_idx:
+                raw = sql[current_idx:next_start]
+                if operations and operations.group(1) == 'post':
+                    # The main query's delimiter goes straight after its SQL,
+                    # so the whitespace before the block is left to it.
+                    raw = raw.rstrip()
+                    lead_start = current_idx + len(raw)
+            else:
+                raw = ''
+            if raw:
+                # Each offset object is shared by the slices either side of
+                # it, which matters for files with tens of thousands of them.
+                templated_end = templated_idx + len(raw)
+                yield (
+                    RawFileSlice(
+                        raw=raw,
+                        slice_type='literal',
+                        source_idx=current_idx,
+                        block_idx=block_idx
+                    ),
+                    TemplatedFileSlice(
+                        slice_type='literal',
+                        source_slice=slice(current_idx, current_idx + len(raw)),
+                        templated_slice=slice(templated_idx, templated_end)
+                    ),
+                    raw,
+                )
+                templated_idx = templated_end
+                block_idx += 1
+                if lint_operations and not raw.isspace():
+                    previous = raw
+
+            match_raw = sql[next_start:next_end]
+            if operations:
+                templated_idx, block_idx, count, previous = yield from self._iter_operations_slices(
+                    sql,
+                    next_start,
+                    next_end,
+                    lead_start,
+                    templated_idx,
+                    block_idx,
+                    malformed_starts,
+                    previous,
+                )
+                placeholders += count
+                current_idx = next_end
+                continue
+
+            replacement, is_placeholder = self._replacement(sql, next_start, next_end)
+            placeholders += is_placeholder
+
+            if preserve_width:
+                replacement = fit_to_width(
+                    replacement, match_raw, self._comment_at(sql, next_start)
+                )
+            templated_end = templated_idx + len(replacement)
+            yield (
+                RawFileSlice(
+                    raw=match_raw,
+                    slice_type='templated',
+                    source_idx=next_start,
+                    block_idx=block_idx
+                ),
+                TemplatedFileSlice(
+                    slice_type='templated',
+                    source_slice=slice(next_start, next_end),
+                    templated_slice=slice(templated_idx, templated_end)
+                ),
+                replacement,
+            )
+            templated_idx = templated_end
+            if lint_operations and replacement and not replacement.isspace():
+                previous = replacement
+
+            current_idx = next_end
+            block_idx += 1
+
+        if current_idx < len(sql):
+            raw = sql[current_idx:]
+            yield (
+                RawFileSlice(
+                    raw=raw,
+                    slice_type='literal',
+                    source_idx=current_idx,
+                    block_idx=block_idx
+                ),
+                TemplatedFileSlice(
+                    slice_type='literal',
+                    source_slice=slice(current_idx, len(sql)),
+                    templated_slice=slice(templated_idx, templated_idx + len(raw))
+                ),
+                raw,
+            )
+
+        self.malformed_fallbacks = len(malformed_starts)
+        if self.metrics is not None:
+            self.metrics.inc("placeholder_substitutions_total", placeholders)
+            self.metrics.inc("malformed_block_fallbacks_total", self.malformed_fallbacks)
+
+    def _replacement(self, sql: str, start: int, end: int) -> Tuple[str, bool]:
+        """Return the templated text of the construct at ``sql[start:end]``.
+
+        Returns:
+            The replacement, and whether it is a JS expression placeholder.
+        """
+        match_raw = sql[start:end]
+        is_placeholder = False
+        # Dispatch on the construct that BEGINS the matched block. A
+        # ${when(...)} block can wrap ${self()} / ${ref()}; substring
+        # checks ('self(' in match_raw) would mis-route to the inner
+        # construct's branch and consume the entire outer block under
+        # the wrong replacement, breaking templated-slice lengths.
+        if _REF_START_REGEX.match(match_raw):
+            replacement = self._timed("ref", self.replace_ref_with_bq_table, match_raw)
+        elif _SELF_START_REGEX.match(match_raw):
+            replacement = self._timed("self", self.replace_self_with_bq_table, match_raw)
+        elif _WHEN_START_REGEX.match(match_raw):
+            replacement = self._when_replacement(match_raw)
+        elif match_raw.startswith('${') and "when(" not in match_raw and 'ref(' not in match_raw and 'self(' not in match_raw:
+            if self.context_placeholders:
+                replacement = self._timed("js_expressions", placeholder_for, sql, start, end)
+            else:
+                replacement = self._memoized(
+                    ('js', match_raw), "js_expressions", self.replace_js_expressions, match_raw
+                )
+            if self.preserve_width and replacement == IDENTIFIER and '\n' not in match_raw:
+                # Size the placeholder itself: a single identifier token
+                # of exactly the expression's width. One over several lines
+                # is padded as other replacements are, to keep its newlines.
+                replacement = replacement[:len(match_raw)].ljust(len(match_raw), '_')
+            is_placeholder = True
+        else:
+            # This is for blocks (config, pre_operations, post_operations, js)
+            replacement = ''
+        return replacement, is_placeholder
+
+    def _when_replacement(self, match_raw: str, incremental: bool = False) -> str:
+        """Return the templated text of a ``${when()}`` expression."""
+        key = (
+            'when', match_raw, incremental, self.context_placeholders,
+            self.project_id, self.dataset_id, self.project_index,
+        )
+        return self._memoized(key, "when", self._resolve_when, match_raw, incremental)
+
+    def _resolve_when(self, match_raw: str, incremental: bool) -> str:
+        # Resolve nested ${self()} / ${ref()} first — INCREMENTAL_CONDITION_PATTERN
+        # is non-greedy and would otherwise close the match at the inner `)}`.
+        pre = self.replace_ref_with_bq_table(self.replace_self_with_bq_table(match_raw))
+        return self.replace_incremental_condition(pre, incremental)
+
+    def _memoized(self, key, phase: str, func, *args) -> str:
+        """Return ``func(*args)``, through the construct memo under ``key``."""
+        memo = self.construct_memo
+        if memo is None:
+            return self._timed(phase, func, *args)
+        replacement = memo.replacement(key)
+        if replacement is None:
+            replacement = self._timed(phase, func, *args)
+            memo.add_replacement(key, replacement)
+        return replacement
+
+    def _iter_operations_slices(
+        self,
+        sql: str,
+        start: int,
+        end: int,
+        lead_start: int,
+        templated_idx: int,
+        block_idx: int,
+        malformed_starts: Set[int],
+        previous: str,
+    ):
+        """Yield the slices of a ``pre_operations`` or ``post_operations`` block.
+
+        With the ``lint_operations`` setting, the SQL inside the braces is
+        kept as literal slices, with its own constructs templated as in the
+        main query. The keyword and opening brace are a ``block_start``
+        slice and the closing brace a ``block_end`` one, both empty, so
+        sqlfluff expects the body indented one level, as inside a Jinja
+        block. A statement delimiter (``;``) separates the operations from
+        the main query: an empty source slice straight after the last SQL
+        before it, so it ends that statement's line. The delimiter is left
+        out where that SQL already ends with one, or there is no SQL before
+        it, so no empty statement is added.
+
+        With ``preserve_width``, the keyword and braces are plain templated
+        slices instead, padded as any other replacement.
+
+        Args:
+            lead_start: Where the whitespace before the block starts, for
+                the delimiter of a ``post_operations`` block.
+            previous: The last templated text with SQL in it before the block.
+
+        Returns:
+            The templated offset and block index after the block, the number
+            of JS expression placeholders used, and the last templated text
+            with SQL in it.
+        """
+        body_start = sql.index('{', start) + 1
+        body_end = end - 1
+        delimiter_first = sql.startswith('post', start)
+        body = sql[body_start:body_end].rstrip()
+        body_stop = body_start + len(body)
+        if self.preserve_width:
+            start_type, end_type = 'templated', 'templated'
+        else:
+            start_type, end_type = 'block_start', 'block_end'
+        body_malformed_starts = set()
+        if self.large_file_threshold and len(body) > self.large_file_threshold:
+            constructs = self._iter_large_file_constructs(body, body_malformed_starts)
+        else:
+            constructs = self._iter_constructs(body, body_malformed_starts)
+        # (slice type, source start, source end, templated text)
+        pieces = []
+        if delimiter_first:
+            if _delimiter_after(previous):
+                pieces.append(['templated', lead_start, lead_start, ';'])
+                previous = ';'
+            if lead_start < start:
+                pieces.append(['literal', lead_start, start, sql[lead_start:start]])
+        pieces.append([start_type, start, body_start, ''])
+        current_idx = body_start
+        placeholders = 0
+        for construct_start, construct_end in constructs:
+            construct_start += body_start
+            construct_end += body_start
+            if construct_start > current_idx:
+                pieces.append(
+                    ['literal', current_idx, construct_start, sql[current_idx:construct_start]]
+                )
+            replacement, is_placeholder = self._replacement(sql, construct_start, construct_end)
+            placeholders += is_placeholder
+            pieces.append(['templated', construct_start, construct_end, replacement])
+            current_idx = construct_end
+        if body_stop > current_idx:
+            pieces.append(['literal', current_idx, body_stop, sql[current_idx:body_stop]])
+        malformed_starts.update(body_start + idx for idx in body_malformed_starts)
+        for piece in pieces:
+            if piece[3] and not piece[3].isspace():
+                previous = piece[3]
+        if not delimiter_first and _delimiter_after(previous):
+            pieces.append(['templated', body_stop, body_stop, ';'])
+            previous = ';'
+        if body_end > body_stop:
+            pieces.append(['literal', body_stop, body_end, sql[body_stop:body_end]])
+        pieces.append([end_type, body_end, end, ''])
+
+        for slice_type, source_start, source_end, text in pieces:
+            raw = sql[source_start:source_end]
+            if self.preserve_width and slice_type == 'templated':
+                text = fit_to_width(text, raw, self._comment_at(sql, source_start))
+            templated_end = templated_idx + len(text)
+            yield (
+                RawFileSlice(
+                    raw=raw, slice_type=slice_type, source_idx=source_start, block_idx=block_idx
+                ),
+                TemplatedFileSlice(
+                    slice_type=slice_type,
+                    source_slice=slice(source_start, source_end),
+                    templated_slice=slice(templated_idx, templated_end),
+                ),
+                text,
+            )
+            templated_idx = templated_end
+            block_idx += 1
+        return templated_idx, block_idx, placeholders, previous
+
+    def _iter_constructs(self, sql: str, malformed_starts: Set[int]) -> Iterator[Tuple[int, int]]:
+        """Yield the ``(start, end)`` of each construct to template, in order.
+
+        The next occurrence of each kind of construct is kept, and only
+        searched for again once the slicing has moved past it, so every
+        search starts at an offset into ``sql`` instead of a copy of its
+        remainder. Starts of unterminated constructs are added to
+        ``malformed_starts``.
+        """
+        # The next construct of each kind, in _CONSTRUCT_KINDS order. A start
+        # of -1 means not searched yet and None that the kind does not occur
+        # again.
+        upcoming: List[Optional[Tuple[int, int]]] = [(-1, -1)] * len(_CONSTRUCT_KINDS)
+        current_idx = 0
+        while current_idx < len(sql):
+            next_start = next_end = None
+            for i, kind in enumerate(_CONSTRUCT_KINDS):
+                candidate = upcoming[i]
+                if candidate is not None and candidate[0] < current_idx:
+                    candidate = upcoming[i] = self._find_construct(kind, sql, current_idx)
+                    if candidate is not None and candidate[1] == -1:
+                        malformed_starts.add(candidate[0])
+                if candidate is None or candidate[1] == -1:
+                    continue  # absent or unterminated, skip
+                if next_start is None or candidate[0] < next_start:
+                    next_start, next_end = candidate
+            if next_start is None:
+                return
+            yield next_start, next_end
+            current_idx = next_end
+
+    def _iter_large_file_constructs(self, sql: str, malformed_starts: Set[int]) -> Iterator[Tuple[int, int]]:
+        """Yield the constructs of a file over ``large_file_threshold``.
+
+        One pass over the braces and construct openers pairs every opener
+        with its closing brace, then the outermost constructs are yielded in
+        order, so the cost is linear in the size of the file whatever its
+        nesting, and only the constructs' offsets are held. ``${ref()}`` and
+        ``${self()}`` are matched within the braces of their expression. On
+        well-formed files this yields the same constructs as
+        ``_iter_constructs``; an unterminated opener is added to
+        ``malformed_starts`` and scanning goes on right after it.
+        """
+        openers = []
+        ends = {}
+        stack = []
+        for token in _LARGE_FILE_TOKEN_REGEX.finditer(sql):
+            text = token.group()
+            if text == '}':
+                if stack:
+                    open_idx = stack.pop()
+                    if open_idx is not None:
+                        ends[open_idx] = token.end()
+            elif text == '{':
+                stack.append(None)
+            else:
+                stack.append(len(openers))
+                openers.append(token.start())
+        del stack
+
+        current_idx = 0
+        for i, start in enumerate(openers):
+            if start < current_idx:
+                continue  # inside the construct just yielded
+            end = ends.get(i)
+            if end is None:
+                malformed_starts.add(start)
+                continue
+            if sql.startswith('${', start):
+                # ref() and self() end where their regex does, like the
+                # main scanner, but never past the expression's brace.
+                for regex in (_REF_REGEX, _SELF_REGEX):
+                    match = regex.match(sql, start, end)
+                    if match:
+                        end = match.end()
+                        break
+            yield start, end
+            current_idx = end
+
     def slice_sqlx_template(self, sql: str) -> Tuple[str, List[RawFileSlice], List[TemplatedFileSlice]]:
         """Slice SQLX content into raw and templated components.
 
@@ -437,9 +1328,24 @@ class DataformTemplater(RawTemplater):
         original source file. For blocks with deeply nested braces, the brace-counting
         algorithm in find_block_end() ensures accurate block boundary detection.
 
-        The method processes patterns in order of specificity, ensuring that nested
-        expressions within blocks are handled correctly. Block detection uses
-        brace-counting rather than regex recursion to support unlimited nesting depths.
+        The slices come from ``iter_slices``, and the templated SQL is the
+        concatenation of their templated text, so it always agrees with the
+        templated slices.
+
+        With the ``preserve_width`` setting, every replacement keeps the width
+        and line count of its source where possible: JS placeholders are sized
+        to the expression, and other replacements (including the empty output
+        of blocks) are padded with a comment laid out like the source. Templated
+        offsets then equal source offsets everywhere except after a construct
+        whose replacement cannot shrink, such as a table name longer than its
+        ``${ref()}``, so positions map 1:1 for most of the file.
+
+        With the ``compact_slices`` setting, neighbouring slices are merged
+        wherever the mapping stays exact (see ``merge_adjacent_slices``).
+
+        The ``engine`` setting selects another slicer, such as ``legacy``, the
+        original implementation kept to check new engines against (see
+        ``sqlfluff_templater_dataform.engines``).
 
         Args:
             sql: The raw SQLX string to slice
@@ -450,205 +1356,117 @@ class DataformTemplater(RawTemplater):
             - raw_slices: List of RawFileSlice objects representing source segments
             - templated_slices: List of TemplatedFileSlice objects for mapping
         """
-        replaced_sql = self.replace_blocks(sql)
-        replaced_sql = self.replace_self_with_bq_table(replaced_sql)
-        replaced_sql = self.replace_ref_with_bq_table(replaced_sql)
-        replaced_sql = self.replace_incremental_condition(replaced_sql)
-        replaced_sql = self.replace_js_expressions(replaced_sql)
-
-        # Block keywords that start blocks
-        block_keywords = ['config', 'pre_operations', 'post_operations', 'js']
-
-        # A regular expression pattern that matches the structure of SQLX.
-        patterns = [
-            (CONFIG_BLOCK_PATTERN, 'templated'),
-            (PRE_OPERATION_BLOCK_PATTERN, 'templated'),
-            (POST_OPERATION_BLOCK_PATTERN, 'templated'),
-            (JS_BLOCK_PATTERN, 'templated'),
-            (REF_PATTERN, 'templated'),
-            (SELF_PATTERN, 'templated'),
-            (INCREMENTAL_CONDITION_PATTERN, 'templated'),
-            (JS_EXPRESSION_PATTERN_IN_SQL, 'templated'), # Add this line
-        ]
-
-        raw_slices = []
-        templated_slices = []
-        current_idx = 0
-        templated_idx = 0
-        block_idx = 0
+        replaced_sql, raw_slices, templated_slices = self._slice(sql)
+        return (replaced_sql, *self._compact(raw_slices, templated_slices))
 
-        while current_idx < len(sql):
-            next_match = None
-            next_match_type = 'templated'
-            next_match_start = None
-            next_match_end = None
-
-            for pattern, match_type in patterns:
-                if pattern in [CONFIG_BLOCK_PATTERN, PRE_OPERATION_BLOCK_PATTERN, POST_OPERATION_BLOCK_PATTERN, JS_BLOCK_PATTERN]:
-                    # Special handling for blocks: find start, then find matching }
-                    start_pattern = r'(config|pre_operations|post_operations|js)\s*\{'
-                    match = re.search(start_pattern, sql[current_idx:])
-                    if match and match.group(1) in block_keywords:
-                        match_start = current_idx + match.start()
-                        brace_start = current_idx + match.end() - 1  # position of {
-                        end = self.find_block_end(sql, brace_start)
-                        if end != -1:
-                            match_end = end
-                        else:
-                            continue  # invalid block, skip
-                    else:
-                        continue
-                elif pattern == INCREMENTAL_CONDITION_PATTERN:
-                    # Special handling for incremental conditions: find ${when(, then find matching }
-                    match = re.search(r'\$\{\s*when\(', sql[current_idx:])
-                    if match:
-                        match_start = current_idx + match.start()
-                        expr_start = sql.find('{', match_start)
-                        end = self.find_expression_end(sql, expr_start)
-                        if end != -1:
-                            match_end = end
-                        else:
-                            continue  # invalid expression, skip
-                    else:
-                        continue
-                elif pattern == JS_EXPRESSION_PATTERN_IN_SQL:
-                    # Special handling for JavaScript expressions: find ${, then find matching }
-                    match = re.search(r'\$\{', sql[current_idx:])
-                    if match:
-                        match_start = current_idx + match.start()
-                        expr_start = current_idx + match.end() - 1  # position of {
-                        end = self.find_expression_end(sql, expr_start)
-                        if end != -1:
-                            match_end = end
-                        else:
-                            continue  # invalid expression, skip
-                    else:
-                        continue
-                else:
-                    match = re.search(pattern, sql[current_idx:])
-                    if match:
-                        match_start = current_idx + match.start()
-                        match_end = current_idx + match.end()
-                    else:
-                        continue
-
-                if not next_match or match_start < next_match_start:
-                    next_match = match
-                    next_match_type = match_type
-                    next_match_start = match_start
-                    next_match_end = match_end
-
-            if not next_match:
-                raw_slices.append(RawFileSlice(
-                    raw=sql[current_idx:],
-                    slice_type='literal',
-                    source_idx=current_idx,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type='literal',
-                    source_slice=slice(current_idx, len(sql)),
-                    templated_slice=slice(templated_idx, templated_idx + len(sql) - current_idx)
-                ))
-                break
+    def slice_sqlx_table(self, sql: str) -> SliceTable:
+        """Slice SQLX content into a compact ``SliceTable``.
 
-            if next_match_start > current_idx:
-                raw_slices.append(RawFileSlice(
-                    raw=sql[current_idx:next_match_start],
-                    slice_type='literal',
-                    source_idx=current_idx,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type='literal',
-                    source_slice=slice(current_idx, next_match_start),
-                    templated_slice=slice(templated_idx, templated_idx + (next_match_start - current_idx))
-                ))
-                templated_idx += (next_match_start - current_idx)
-                block_idx += 1
+        The table holds the same slicing as ``slice_sqlx_template`` in a few
+        arrays, for caching or sending between processes, and builds the
+        ``TemplatedFile`` on demand.
+        """
+        return self._timed("slice_table", SliceTable.from_slices, sql, *self.slice_sqlx_template(sql))
 
-            match_raw = sql[next_match_start:next_match_end]
+    def slice_sqlx_variants(
+        self, sql: str
+    ) -> Iterator[Tuple[str, List[RawFileSlice], List[TemplatedFileSlice]]]:
+        """Slice SQLX content into each variant it renders to.
 
-            # Dispatch on the construct that BEGINS the matched block. A
-            # ${when(...)} block can wrap ${self()} / ${ref()}; substring
-            # checks ('self(' in match_raw) would mis-route to the inner
-            # construct's branch and consume the entire outer block under
-            # the wrong replacement, breaking templated-slice lengths.
-            if next_match_type == 'templated' and re.match(r'\$\{\s*ref\(', match_raw):
-                ref_replaced = self.replace_ref_with_bq_table(match_raw)
-                raw_slices.append(RawFileSlice(
-                    raw=match_raw,
-                    slice_type='templated',
-                    source_idx=next_match_start,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type=next_match_type,
-                    source_slice=slice(next_match_start, next_match_end),
-                    templated_slice=slice(templated_idx, templated_idx + len(ref_replaced))
-                ))
-                templated_idx += len(ref_replaced)
-            elif next_match_type == 'templated' and re.match(r'\$\{\s*self\(', match_raw):
-                self_replaced = self.replace_self_with_bq_table(match_raw)
-                raw_slices.append(RawFileSlice(
-                    raw=match_raw,
-                    slice_type='templated',
-                    source_idx=next_match_start,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type=next_match_type,
-                    source_slice=slice(next_match_start, next_match_end),
-                    templated_slice=slice(templated_idx, templated_idx + len(self_replaced))
-                ))
-                templated_idx += len(self_replaced)
-            elif next_match_type == 'templated' and re.match(r'\$\{\s*when\(', match_raw):
-                # Resolve nested ${self()} / ${ref()} first — INCREMENTAL_CONDITION_PATTERN
-                # is non-greedy and would otherwise close the match at the inner `)}`.
-                # Mirrors the global pass order in slice_sqlx_template above.
-                pre = self.replace_ref_with_bq_table(self.replace_self_with_bq_table(match_raw))
-                when_replaced = self.replace_incremental_condition(pre)
-                raw_slices.append(RawFileSlice(
-                    raw=match_raw,
-                    slice_type='templated',
-                    source_idx=next_match_start,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type=next_match_type,
-                    source_slice=slice(next_match_start, next_match_end),
-                    templated_slice=slice(templated_idx, templated_idx + len(when_replaced))
-                ))
-                templated_idx += len(when_replaced)
-            elif next_match_type == 'templated' and match_raw.startswith('${') and "when(" not in match_raw and 'ref(' not in match_raw and 'self(' not in match_raw:
-                js_replaced = self.replace_js_expressions(match_raw)
-                raw_slices.append(RawFileSlice(
-                    raw=match_raw,
-                    slice_type='templated',
-                    source_idx=next_match_start,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type=next_match_type,
-                    source_slice=slice(next_match_start, next_match_end),
-                    templated_slice=slice(templated_idx, templated_idx + len(js_replaced))
-                ))
-                templated_idx += len(js_replaced)
-            else:
-                # This is for blocks (config, pre_operations, post_operations, js)
-                raw_slices.append(RawFileSlice(
-                    raw=match_raw,
-                    slice_type=next_match_type,
-                    source_idx=next_match_start,
-                    block_idx=block_idx
-                ))
-                templated_slices.append(TemplatedFileSlice(
-                    slice_type=next_match_type,
-                    source_slice=slice(next_match_start, next_match_end),
-                    templated_slice=slice(templated_idx, templated_idx)
-                ))
-
-            current_idx = next_match_end
-            block_idx += 1
+        The first variant is the non-incremental rendering returned by
+        ``slice_sqlx_template``. If the file has a ``${when(incremental(),
+        ...)}`` whose incremental value differs, the incremental rendering
+        follows. It is derived from the first variant's slices, not from
+        another scan of the file: only the ``${when()}`` slices are rendered
+        again and the other slices are shifted, so it is computed only if
+        it is asked for.
+        """
+        replaced_sql, raw_slices, templated_slices = self._slice(sql)
+        yield (replaced_sql, *self._compact(raw_slices, templated_slices))
+        incremental = self._timed(
+            "variants", self.incremental_slices, replaced_sql, raw_slices, templated_slices
+        )
+        if incremental is not None:
+            incremental_sql, incremental_slices = incremental
+            yield (incremental_sql, *self._compact(raw_slices, incremental_slices))
+
+    def incremental_slices(
+        self,
+        replaced_sql: str,
+        raw_slices: List[RawFileSlice],
+        templated_slices: List[TemplatedFileSlice],
+    ) -> Optional[Tuple[str, List[TemplatedFileSlice]]]:
+        """Rewrite a non-incremental slicing into the incremental one.
 
+        The raw slices are unchanged, so only the templated SQL and slices
+        are returned, or None if no ``${when()}`` renders differently.
+        """
+        pieces = []
+        new_slices = []
+        changed = False
+        templated_idx = 0
+        for raw_slice, templated_slice in zip(raw_slices, templated_slices):
+            text = replaced_sql[templated_slice.templated_slice]
+            if templated_slice.slice_type == 'templated' and _WHEN_START_REGEX.match(raw_slice.raw):
+                replacement = self._when_replacement(raw_slice.raw, incremental=True)
+                if self.preserve_width:
+                    replacement = fit_to_width(
+                        replacement,
+                        raw_slice.raw,
+                        self._comment_at(replaced_sql, templated_slice.templated_slice.start),
+                    )
+                if replacement != text:
+                    text = replacement
+                    changed = True
+            templated_end = templated_idx + len(text)
+            if templated_slice.templated_slice != slice(templated_idx, templated_end):
+                templated_slice = TemplatedFileSlice(
+                    slice_type=templated_slice.slice_type,
+                    source_slice=templated_slice.source_slice,
+                    templated_slice=slice(templated_idx, templated_end),
+                )
+            pieces.append(text)
+            new_slices.append(templated_slice)
+            templated_idx = templated_end
+        if not changed:
+            return None
+        return ''.join(pieces), new_slices
+
+    def _slice(self, sql: str) -> Tuple[str, List[RawFileSlice], List[TemplatedFileSlice]]:
+        timer = self.phase_timer
+        if timer is not None:
+            slicing_start = time.perf_counter_ns()
+            nested_start = timer.current_total()
+
+        if self.engine == "scan":
+            raw_slices = []
+            templated_slices = []
+            pieces = []
+            for raw_slice, templated_slice, text in self.iter_slices(sql):
+                raw_slices.append(raw_slice)
+                templated_slices.append(templated_slice)
+                pieces.append(text)
+            replaced_sql = ''.join(pieces)
+        else:
+            from sqlfluff_templater_dataform.engines import ENGINES
+
+            replaced_sql, raw_slices, templated_slices = ENGINES[self.engine](self, sql)
+            self.construct_spans = [
+                (s.source_slice.start, s.source_slice.stop)
+                for s in templated_slices
+                if s.slice_type != 'literal'
+            ]
+
+        if timer is not None:
+            # Resolution phases timed inside the scan are not counted twice.
+            nested = timer.current_total() - nested_start
+            timer.add("slicing", time.perf_counter_ns() - slicing_start - nested)
+        self._last_slicing = (sql, replaced_sql, raw_slices, templated_slices)
         return replaced_sql, raw_slices, templated_slices
+
+    def _compact(
+        self, raw_slices: List[RawFileSlice], templated_slices: List[TemplatedFileSlice]
+    ) -> Tuple[List[RawFileSlice], List[TemplatedFileSlice]]:
+        if not self.compact_slices:
+            return raw_slices, templated_slices
+        return self._timed("compaction", merge_adjacent_slices, raw_slices, templated_slices)
@@ -0,0 +1,64 @@
+"""Tests for the shared argument tokenizer."""
+from pytest import mark
+
+from sqlfluff_templater_dataform.arguments import split_arguments, unquote
+
+
+def _split(text):
+    return [text[start:end] for start, end in split_arguments(text)]
+
+
+@mark.parametrize(
+    "text, expected",
+    [
+        ("", []),
+        ("'a'", ["'a'"]),
+        ("  'a' ,  \"b\"  ", ["'a'", '"b"']),
+        ("'a,b', 'c'", ["'a,b'", "'c'"]),
+        ('"a\\",b", c', ['"a\\",b"', "c"]),
+        ("incremental(), `x, y`, `f(1, 2)`", ["incremental()", "`x, y`", "`f(1, 2)`"]),
+        ("f(a, b), [1, 2], {k: 1, j: 2}", ["f(a, b)", "[1, 2]", "{k: 1, j: 2}"]),
+        ("a, ", ["a"]),
+        ("a, , b", ["a", "", "b"]),
+        ("'unterminated, x", ["'unterminated, x"]),
+    ],
+)
+def test_split_arguments(text, expected):
+    assert _split(text) == expected
+
+
+def test_split_arguments_returns_offsets_and_is_memoized():
+    text = "incremental(), `WHERE a > 1`"
+    spans = split_arguments(text)
+    assert spans == ((0, 13), (15, 28))
+    assert split_arguments(text) is spans
+
+
+def test_unquote():
+    assert unquote("'a'") == "a"
+    assert unquote('"a"') == "a"
+    assert unquote("`a`") == "`a`"
+    assert unquote("'a\"") == "'a\""
+    assert unquote("'") == "'"
+
+
+def test_variadic_ref_with_quoted_comma(templater):
+    content = "'p', 'my,ds', 'tbl'"
+    assert _split(content) == ["'p'", "'my,ds'", "'tbl'"]
+    # The comma stays part of the dataset, which is then sanitized.
+    sql = f"SELECT * FROM ${{ref({content})}}"
+    assert templater.replace_ref_with_bq_table(sql) == (
+        "SELECT * FROM `p.my_ds.tbl`"
+    )
+
+
+def test_object_ref_with_quoted_comma(templater):
+    sql = "SELECT * FROM ${ref({ schema: 'a,b', name: 'tbl' })}"
+    assert templater.replace_ref_with_bq_table(sql) == (
+        "SELECT * FROM `my_project.a_b.tbl`"
+    )
+
+
+def test_when_with_commas_inside_template_literal(templater):
+    content = "incremental(), `WHERE a IN (1, 2)`, `WHERE b IN (3, 4)`"
+    assert templater._process_when_content(content) == "`WHERE b IN (3, 4)`"
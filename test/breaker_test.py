@@ -0,0 +1,87 @@
+"""Tests for the templating circuit breaker."""
+import logging
+
+import pytest
+from sqlfluff.core import FluffConfig
+from sqlfluff.core.errors import SQLFluffSkipFile
+
+from sqlfluff_templater_dataform.breaker import CircuitBreaker
+
+
+MALFORMED = "config { type: \"table\"\nSELECT 1\n"
+VALID = "SELECT * FROM ${ref('t')}\n"
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker()
+    monkeypatch.setattr("sqlfluff_templater_dataform.templater.circuit_breaker", breaker)
+    return breaker
+
+
+def _config(**settings):
+    return FluffConfig(
+        configs={"templater": {"dataform": settings}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+
+
+def test_breaker_opens_after_consecutive_failures(breaker, caplog):
+    config = _config(sequential_fail_limit=2)
+    templater = config.get_templater()
+    templater.sequence_files(["a.sqlx", "b.sqlx", "c.sqlx", "d.sqlx"], config=config)
+
+    with caplog.at_level(logging.WARNING, logger="sqlfluff.templater"):
+        templater.process(fname="a.sqlx", in_str=MALFORMED, config=config)
+        templater.process(fname="b.sqlx", in_str=MALFORMED, config=config)
+        for fname in ("c.sqlx", "d.sqlx"):
+            with pytest.raises(SQLFluffSkipFile, match="2 consecutive templating failures"):
+                templater.process(fname=fname, in_str=VALID, config=config)
+
+    warnings = [r for r in caplog.records if "consecutive files failed" in r.getMessage()]
+    assert len(warnings) == 1
+    assert "a.sqlx: 1 unterminated block(s) or expression(s)" in warnings[0].getMessage()
+    assert breaker.skipped == 2
+
+    # A new run starts with the breaker closed.
+    templater.sequence_files(["c.sqlx"], config=config)
+    templated_file, _ = templater.process(fname="c.sqlx", in_str=VALID, config=config)
+    assert templated_file.templated_str == "SELECT * FROM `None.None.t`\n"
+
+
+def test_success_resets_the_count(breaker):
+    config = _config(sequential_fail_limit=2)
+    templater = config.get_templater()
+    templater.sequence_files([], config=config)
+    for in_str in (MALFORMED, VALID, MALFORMED, VALID, MALFORMED):
+        templater.process(fname="model.sqlx", in_str=in_str, config=config)
+    assert not breaker.is_open
+    assert breaker.failures == 1
+
+
+def test_exceptions_count_as_failures(breaker, monkeypatch):
+    config = _config(sequential_fail_limit=1)
+    templater = config.get_templater()
+    templater.sequence_files([], config=config)
+
+    def explode(sql):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(templater, "slice_sqlx_template", explode)
+    with pytest.raises(ValueError):
+        templater.process(fname="a.sqlx", in_str=VALID, config=config)
+    with pytest.raises(SQLFluffSkipFile):
+        templater.process(fname="b.sqlx", in_str=VALID, config=config)
+
+
+@pytest.mark.parametrize("limit, sequenced", [(0, True), (1, False)])
+def test_breaker_disabled_or_unarmed(breaker, limit, sequenced):
+    """A zero limit disables the breaker, and it only arms within a run."""
+    config = _config(sequential_fail_limit=limit)
+    templater = config.get_templater()
+    if sequenced:
+        templater.sequence_files([], config=config)
+    for _ in range(3):
+        templater.process(fname="model.sqlx", in_str=MALFORMED, config=config)
+    templater.process(fname="model.sqlx", in_str=VALID, config=config)
+    assert not breaker.is_open
@@ -0,0 +1,44 @@
+"""Tests for the sqlfluff-dataform-compile script."""
+import json
+
+from sqlfluff_templater_dataform.compile import main
+
+SETTINGS = """\
+[sqlfluff]
+templater = dataform
+dialect = bigquery
+
+[sqlfluff:templater:dataform]
+project_id = proj
+dataset_id = ds
+max_file_size = 200
+"""
+
+
+def test_compile_writes_jsonl_in_file_order(tmp_path, monkeypatch, capsys):
+    (tmp_path / ".sqlfluff").write_text(SETTINGS)
+    models = tmp_path / "models"
+    (models / "sub").mkdir(parents=True)
+    (models / "a.sqlx").write_text('config { type: "view" }\nSELECT * FROM ${ref("t")}\n')
+    (models / "b.sqlx").write_text("SELECT 1\n" + "-- padding\n" * 50)
+    (models / "sub" / "c.sqlx").write_text("SELECT ${self()}.x\n")
+    # A nested config file applies to the files under it, as in sqlfluff lint.
+    (models / "sub" / ".sqlfluff").write_text("[sqlfluff:templater:dataform]\ndataset_id = sub_ds\n")
+    (models / "notes.md").write_text("not a model")
+    monkeypatch.chdir(tmp_path)
+
+    assert main(["models", "-o", "out.jsonl", "--processes", "2", "--chunksize", "1"]) == 0
+
+    records = [json.loads(line) for line in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert [r["fname"] for r in records] == [
+        "models/a.sqlx", "models/b.sqlx", "models/sub/c.sqlx"
+    ]
+    first = records[0]
+    assert first["templated_sql"] == "\nSELECT * FROM `proj.ds.t`\n"
+    for slice_type, src_start, src_stop, tmpl_start, tmpl_stop in first["slices"]:
+        if slice_type == "literal":
+            source = (models / "a.sqlx").read_text()
+            assert source[src_start:src_stop] == first["templated_sql"][tmpl_start:tmpl_stop]
+    assert "max_file_size" in records[1]["skipped"]
+    assert records[2]["templated_sql"] == "SELECT `proj.sub_ds.self`.x\n"
+    assert "Compiled 3 files" in capsys.readouterr().err
@@ -0,0 +1,126 @@
+"""Differential tests between the slicing engines."""
+from pathlib import Path
+
+import pytest
+from hypothesis import given, settings, strategies as st
+from sqlfluff.core import FluffConfig
+from sqlfluff.core.errors import SQLFluffUserError
+
+from sqlfluff_templater_dataform.engines import compare_engines, is_self_consistent, legacy_engine, main
+
+REPO_ROOT = Path(__file__).parent.parent
+CORPUS = sorted(
+    list((REPO_ROOT / "monkey_test_definitions").rglob("*.sqlx"))
+    + list((REPO_ROOT / "test" / "test_inputs").rglob("*.sqlx"))
+)
+
+FRAGMENTS = [
+    "SELECT a, b FROM ",
+    "\n",
+    " WHERE x = 1",
+    "${ref('t')}",
+    '${ref("s", "t")}',
+    "${ref({schema: 's', name: 't'})}",
+    "${self()}",
+    "${when(incremental(), `AND ts > (SELECT MAX(ts) FROM ${self()})`)}",
+    '${when(false, "x", "y")}',
+    "${foo.bar}",
+    "${ {a: 1}.a }",
+    'config { type: "table", tags: ["a"] }',
+    "pre_operations { DECLARE x INT64; }",
+    "post_operations { SELECT 1 }",
+    "js { const f = () => { return 1; }; }",
+    "{", "}", "${", "'", '"', "`", "(", ")", ",",
+]
+sqlx_text = st.one_of(
+    st.lists(st.sampled_from(FRAGMENTS), max_size=12).map("".join),
+    st.text(alphabet="${}()`'\" \nrefslwhnconfigjs,.", max_size=60),
+)
+
+
+def _assert_equivalent(templater, sql):
+    comparison = compare_engines(templater, sql)
+    assert comparison.slices_match
+    if comparison.baseline_consistent:
+        assert comparison.templated_match
+    assert comparison.equivalent or comparison.tolerated
+    return comparison
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=lambda p: p.name)
+def test_engines_agree_on_corpus(templater, path):
+    assert _assert_equivalent(templater, path.read_text(encoding="utf-8")).equivalent
+
+
+@given(sql=sqlx_text)
+@settings(deadline=None, max_examples=300)
+def test_engines_agree_on_generated_sqlx(sql):
+    templater = FluffConfig(overrides={"dialect": "bigquery", "templater": "dataform"}).get_templater()
+    templater.project_id = 'my_project'
+    templater.dataset_id = 'my_dataset'
+    _assert_equivalent(templater, sql)
+
+
+def test_legacy_string_can_disagree_with_its_slices(templater):
+    # The slicer leaves the unterminated ${ as literal SQL, but the global js
+    # pass still replaces the expression nested in it.
+    sql = "SELECT ${${foo.bar} FROM t"
+    result = legacy_engine(templater, sql)
+    assert not is_self_consistent(sql, result)
+    comparison = compare_engines(templater, sql)
+    assert comparison.slices_match
+    assert comparison.candidate_consistent
+    assert not comparison.equivalent
+    assert comparison.tolerated
+
+
+def test_legacy_engine_resolves_refs_as_originally_written(templater):
+    # The original helpers split ref() arguments on every comma, so the
+    # comparison reports the later fix for quoted commas as a mismatch.
+    sql = "SELECT * FROM ${ref('p', 'my,ds', 'tbl')}"
+    assert legacy_engine(templater, sql)[0] == "SELECT * FROM `my_project.my_dataset.p`"
+    comparison = compare_engines(templater, sql)
+    assert not comparison.equivalent
+    assert not comparison.tolerated
+
+
+def test_cli_counts_tolerated_files(tmp_path, capsys):
+    (tmp_path / "broken.sqlx").write_text("SELECT ${${foo.bar} FROM t\n")
+    (tmp_path / "ok.sqlx").write_text("SELECT ${ref('t')}\n")
+    assert main([str(tmp_path)]) == 0
+    out = capsys.readouterr().out
+    assert "TOLERATED" in out and "broken.sqlx" in out
+    assert "2 files, 0 mismatches, 1 tolerated." in out
+
+
+def test_engine_setting_selects_legacy():
+    config = FluffConfig(
+        configs={"templater": {"dataform": {"engine": "legacy"}}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    templater = config.get_templater()
+    templater._setup_config(config)
+    templated_file, _ = templater.process(fname="m.sqlx", in_str="SELECT ${ref('t')}\n", config=config)
+    assert templater.engine == "legacy"
+    assert templated_file.templated_str.startswith("SELECT `")
+
+
+@pytest.mark.parametrize("engine_settings", [
+    {"engine": "fast"},
+    {"engine": "legacy", "preserve_width": True},
+    {"engine": "legacy", "lint_operations": True},
+])
+def test_invalid_engine_settings(engine_settings):
+    config = FluffConfig(
+        configs={"templater": {"dataform": engine_settings}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    with pytest.raises(SQLFluffUserError):
+        config.get_templater()._setup_config(config)
+
+
+def test_cli_reports_speed_ratio(capsys):
+    assert main([str(REPO_ROOT / "monkey_test_definitions")]) == 0
+    out = capsys.readouterr().out
+    assert "0 mismatches, 0 tolerated" in out
+    assert out.rstrip().endswith("x)")
@@ -0,0 +1,48 @@
+"""Tests for the plugin's import footprint."""
+import json
+import subprocess
+import sys
+
+
+def _modules_loaded_by(statement):
+    script = (
+        "import sys, json\n"
+        "import sqlfluff.core.plugin.host\n"
+        "before = set(sys.modules)\n"
+        f"{statement}\n"
+        "print(json.dumps(sorted(set(sys.modules) - before)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def test_plugin_hook_module_defers_templater_import():
+    assert _modules_loaded_by("import sqlfluff_templater_dataform") == [
+        "sqlfluff_templater_dataform"
+    ]
+
+
+def test_templater_import_footprint():
+    loaded = _modules_loaded_by("import sqlfluff_templater_dataform.templater")
+    # Typing-only and opt-in dependencies stay unloaded.
+    for module in (
+        "click",
+        "sqlfluff.cli.formatters",
+        "sqlfluff_templater_dataform.metrics",
+        "sqlfluff_templater_dataform.profiling",
+        "sqlfluff_templater_dataform.report",
+    ):
+        assert module not in loaded
+    assert all(module.startswith("sqlfluff_templater_dataform") for module in loaded)
+
+
+def test_templater_is_importable_from_package():
+    from sqlfluff_templater_dataform import DataformTemplater
+    from sqlfluff_templater_dataform.templater import DataformTemplater as templater_class
+
+    assert DataformTemplater is templater_class
+    assert "sqlfluff_templater_dataform.templater" in _modules_loaded_by(
+        "from sqlfluff_templater_dataform import DataformTemplater"
+    )
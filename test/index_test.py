@@ -0,0 +1,147 @@
+"""Tests for the memory-mapped project index."""
+import subprocess
+import sys
+
+import pytest
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.index import (
+    ProjectIndex,
+    build_index,
+    get_project_index,
+    read_model_location,
+    write_index,
+)
+
+
+def test_read_model_location():
+    sql = """config {
+    type: "table",
+    schema: "reporting",
+    bigquery: { partitionBy: "day", schema: "ignored" },
+    name: 'daily_users'
+}
+SELECT 1
+"""
+    assert read_model_location(sql, "definitions/users.sqlx") == (
+        "daily_users", ("", "reporting")
+    )
+    assert read_model_location(
+        'config { database: "other-project" }', "definitions/users.sqlx"
+    ) == ("users", ("other-project", ""))
+    assert read_model_location('config { type: "view" }', "a.sqlx") is None
+    assert read_model_location('config { schema: "s"', "a.sqlx") is None
+    assert read_model_location("SELECT 1", "a.sqlx") is None
+
+
+def test_index_round_trip(tmp_path):
+    path = str(tmp_path / "index.bin")
+    write_index(path, build_index([
+        ("orders", ("", "sales")),
+        ("users", ("crm-project", "crm")),
+        ("dup", ("", "one")),
+        ("dup", ("", "two")),
+        ("émoji", ("p", "s")),
+    ]))
+    index = ProjectIndex(path)
+    assert len(index) == 3
+    assert index.get("orders") == ("", "sales")
+    assert index.get("users") == ("crm-project", "crm")
+    assert index.get("émoji") == ("p", "s")
+    assert index.get("dup") is None
+    assert index.get("missing") is None
+    index.close()
+
+
+def test_empty_and_invalid_index(tmp_path):
+    path = str(tmp_path / "index.bin")
+    write_index(path, build_index([]))
+    assert get_project_index(path).get("anything") is None
+
+    (tmp_path / "bogus.bin").write_bytes(b"not an index")
+    assert get_project_index(str(tmp_path / "bogus.bin")) is None
+    assert get_project_index(str(tmp_path / "missing.bin")) is None
+
+
+def test_index_is_remapped_when_rewritten(tmp_path):
+    path = str(tmp_path / "index.bin")
+    write_index(path, build_index([("a", ("", "first"))]))
+    assert get_project_index(path).get("a") == ("", "first")
+    write_index(path, build_index([("a", ("", "second")), ("b", ("", "b"))]))
+    assert get_project_index(path).get("a") == ("", "second")
+
+
+@pytest.fixture
+def project(tmp_path):
+    models = tmp_path / "models"
+    models.mkdir()
+    (models / "orders.sqlx").write_text(
+        'config { type: "table", schema: "sales" }\nSELECT 1 AS id\n'
+    )
+    (models / "customers.sqlx").write_text(
+        'config { type: "table", database: "crm-project", schema: "crm", name: "clients" }\n'
+        "SELECT 1 AS id\n"
+    )
+    (models / "report.sqlx").write_text(
+        "SELECT * FROM ${ref('orders')} JOIN ${ref('clients')} USING (id)"
+        " JOIN ${ref('other')} USING (id) JOIN ${ref('adhoc', 'orders')} USING (id)"
+        " JOIN ${ref({name: 'orders', database: 'x'})} USING (id)\n"
+    )
+    return tmp_path
+
+
+def test_refs_resolve_through_the_index(project):
+    config = FluffConfig(
+        configs={"templater": {"dataform": {
+            "project_id": "my_project",
+            "dataset_id": "my_dataset",
+            "project_index_path": str(project / "index.bin"),
+        }}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    fnames = sorted(str(path) for path in (project / "models").iterdir())
+    config.get_templater().sequence_files(fnames, config=config)
+
+    # A fresh templater, as built by a lint worker, maps the same index.
+    templater = config.get_templater()
+    report = project / "models" / "report.sqlx"
+    templated_file, _ = templater.process(
+        fname=str(report), in_str=report.read_text(), config=config
+    )
+    assert templated_file.templated_str == (
+        "SELECT * FROM `my_project.sales.orders`"
+        " JOIN `crm-project.crm.clients` USING (id)"
+        " JOIN `my_project.my_dataset.other` USING (id)"
+        " JOIN `my_project.adhoc.orders` USING (id)"
+        " JOIN `x.sales.orders` USING (id)\n"
+    )
+
+
+def test_index_is_written_for_worker_processes(project):
+    (project / ".sqlfluff").write_text(
+        "[sqlfluff]\n"
+        "templater = dataform\n"
+        "dialect = bigquery\n"
+        "sql_file_exts = .sqlx\n"
+        "\n"
+        "[sqlfluff:templater:dataform]\n"
+        "project_id = my_project\n"
+        "dataset_id = my_dataset\n"
+        "project_index_path = index.bin\n"
+    )
+    subprocess.run(
+        [sys.executable, "-m", "sqlfluff", "lint", "models", "--processes", "2"],
+        cwd=project,
+        capture_output=True,
+        check=False,
+    )
+    assert len(ProjectIndex(str(project / "index.bin"))) == 2
+
+    rendered = subprocess.run(
+        [sys.executable, "-m", "sqlfluff", "render", "models/report.sqlx"],
+        cwd=project,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "`crm-project.crm.clients`" in rendered.stdout
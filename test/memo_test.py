@@ -0,0 +1,92 @@
+"""Tests for the run-scoped construct memo."""
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.memo import EXTENT_KEY_SIZE, ConstructMemo
+
+JS_BLOCK = "js {\n" + "".join(
+    f"  const f{i} = (x) => {{ return {{ value: x + {i} }}; }};\n" for i in range(20)
+) + "}\n"
+WHEN = (
+    "${when(incremental(), `WHERE ts > (SELECT MAX(ts) FROM ${self()}) "
+    "AND region IN (${regions.map((r) => `'${r}'`).join(', ')})`)}"
+)
+
+
+def _model(i):
+    return f"config {{ type: \"incremental\" }}\n{JS_BLOCK}SELECT c{i} FROM ${{ref('t{i}')}}\n{WHEN}\n"
+
+
+def _templater(**settings):
+    config = FluffConfig(
+        configs={"templater": {"dataform": {"project_id": "p", "dataset_id": "d", **settings}}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    templater = config.get_templater()
+    templater.sequence_files([], config=config)
+    return templater
+
+
+def test_extents_need_the_same_text():
+    memo = ConstructMemo()
+    block = "js { " + "x" * EXTENT_KEY_SIZE + " }"
+    memo.add_extent("SELECT 1\n" + block, 9, 9 + len(block))
+
+    assert memo.extent(block + "\nSELECT 2", 0) == len(block)
+    # Same first characters, different construct.
+    assert memo.extent(block[:-2] + "{ } }", 0) is None
+    # Short constructs are not kept.
+    memo.add_extent("${x}", 0, 4)
+    assert memo.extent("${x}", 0) is None
+    # Only the added extent counts as a miss, not the short construct.
+    assert (memo.stats()["hits"], memo.stats()["misses"]) == (1, 1)
+
+
+def test_memo_is_bounded():
+    memo = ConstructMemo(maxsize=2)
+    for i in range(3):
+        memo.add_replacement(("js", str(i)), "js_expression")
+
+    assert memo.replacement(("js", "0")) is None
+    assert memo.replacement(("js", "2")) == "js_expression"
+    assert memo.stats()["size"] == 2
+    memo.start_run()
+    assert memo.stats()["size"] == 0
+
+
+def test_memo_is_bounded_in_characters():
+    memo = ConstructMemo(max_chars=3 * EXTENT_KEY_SIZE)
+    blocks = [f"js {{ {i}" + "x" * EXTENT_KEY_SIZE + " }" for i in range(3)]
+    for block in blocks:
+        memo.add_extent(block, 0, len(block))
+
+    assert memo.extent(blocks[0], 0) is None
+    assert memo.extent(blocks[2], 0) == len(blocks[2])
+    assert memo.stats()["chars"] <= 3 * EXTENT_KEY_SIZE
+    # A construct over the bound is not kept at all.
+    huge = "js { " + "x" * 4 * EXTENT_KEY_SIZE + " }"
+    memo.add_extent(huge, 0, len(huge))
+    assert memo.extent(huge, 0) is None
+    assert memo.extent(blocks[2], 0) == len(blocks[2])
+
+
+def test_repeated_constructs_are_resolved_once():
+    without_memo = _templater(construct_memo_size=0, context_placeholders=False)
+    expected = [without_memo.slice_sqlx_template(_model(i)) for i in range(5)]
+    templater = _templater(context_placeholders=False)
+    memo = templater.construct_memo
+
+    hits = memo.hits
+    assert [templater.slice_sqlx_template(_model(i)) for i in range(5)] == expected
+    # The js block and when() extents and the when() replacement of every
+    # file after the first come from the memo.
+    assert memo.hits - hits >= 4 * 3
+    assert memo.stats()["hit_rate"] > 0
+
+
+def test_replacements_depend_on_defaults():
+    first = _templater().slice_sqlx_template(_model(0))[0]
+    other = _templater(dataset_id="other").slice_sqlx_template(_model(0))[0]
+
+    assert first.count("`p.d.") == 1
+    assert other.count("`p.other.") == 1
+    assert "`p.d." not in other
@@ -0,0 +1,73 @@
+"""Peak-memory budgets for templating large SQLX files."""
+import tracemalloc
+
+import pytest
+
+
+def generated_model(size=2_000_000):
+    """Build a generated model of about ``size`` characters.
+
+    It is a long UNION ALL of wide SELECTs, each reading a ref and using
+    JS expressions and an incremental condition, like the models our
+    generators emit.
+    """
+    parts = [
+        'config {\n  type: "incremental",\n  description: "generated"\n}\n\n'
+        "js {\n  const threshold = 10;\n}\n\n"
+    ]
+    length = len(parts[0])
+    i = 0
+    while length < size:
+        columns = ",\n".join(
+            f"    CASE WHEN t.col_{j} > ${{threshold}} THEN 'high' ELSE 'low' END AS bucket_{j}"
+            if j % 10 == 0 else f"    COALESCE(t.col_{j}, 0) AS col_{j}"
+            for j in range(40)
+        )
+        part = (
+            f"SELECT\n{columns}\nFROM ${{ref('source_{i % 50}')}} AS t\n"
+            "WHERE t.day >= '2024-01-01'\n"
+            '${when(incremental(), `AND t.day > (SELECT MAX(day) FROM ${self()})`)}\n'
+            "UNION ALL\n"
+        )
+        parts.append(part)
+        length += len(part)
+        i += 1
+    parts.append("SELECT * FROM ${ref('tail')}\n")
+    return "".join(parts)
+
+
+def peak_ratio(func, in_str):
+    """Return the peak traced allocation of ``func()`` as a multiple of ``in_str``."""
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak / len(in_str)
+
+
+@pytest.fixture(scope="module")
+def big_sqlx():
+    return generated_model()
+
+
+def test_slice_peak_memory(templater, big_sqlx):
+    # The slices hold one copy of the literal SQL plus the templated
+    # output; the rest is sqlfluff's per-slice tuples.
+    assert peak_ratio(lambda: templater.slice_sqlx_template(big_sqlx), big_sqlx) < 6
+
+
+def test_process_peak_memory(templater, big_sqlx):
+    ratio = peak_ratio(
+        lambda: templater.process(fname="big.sqlx", in_str=big_sqlx), big_sqlx
+    )
+    assert ratio < 8
+
+
+@pytest.mark.parametrize(
+    "method", ["replace_js_expressions", "replace_incremental_condition"]
+)
+def test_replacement_passes_copy_text_in_chunks(templater, big_sqlx, method):
+    assert peak_ratio(lambda: getattr(templater, method)(big_sqlx), big_sqlx) < 3
@@ -0,0 +1,121 @@
+"""Tests for the Prometheus textfile metrics."""
+import os
+
+import pytest
+from sqlfluff.core import FluffConfig, Linter
+from sqlfluff.core.errors import SQLFluffSkipFile
+
+from sqlfluff_templater_dataform.metrics import TemplaterMetrics, get_metrics
+
+
+def _config(metrics_path, **core):
+    return FluffConfig(
+        configs={
+            "templater": {
+                "dataform": {
+                    "project_id": "my_project",
+                    "dataset_id": "my_dataset",
+                    "metrics_textfile_path": str(metrics_path),
+                }
+            }
+        },
+        overrides={"dialect": "bigquery", "templater": "dataform", **core},
+    )
+
+
+def _samples(text):
+    return dict(
+        line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#")
+    )
+
+
+def test_render_counters_and_histogram(tmp_path):
+    metrics = TemplaterMetrics(str(tmp_path / "dataform.prom"))
+    metrics.inc("files_templated_total", 3)
+    metrics.inc("cache_hits_total", 2, cache="ref")
+    metrics.observe_latency(0.0001)
+    metrics.observe_latency(0.003)
+    metrics.observe_latency(10)
+    metrics.flush()
+    metrics.write()
+
+    samples = _samples((tmp_path / "dataform.prom").read_text())
+    prefix = "sqlfluff_dataform_templater_"
+    assert samples[prefix + "files_templated_total"] == "3"
+    assert samples[prefix + 'cache_hits_total{cache="ref"}'] == "2"
+    assert samples[prefix + "skipped_files_total"] == "0"
+    assert samples[prefix + 'latency_seconds_bucket{le="0.0005"}'] == "1"
+    assert samples[prefix + 'latency_seconds_bucket{le="0.005"}'] == "2"
+    assert samples[prefix + 'latency_seconds_bucket{le="2.5"}'] == "2"
+    assert samples[prefix + 'latency_seconds_bucket{le="+Inf"}'] == "3"
+    assert samples[prefix + "latency_seconds_count"] == "3"
+    assert not (tmp_path / "dataform.prom.shards").exists()
+
+
+def test_process_counts_files_fast_path_and_fallbacks(tmp_path):
+    metrics_path = tmp_path / "dataform.prom"
+    config = _config(metrics_path)
+    templater = config.get_templater()
+    templater.process(fname="plain.sqlx", in_str="SELECT 1\n", config=config)
+    templater.process(
+        fname="model.sqlx",
+        in_str="SELECT ${a}, ${b} FROM ${ref('t')}\n",
+        config=config,
+    )
+    templater.process(
+        fname="broken.sqlx", in_str="config { type: 'table'\nSELECT 1\n", config=config
+    )
+    templater.metrics.write()
+
+    samples = _samples(metrics_path.read_text())
+    prefix = "sqlfluff_dataform_templater_"
+    assert samples[prefix + "files_templated_total"] == "3"
+    assert samples[prefix + "fast_path_hits_total"] == "1"
+    assert samples[prefix + "placeholder_substitutions_total"] == "2"
+    assert samples[prefix + "malformed_block_fallbacks_total"] == "1"
+    assert samples[prefix + "latency_seconds_count"] == "3"
+
+
+def test_parallel_run_counts_every_file(tmp_path):
+    metrics_path = tmp_path / "dataform.prom"
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\n"
+        "rules = LT01\n\n"
+        "[sqlfluff:templater:dataform]\nproject_id = p\ndataset_id = d\n"
+        f"metrics_textfile_path = {metrics_path}\n"
+    )
+    models = tmp_path / "models"
+    models.mkdir()
+    for i in range(7):
+        (models / f"m{i}.sqlx").write_text(f"SELECT ${{ref('t{i}')}}\n")
+    config = FluffConfig.from_path(str(tmp_path))
+    Linter(config=config).lint_paths((str(models),), processes=2)
+    shards = os.listdir(f"{metrics_path}.shards")
+    # Templated in the workers, whose shards are complete without a flush at exit.
+    assert shards and f"{os.getpid()}.jsonl" not in shards
+    get_metrics(str(metrics_path)).write()
+
+    samples = _samples(metrics_path.read_text())
+    assert samples["sqlfluff_dataform_templater_files_templated_total"] == "7"
+    assert samples["sqlfluff_dataform_templater_latency_seconds_count"] == "7"
+
+
+def test_skipped_files_are_counted(tmp_path):
+    metrics_path = tmp_path / "dataform.prom"
+    config = _config(metrics_path, large_file_skip_char_limit=5)
+    templater = config.get_templater()
+    with pytest.raises(SQLFluffSkipFile):
+        templater.process(fname="big.sqlx", in_str="SELECT 1\n", config=config)
+    templater.metrics.write()
+
+    samples = _samples(metrics_path.read_text())
+    assert samples["sqlfluff_dataform_templater_skipped_files_total"] == "1"
+
+
+def test_fast_path_matches_slicing_loop(templater):
+    sql = "SELECT 1 AS value\nFROM my_table\n"
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(sql)
+    assert replaced_sql == sql
+    assert [s.raw for s in raw_slices] == [sql]
+    assert templated_slices[0].templated_slice == slice(0, len(sql))
+    assert templater.slice_sqlx_template("") == ("", [], [])
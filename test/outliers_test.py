@@ -0,0 +1,82 @@
+"""Tests for cProfile dumps of outlier files."""
+import os
+import pstats
+
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.outliers import dump_profile, is_outlier, profile_path
+
+
+def _templater(tmp_path, **settings):
+    config = FluffConfig(
+        configs={"templater": {"dataform": {
+            "outlier_profile_dir": str(tmp_path / "profiles"),
+            "outlier_profile_ms": 0,
+            **settings,
+        }}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    return config, config.get_templater()
+
+
+def test_profile_path_is_named_after_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert profile_path("out", os.path.join("definitions", "marts", "orders v2.sqlx")) == (
+        os.path.join("out", "definitions__marts__orders_v2.sqlx.pstats")
+    )
+
+
+def test_thresholds():
+    assert is_outlier(1500.0, 10, 1000.0, 0)
+    assert is_outlier(5.0, 10_000, 1000.0, 5000)
+    assert not is_outlier(5.0, 10_000, 1000.0, 0)
+    assert not is_outlier(5.0, 10_000, 0, 0)
+
+
+def test_only_outliers_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config, templater = _templater(tmp_path, outlier_profile_bytes=100)
+    big = "SELECT * FROM ${ref('t')}\n" * 10
+    templater.process(fname="small.sqlx", in_str="SELECT 1\n", config=config)
+    templated_file, _ = templater.process(fname="big.sqlx", in_str=big, config=config)
+
+    assert os.listdir(tmp_path / "profiles") == ["big.sqlx.pstats"]
+    stats = pstats.Stats(str(tmp_path / "profiles" / "big.sqlx.pstats"))
+    assert any(name == "slice_sqlx_template" for _, _, name in stats.stats)
+    assert templated_file.source_str == big
+
+
+def test_profile_bypasses_construct_memo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config, templater = _templater(tmp_path, outlier_profile_bytes=1)
+    js_block = "js {\n" + "".join(
+        f"  const f{i} = (x) => {{ return x + {i}; }};\n" for i in range(5)
+    ) + "}\n"
+    templater.process(fname="model.sqlx", in_str=js_block + "SELECT 1\n", config=config)
+
+    assert templater.construct_memo is not None
+    stats = pstats.Stats(str(tmp_path / "profiles" / "model.sqlx.pstats"))
+    assert any(name == "find_block_end" for _, _, name in stats.stats)
+
+
+def test_profile_leaves_cache_counts_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config, templater = _templater(tmp_path, outlier_profile_bytes=1)
+    templater.process(fname="model.sqlx", in_str="SELECT * FROM ${ref('t')}\n", config=config)
+    counts = (templater.ref_cache.hits, templater.ref_cache.misses)
+    memo = templater.construct_memo.stats()
+    templater.process(fname="model.sqlx", in_str="SELECT * FROM ${ref('t')}\n", config=config)
+
+    # Only the timed pass looked the ref up, and found it.
+    assert (templater.ref_cache.hits, templater.ref_cache.misses) == (counts[0] + 1, counts[1])
+    assert templater.construct_memo.stats()["misses"] == memo["misses"]
+
+
+def test_dumps_are_capped(tmp_path):
+    directory = str(tmp_path / "profiles")
+    paths = [dump_profile(directory, f"m{i}.sqlx", 2, sum, [1, 2]) for i in range(3)]
+
+    assert paths[2] is None
+    assert sorted(os.listdir(directory)) == ["m0.sqlx.pstats", "m1.sqlx.pstats"]
+    # A file already profiled is profiled again.
+    assert dump_profile(directory, "m0.sqlx", 2, sum, [1, 2]) is not None
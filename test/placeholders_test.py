@@ -0,0 +1,80 @@
+"""Tests for context-aware JS expression placeholders."""
+import pytest
+from sqlfluff.core import FluffConfig, Linter
+
+from sqlfluff_templater_dataform.placeholders import (
+    DATE_PART,
+    IDENTIFIER,
+    NUMBER,
+    STRING,
+    TABLE,
+    placeholder_for,
+)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT a FROM ${t}", TABLE),
+    ("SELECT a FROM\n  ${t} AS x", TABLE),
+    ("SELECT a FROM ${ds}.tbl", TABLE),
+    ("SELECT a FROM t JOIN ${t} USING (id)", TABLE),
+    ("SELECT DATE_SUB(d, INTERVAL ${n} DAY)", NUMBER),
+    ("SELECT a FROM t LIMIT ${n}", NUMBER),
+    ("SELECT a FROM t TABLESAMPLE SYSTEM (${pct} PERCENT)", NUMBER),
+    ("SELECT DATE_SUB(d, INTERVAL ${n} ${unit})", DATE_PART),
+    ("SELECT EXTRACT(${part} FROM d)", DATE_PART),
+    ("SELECT a FROM t WHERE env = ${env}", STRING),
+    ("SELECT a FROM t WHERE s LIKE ${pattern}", STRING),
+    ("SELECT a FROM t WHERE t.id = ${alias}.id", IDENTIFIER),
+    ("SELECT ${cols} FROM t", IDENTIFIER),
+    ("SELECT a FROM t WHERE a IN (${values})", IDENTIFIER),
+    ("SELECT a FROM tbl_${suffix}", IDENTIFIER),
+    ("SELECT '${x}' AS a", IDENTIFIER),
+    ("SELECT a FROM `${project}.ds.t`", IDENTIFIER),
+    ("SELECT a -- FROM ${t}", IDENTIFIER),
+    ("SELECT a /* c */ FROM ${t}", TABLE),
+])
+def test_placeholder_for(sql, expected):
+    start = sql.rfind("${")
+    assert placeholder_for(sql, start, sql.index("}", start) + 1) == expected
+
+
+@pytest.mark.parametrize("input_sqlx", [
+    "SELECT a FROM t TABLESAMPLE SYSTEM (${pct} PERCENT)\n",
+    "SELECT DATE_SUB(d, INTERVAL ${n} ${unit}) AS d FROM t\n",
+    "SELECT EXTRACT(${part} FROM d) AS p FROM t\n",
+])
+def test_context_placeholders_parse(input_sqlx):
+    unparsable = {}
+    for context_placeholders in (False, True):
+        config = FluffConfig(
+            configs={"templater": {"dataform": {"context_placeholders": context_placeholders}}},
+            overrides={"dialect": "bigquery", "templater": "dataform"},
+        )
+        parsed = Linter(config=config).parse_string(input_sqlx, fname="m.sqlx")
+        unparsable[context_placeholders] = len(list(parsed.tree.recursive_crawl("unparsable")))
+
+    assert unparsable == {False: 1, True: 0}
+
+
+def test_context_placeholders_preserve_width(templater):
+    templater.preserve_width = True
+    input_sqlx = "SELECT a FROM ${table} LIMIT ${n}\n"
+    replaced_sql, _, templated_slices = templater.slice_sqlx_template(input_sqlx)
+
+    assert replaced_sql == "SELECT a FROM `js_expression` LIMIT 0   \n"
+    assert templated_slices[-2].templated_slice.stop - templated_slices[-2].templated_slice.start == len("${n}")
+
+
+@pytest.mark.parametrize("context_placeholders, expected", [
+    (True, "WHERE d > DATE_SUB(CURRENT_DATE(), INTERVAL 0 DAY) AND env = 'js_expression'"),
+    (False, "WHERE d > DATE_SUB(CURRENT_DATE(), INTERVAL js_expression DAY) AND env = js_expression"),
+])
+def test_context_placeholders_in_incremental_value(templater, context_placeholders, expected):
+    templater.context_placeholders = context_placeholders
+    input_sqlx = (
+        "SELECT d FROM t\n"
+        "${when(incremental(), `WHERE d > DATE_SUB(CURRENT_DATE(), INTERVAL ${n} DAY) AND env = ${env}`)}\n"
+    )
+    _, (incremental_sql, _, _) = templater.slice_sqlx_variants(input_sqlx)
+
+    assert incremental_sql == f"SELECT d FROM t\n{expected}\n"
@@ -0,0 +1,55 @@
+"""Tests for the phase timing instrumentation."""
+import logging
+
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.profiling import PhaseTimer
+
+
+SQLX = """config { type: "table" }
+SELECT ${column_name} FROM ${ref('test')} JOIN ${self()} USING (id)
+${when(incremental(), "WHERE true")}
+"""
+
+
+def test_phase_timer_aggregates_per_file_and_run():
+    timer = PhaseTimer()
+    timer.add("blocks", 10)
+    timer.add("blocks", 5)
+    timer.add("ref", 7)
+    assert timer.finish_file("a.sqlx") == {"blocks": 15, "ref": 7}
+    timer.add("ref", 3)
+    assert timer.finish_file("b.sqlx") == {"ref": 3}
+
+    assert timer.files == 2
+    assert timer.totals == {"blocks": 15, "ref": 10}
+    assert timer.calls == {"blocks": 2, "ref": 2}
+    assert "2 files" in timer.summary()
+
+
+def test_phase_timer_disabled_by_default(templater):
+    templater.slice_sqlx_template(SQLX)
+    assert templater.phase_timer is None
+
+
+def test_process_records_phases_when_enabled(caplog):
+    config = FluffConfig(
+        configs={"templater": {"dataform": {"profile_phases": True}}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    templater = config.get_templater()
+    with caplog.at_level(logging.DEBUG, logger="sqlfluff.templater"):
+        templater.process(fname="model.sqlx", in_str=SQLX, config=config)
+
+    assert templater.phase_timer is not None
+    assert {
+        "setup_config",
+        "blocks",
+        "self",
+        "ref",
+        "when",
+        "js_expressions",
+        "slicing",
+        "templated_file",
+    } <= set(templater.phase_timer.totals)
+    assert "Dataform templater phases for model.sqlx" in caplog.text
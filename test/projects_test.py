@@ -0,0 +1,132 @@
+"""Tests for discovery of the Dataform project of each file."""
+from pytest import fixture
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.index import ProjectIndex
+from sqlfluff_templater_dataform.projects import (
+    ProjectRegistry,
+    project_index_path,
+    read_project_defaults,
+)
+
+
+@fixture
+def monorepo(tmp_path):
+    """Two Dataform projects, and a file outside both."""
+    sales = tmp_path / "sales"
+    (sales / "definitions" / "marts").mkdir(parents=True)
+    (sales / "workflow_settings.yaml").write_text(
+        "defaultProject: sales-prod  # the warehouse\n"
+        "defaultLocation: EU\n"
+        "defaultDataset: 'sales'\n"
+        "vars:\n"
+        "  defaultDataset: nested\n"
+    )
+    (sales / "definitions" / "marts" / "orders.sqlx").write_text(
+        "config { type: \"table\", schema: \"marts\" }\nSELECT 1\n"
+    )
+    (sales / "definitions" / "marts" / "report.sqlx").write_text(
+        "SELECT * FROM ${ref('orders')} JOIN ${ref('clients')} USING (id)\n"
+    )
+    crm = tmp_path / "crm"
+    (crm / "definitions").mkdir(parents=True)
+    (crm / "dataform.json").write_text('{"defaultDatabase": "crm-prod", "defaultSchema": "crm"}')
+    (crm / "definitions" / "report.sqlx").write_text(
+        "SELECT * FROM ${ref('orders')} JOIN ${ref('clients')} USING (id)\n"
+    )
+    (tmp_path / "adhoc.sqlx").write_text("SELECT * FROM ${ref('orders')}\n")
+    return tmp_path
+
+
+def _config(**settings):
+    return FluffConfig(
+        configs={"templater": {"dataform": {
+            "project_id": "fallback_project",
+            "dataset_id": "fallback_dataset",
+            "discover_projects": True,
+            **settings,
+        }}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+
+
+def test_project_defaults(monorepo):
+    assert read_project_defaults(str(monorepo / "sales")) == ("sales-prod", "sales")
+    assert read_project_defaults(str(monorepo / "crm")) == ("crm-prod", "crm")
+    assert read_project_defaults(str(monorepo)) == (None, None)
+
+
+def test_each_directory_is_walked_once(monorepo):
+    registry = ProjectRegistry()
+    marts = str(monorepo / "sales" / "definitions" / "marts")
+    assert registry.find_root(marts) == str(monorepo / "sales")
+    walked = registry.directories_walked
+    assert walked == 3  # marts, definitions, sales
+
+    assert registry.find_root(marts) == str(monorepo / "sales")
+    assert registry.find_root(str(monorepo / "sales" / "definitions")) == str(monorepo / "sales")
+    assert registry.directories_walked == walked
+    # A file outside any project walks up to the filesystem root, once.
+    assert registry.find_root(str(monorepo)) is None
+    walked = registry.directories_walked
+    assert registry.find_root(str(monorepo / "adhoc")) is None
+    assert registry.directories_walked == walked + 1
+
+
+def test_projects_are_bounded(monorepo):
+    registry = ProjectRegistry(max_projects=1)
+    sales = registry.project_for(str(monorepo / "sales" / "definitions" / "marts" / "report.sqlx"))
+    sales.ref_cache.resolve("p", "d", "t")
+    crm = registry.project_for(str(monorepo / "crm" / "definitions" / "report.sqlx"))
+
+    assert list(registry._projects) == [crm.root]
+    assert crm.ref_cache is not sales.ref_cache
+    assert registry.ref_cache_counts() == (0, 1)
+
+
+def test_files_use_their_project_defaults(monorepo):
+    config = _config()
+    templater = config.get_templater()
+    templater.sequence_files([], config=config)
+
+    def render(path):
+        templated_file, _ = templater.process(
+            fname=str(path), in_str=path.read_text(), config=config
+        )
+        return templated_file.templated_str
+
+    assert render(monorepo / "sales" / "definitions" / "marts" / "report.sqlx") == (
+        "SELECT * FROM `sales-prod.sales.orders` JOIN `sales-prod.sales.clients` USING (id)\n"
+    )
+    assert render(monorepo / "crm" / "definitions" / "report.sqlx") == (
+        "SELECT * FROM `crm-prod.crm.orders` JOIN `crm-prod.crm.clients` USING (id)\n"
+    )
+    assert render(monorepo / "adhoc.sqlx") == (
+        "SELECT * FROM `fallback_project.fallback_dataset.orders`\n"
+    )
+
+
+def test_each_project_gets_its_own_index(monorepo):
+    base = str(monorepo / "index.bin")
+    config = _config(project_index_path=base)
+    fnames = [
+        str(monorepo / "sales" / "definitions" / "marts" / "orders.sqlx"),
+        str(monorepo / "sales" / "definitions" / "marts" / "report.sqlx"),
+        str(monorepo / "crm" / "definitions" / "report.sqlx"),
+    ]
+    templater = config.get_templater()
+    templater.sequence_files(fnames, config=config)
+
+    assert len(ProjectIndex(project_index_path(base, str(monorepo / "sales")))) == 1
+    assert len(ProjectIndex(project_index_path(base, str(monorepo / "crm")))) == 0
+
+    sales_report, crm_report = fnames[1], fnames[2]
+    templated_file, _ = templater.process(
+        fname=sales_report, in_str=open(sales_report).read(), config=config
+    )
+    assert "`sales-prod.marts.orders`" in templated_file.templated_str
+    # The other project's model of the same name does not leak across.
+    templated_file, _ = templater.process(
+        fname=crm_report, in_str=open(crm_report).read(), config=config
+    )
+    assert "`crm-prod.crm.orders`" in templated_file.templated_str
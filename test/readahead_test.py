@@ -0,0 +1,90 @@
+"""Tests for background read-ahead of linted files."""
+import time
+
+from sqlfluff.core import FluffConfig, Linter
+
+from sqlfluff_templater_dataform import readahead
+from sqlfluff_templater_dataform.readahead import ReadAhead
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _models(tmp_path, count, size=100):
+    fnames = []
+    for i in range(count):
+        path = tmp_path / f"m{i}.sqlx"
+        path.write_text("-" * (size - 1) + "\n")
+        fnames.append(str(path))
+    return fnames
+
+
+def test_reads_ahead_and_reports_hidden_time(tmp_path):
+    fnames = _models(tmp_path, 20)
+    read_ahead = ReadAhead(fnames, budget_bytes=1 << 20).start()
+    _wait_for(lambda: read_ahead.files_read == 20)
+    for fname in fnames:
+        read_ahead.claim(fname)
+    read_ahead.stop()
+
+    assert read_ahead.bytes_read == 2000
+    assert read_ahead.ready == 20
+    assert read_ahead.hidden_seconds > 0
+    assert "20 files were ready when templated" in read_ahead.summary()
+
+
+def test_budget_bounds_bytes_read_ahead(tmp_path):
+    fnames = _models(tmp_path, 5)
+    read_ahead = ReadAhead(fnames, budget_bytes=250, threads=1).start()
+    _wait_for(lambda: read_ahead.files_read == 3)
+    time.sleep(0.1)
+    assert read_ahead.files_read == 3  # 300 bytes ahead, over the budget.
+
+    read_ahead.claim(fnames[0])
+    _wait_for(lambda: read_ahead.files_read == 4)
+    # A file claimed before it was reached is not read at all.
+    read_ahead.claim(fnames[4])
+    read_ahead.claim(fnames[1])
+    time.sleep(0.1)
+    read_ahead.stop()
+
+    assert read_ahead.files_read == 4
+    assert read_ahead.missed == 1
+
+
+def test_lint_run_claims_every_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(readahead, "_read_ahead", None)
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\n\n"
+        "[sqlfluff:templater:dataform]\nread_ahead_bytes = 1048576\n"
+    )
+    (tmp_path / "models").mkdir()
+    _models(tmp_path / "models", 10)
+    monkeypatch.chdir(tmp_path)
+    Linter(config=FluffConfig.from_path(str(tmp_path))).lint_paths(("models",))
+
+    read_ahead = readahead.get_read_ahead()
+    read_ahead.stop()
+    assert read_ahead.ready + read_ahead.in_flight + read_ahead.missed == 10
+
+
+def test_parallel_run_does_not_read_ahead(tmp_path, monkeypatch):
+    monkeypatch.setattr(readahead, "_read_ahead", None)
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\n\n"
+        "[sqlfluff:templater:dataform]\nread_ahead_bytes = 1048576\n"
+    )
+    (tmp_path / "models").mkdir()
+    _models(tmp_path / "models", 10)
+    monkeypatch.chdir(tmp_path)
+    Linter(config=FluffConfig.from_path(str(tmp_path))).lint_paths(("models",), processes=2)
+
+    # Templating happened in the workers, so the readers never started and
+    # there is nothing to report.
+    read_ahead = readahead.get_read_ahead()
+    assert not read_ahead.started
+    assert read_ahead.files_read == 0
@@ -0,0 +1,59 @@
+"""Tests for ref resolution and the resolution cache."""
+from sqlfluff_templater_dataform.refs import RefResolutionCache, ref_cache, sanitize_identifier
+
+
+def test_sanitize_identifier():
+    assert sanitize_identifier("my-project") == "my-project"
+    assert sanitize_identifier("constants.PROJECT_ID") == "constants_PROJECT_ID"
+    assert sanitize_identifier("1table") == "_1table"
+    assert sanitize_identifier("") == ""
+    assert sanitize_identifier(None) is None
+
+
+def test_cache_hits_and_returns_the_same_string():
+    cache = RefResolutionCache()
+    first = cache.resolve("p", "d", "t")
+    second = cache.resolve("p", "d", "t")
+    assert first == "`p.d.t`"
+    assert first is second
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1, "hit_rate": 0.5}
+
+
+def test_cache_is_bounded():
+    cache = RefResolutionCache(maxsize=2)
+    cache.resolve("p", "d", "a")
+    cache.resolve("p", "d", "b")
+    cache.resolve("p", "d", "a")
+    cache.resolve("p", "d", "c")
+    assert cache.stats()["size"] == 2
+    # "b" was least recently used and has been evicted.
+    cache.resolve("p", "d", "b")
+    assert cache.misses == 4
+
+
+def test_cache_keeps_entries_for_every_dataset():
+    cache = RefResolutionCache()
+    assert cache.resolve("p", "d", "a") == "`p.d.a`"
+    assert cache.resolve("p", "other", "a") == "`p.other.a`"
+    assert cache.resolve("p", "d", "a") == "`p.d.a`"
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 2, "hit_rate": 1 / 3}
+
+
+def test_templater_shares_table_names_across_calls(templater):
+    templater.replace_ref_with_bq_table("SELECT * FROM ${ref('shared_table')}")
+    hits = ref_cache.hits
+    second = templater.replace_ref_with_bq_table("SELECT 1 FROM ${ref(\"shared_table\")}")
+    assert ref_cache.hits == hits + 1
+    assert second == "SELECT 1 FROM `my_project.my_dataset.shared_table`"
+
+
+def test_templater_picks_up_changed_defaults(templater):
+    sql = "SELECT * FROM ${ref('t')}"
+    assert templater.replace_ref_with_bq_table(sql) == "SELECT * FROM `my_project.my_dataset.t`"
+    templater.dataset_id = "other_dataset"
+    assert templater.replace_ref_with_bq_table(sql) == "SELECT * FROM `my_project.other_dataset.t`"
+    # Switching back finds the first table name still cached.
+    templater.dataset_id = "my_dataset"
+    hits = templater.ref_cache.hits
+    assert templater.replace_ref_with_bq_table(sql) == "SELECT * FROM `my_project.my_dataset.t`"
+    assert templater.ref_cache.hits == hits + 1
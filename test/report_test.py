@@ -0,0 +1,133 @@
+"""Tests for the per-file timing report."""
+import csv
+import json
+import subprocess
+import sys
+
+from sqlfluff.core import FluffConfig
+
+from sqlfluff_templater_dataform.report import TimingReport, count_constructs
+
+
+SQLX = """config { type: "table" }
+js { const a = 1; }
+SELECT ${column_name}, ${ref('a')}.x FROM ${ref('a')} JOIN ${self()}
+${when(incremental(), "WHERE true")}
+"""
+
+
+def _config(report_path, top_n=10):
+    return FluffConfig(
+        configs={
+            "templater": {
+                "dataform": {
+                    "project_id": "my_project",
+                    "dataset_id": "my_dataset",
+                    "timing_report_path": str(report_path),
+                    "timing_report_top_n": top_n,
+                }
+            }
+        },
+        overrides={
+            "dialect": "bigquery",
+            "templater": "dataform",
+            "sql_file_exts": ".sqlx",
+        },
+    )
+
+
+def test_count_constructs(templater):
+    templater.slice_sqlx_template(SQLX)
+    assert count_constructs(SQLX, templater.construct_spans) == {
+        "refs": 2,
+        "selfs": 1,
+        "whens": 1,
+        "js_expressions": 1,
+        "blocks": 2,
+    }
+
+
+def test_count_constructs_with_compacted_and_operations_slices(templater):
+    templater.compact_slices = True
+    templater.lint_operations = True
+    sqlx = (
+        "config { type: \"incremental\" }js { const a = 1; }${ref('a')}\n"
+        "pre_operations {\n  DELETE FROM ${self()} WHERE true\n}\n"
+        "SELECT ${column_name} FROM ${ref('a')}\n"
+        "post_operations {\n  SELECT 1\n}\n"
+    )
+    _, raw_slices, _ = templater.slice_sqlx_template(sqlx)
+
+    # The config and js blocks and first ref are merged into one slice, and
+    # the operations blocks split into several, but each counts once.
+    assert raw_slices[0].raw == "config { type: \"incremental\" }js { const a = 1; }${ref('a')}"
+    assert sum(s.slice_type.startswith("block") for s in raw_slices) == 4
+    assert count_constructs(sqlx, templater.construct_spans) == {
+        "refs": 2,
+        "selfs": 0,
+        "whens": 0,
+        "js_expressions": 1,
+        "blocks": 4,
+    }
+
+
+def test_json_report_lists_slowest_files_first(tmp_path):
+    report = TimingReport(str(tmp_path / "report.json"), top_n=1)
+    report.start_run()
+    report.record("fast.sqlx", 1_000_000, "SELECT 1", [])
+    report.record("slow.sqlx", 9_000_000, "SELECT 2", [])
+    report.write()
+
+    written = json.loads((tmp_path / "report.json").read_text())
+    assert written["files"] == 2
+    assert [r["path"] for r in written["slowest"]] == ["slow.sqlx"]
+    assert [r["path"] for r in written["records"]] == ["slow.sqlx", "fast.sqlx"]
+    assert written["records"][0]["wall_ms"] == 9.0
+    assert not (tmp_path / "report.json.shards").exists()
+
+
+def test_csv_report_from_process(tmp_path):
+    report_path = tmp_path / "report.csv"
+    config = _config(report_path)
+    templater = config.get_templater()
+    templater.process(fname="model.sqlx", in_str=SQLX, config=config)
+    templater.timing_report.write()
+
+    with open(report_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 1
+    assert rows[0]["path"] == "model.sqlx"
+    assert rows[0]["input_size"] == str(len(SQLX))
+    assert rows[0]["refs"] == "2"
+    assert rows[0]["whens"] == "1"
+
+
+def test_report_merges_records_from_worker_processes(tmp_path):
+    models = tmp_path / "models"
+    models.mkdir()
+    for i in range(4):
+        (models / f"model_{i}.sqlx").write_text(SQLX)
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\n"
+        "templater = dataform\n"
+        "dialect = bigquery\n"
+        "sql_file_exts = .sqlx\n"
+        "\n"
+        "[sqlfluff:templater:dataform]\n"
+        "project_id = my_project\n"
+        "dataset_id = my_dataset\n"
+        "timing_report_path = report.json\n"
+    )
+
+    subprocess.run(
+        [sys.executable, "-m", "sqlfluff", "lint", "models", "--processes", "2"],
+        cwd=tmp_path,
+        capture_output=True,
+        check=False,
+    )
+
+    written = json.loads((tmp_path / "report.json").read_text())
+    assert sorted(r["path"] for r in written["records"]) == [
+        f"models/model_{i}.sqlx" for i in range(4)
+    ]
+    assert not (tmp_path / "report.json.shards").exists()
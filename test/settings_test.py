@@ -0,0 +1,99 @@
+"""Tests for per-config memoization of templater settings."""
+import gc
+
+from sqlfluff.core import FluffConfig, Linter
+
+from sqlfluff_templater_dataform.settings import SettingsCache, TemplaterSettings
+
+SECTION = ("templater", "dataform")
+
+
+def _config(**settings):
+    return FluffConfig(
+        configs={"templater": {"dataform": settings}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+
+
+def test_same_config_is_not_read_again(monkeypatch):
+    cache = SettingsCache()
+    config = _config(project_id="p", dataset_id="d")
+    settings = cache.get(config, SECTION)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("config was read")
+
+    monkeypatch.setattr(config, "get_section", fail)
+    monkeypatch.setattr(config, "get", fail)
+    assert cache.get(config, SECTION) is settings
+    assert settings.project_id == "p" and settings.dataset_id == "d"
+
+
+def test_equal_sections_share_settings():
+    cache = SettingsCache()
+    first = cache.get(_config(dataset_id="d"), SECTION)
+    second = cache.get(_config(dataset_id="d"), SECTION)
+    other = cache.get(_config(dataset_id="e"), SECTION)
+
+    assert first is second
+    assert other.dataset_id == "e"
+    assert cache.resolved == 2
+
+
+def test_configs_are_not_kept_alive():
+    cache = SettingsCache()
+    config = _config()
+    cache.get(config, SECTION)
+    assert len(cache._by_config) == 1
+
+    del config
+    gc.collect()
+    assert len(cache._by_config) == 0
+
+
+def test_defaults():
+    assert TemplaterSettings.from_section(None) == TemplaterSettings()
+    assert TemplaterSettings.from_section({"unknown": 1}).engine == "scan"
+
+
+def test_nested_config_overrides(tmp_path):
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\n\n"
+        "[sqlfluff:templater:dataform]\nproject_id = proj\ndataset_id = root_ds\n"
+        "profile_phases = True\n"
+    )
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".sqlfluff").write_text(
+        "[sqlfluff:templater:dataform]\ndataset_id = sub_ds\nprofile_phases = False\n"
+    )
+    for path in (tmp_path / "a.sqlx", tmp_path / "sub" / "b.sqlx"):
+        path.write_text("SELECT * FROM ${ref('t')}\n")
+    root_config = FluffConfig.from_path(str(tmp_path))
+    linter = Linter(config=root_config)
+
+    root_file = linter.render_file(str(tmp_path / "a.sqlx"), root_config)
+    assert root_file.templated_variants[0].templated_str == "SELECT * FROM `proj.root_ds.t`\n"
+    assert linter.templater.phase_timer is not None
+
+    nested_file = linter.render_file(str(tmp_path / "sub" / "b.sqlx"), root_config)
+    assert nested_file.templated_variants[0].templated_str == "SELECT * FROM `proj.sub_ds.t`\n"
+    # The nested config turned profiling off for its files.
+    assert linter.templater.phase_timer is None
+
+
+
+def test_config_without_project_index(tmp_path):
+    model = tmp_path / "m.sqlx"
+    model.write_text('config { type: "table", schema: "other_ds" }\nSELECT 1\n')
+    indexed = _config(project_id="p", dataset_id="d", project_index_path=str(tmp_path / "index.bin"))
+    plain = _config(project_id="p", dataset_id="d")
+    templater = indexed.get_templater()
+    templater.sequence_files([str(model)], config=indexed)
+    sql = "SELECT * FROM ${ref('m')}\n"
+
+    templated_file, _ = templater.process(fname="a.sqlx", in_str=sql, config=indexed)
+    assert templated_file.templated_str == "SELECT * FROM `p.other_ds.m`\n"
+    # The second config has no index, so the first one's does not apply.
+    templated_file, _ = templater.process(fname="b.sqlx", in_str=sql, config=plain)
+    assert templated_file.templated_str == "SELECT * FROM `p.d.m`\n"
+    assert templater.project_index is None
@@ -0,0 +1,98 @@
+"""Tests for slice-list compaction and the compact slice table."""
+from sqlfluff.core.templaters.base import RawFileSlice, TemplatedFile, TemplatedFileSlice
+
+from pytest import raises
+
+from sqlfluff_templater_dataform.slices import SliceTable, merge_adjacent_slices
+
+
+def test_merges_empty_templated_runs(templater):
+    input_sqlx = 'config { type: "view" }js { const a = 1; }${when(false, "x")}\nSELECT 1\n'
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(input_sqlx)
+    assert [s.slice_type for s in templated_slices] == ['templated'] * 3 + ['literal']
+
+    compact_raw, compact_templated = merge_adjacent_slices(raw_slices, templated_slices)
+
+    assert [s.slice_type for s in compact_templated] == ['templated', 'literal']
+    assert compact_raw[0].raw == 'config { type: "view" }js { const a = 1; }${when(false, "x")}'
+    assert compact_templated[0].source_slice == slice(0, len(compact_raw[0].raw))
+    assert compact_templated[0].templated_slice == slice(0, 0)
+    assert [s.block_idx for s in compact_raw] == [0, 1]
+    assert [s.source_idx for s in compact_raw] == [0, len(compact_raw[0].raw)]
+
+
+def test_empty_slice_merges_into_templated_output(templater):
+    input_sqlx = "js { const a = 1; }${ref('t')}${ref('u')}\n"
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(input_sqlx)
+
+    compact_raw, compact_templated = merge_adjacent_slices(raw_slices, templated_slices)
+
+    # The two refs both render text, so their boundary is kept.
+    assert [s.raw for s in compact_raw] == [
+        "js { const a = 1; }${ref('t')}", "${ref('u')}", "\n"
+    ]
+    assert compact_templated[0].templated_slice == slice(0, len("`my_project.my_dataset.t`"))
+
+
+def test_literal_slices_are_merged():
+    raw_slices = [RawFileSlice("SELECT ", 'literal', 0, 0), RawFileSlice("1\n", 'literal', 7, 1)]
+    templated_slices = [
+        TemplatedFileSlice('literal', slice(0, 7), slice(0, 7)),
+        TemplatedFileSlice('literal', slice(7, 9), slice(7, 9)),
+    ]
+    compact_raw, compact_templated = merge_adjacent_slices(raw_slices, templated_slices)
+    assert compact_raw == [RawFileSlice("SELECT 1\n", 'literal', 0, 0)]
+    assert compact_templated == [TemplatedFileSlice('literal', slice(0, 9), slice(0, 9))]
+
+
+def test_compact_slices_setting_builds_equivalent_templated_file(templater):
+    input_sqlx = (
+        'config { type: "table" }js { const a = 1; }\n'
+        "SELECT ${ref('t')}.id, ${a} FROM ${ref('t')}\n"
+        '${when(incremental(), "WHERE true")}'
+    )
+    templated_file, _ = templater.process(fname="model.sqlx", in_str=input_sqlx)
+    templater.compact_slices = True
+    compact_file, errors = templater.process(fname="model.sqlx", in_str=input_sqlx)
+
+    assert errors == []
+    assert isinstance(compact_file, TemplatedFile)
+    assert compact_file.templated_str == templated_file.templated_str
+    assert len(compact_file.sliced_file) < len(templated_file.sliced_file)
+    literal_boundaries = [
+        (s.source_slice, s.templated_slice)
+        for s in templated_file.sliced_file if s.slice_type == 'literal'
+    ]
+    assert literal_boundaries == [
+        (s.source_slice, s.templated_slice)
+        for s in compact_file.sliced_file if s.slice_type == 'literal'
+    ]
+
+
+TABLE_SQLX = """config { type: "table" }
+SELECT ${column}, 'é' FROM ${ref('t')} JOIN ${ref('t')} USING (id)
+${when(incremental(), "WHERE true")}
+"""
+
+
+def test_slice_table_round_trips(templater):
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(TABLE_SQLX)
+    table = templater.slice_sqlx_table(TABLE_SQLX)
+
+    assert len(table) == len(raw_slices)
+    assert table.templated_str == replaced_sql
+    assert table.slices() == (raw_slices, templated_slices)
+    # Repeated replacements are stored once.
+    assert table.strings.count("`my_project.my_dataset.t`") == 1
+    assert SliceTable.from_bytes(table.to_bytes()) == table
+
+    templated_file = table.templated_file("model.sqlx")
+    assert templated_file.templated_str == replaced_sql
+    assert SliceTable.from_templated_file(templated_file) == table
+
+
+def test_slice_table_rejects_other_bytes(templater):
+    data = templater.slice_sqlx_table(TABLE_SQLX).to_bytes()
+    for bad in (b"", b"DFX1" + data[4:], data[:-1]):
+        with raises(ValueError):
+            SliceTable.from_bytes(bad)
@@ -1,5 +1,9 @@
 """Tests for the dataform templater."""
-from pytest import mark
+import time
+
+from pytest import mark, raises
+from sqlfluff.core import FluffConfig, Linter
+from sqlfluff.core.errors import SQLFluffSkipFile
 
 
 
@@ -635,3 +639,299 @@ SELECT 'hello world'
     assert replaced_sql == expected_sql
     assert templated_slices[-1].templated_slice.stop == len(replaced_sql)
 
+
+
+def test_slice_sqlx_template_preserve_width(templater):
+    """Width-preserving mode keeps every construct at its source width and line count."""
+    templater.preserve_width = True
+    input_sqlx = """config {
+    type: "table"
+}
+SELECT ${column_name}, ${x} FROM ${ref({
+    schema: "a_rather_long_dataset_name",
+    name: "a_rather_long_table_name"
+})} AS t
+${when(incremental(), "WHERE true")}
+"""
+    expected_sql = (
+        "/*      \n"
+        "                \n"
+        "*/\n"
+        "SELECT js_expression_, js_e FROM "
+        "`my_project.a_rather_long_dataset_name.a_rather_long_table_name`/*"
+        "\n\n                  \n */ AS t\n"
+        "/*                                */\n"
+    )
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(input_sqlx)
+
+    assert replaced_sql == expected_sql
+    assert len(replaced_sql) == len(input_sqlx)
+    assert replaced_sql.count("\n") == input_sqlx.count("\n")
+    for templated_slice in templated_slices:
+        assert templated_slice.source_slice == templated_slice.templated_slice
+    assert [s.raw for s in raw_slices] == [
+        input_sqlx[s.source_slice] for s in templated_slices
+    ]
+
+
+def test_slice_sqlx_template_preserve_width_longer_replacement(templater):
+    """A table name wider than its ${ref()} is kept whole and shifts what follows."""
+    templater.preserve_width = True
+    replaced_sql, _, templated_slices = templater.slice_sqlx_template(
+        "SELECT * FROM ${ref('t')} AS t\n"
+    )
+    assert replaced_sql == "SELECT * FROM `my_project.my_dataset.t` AS t\n"
+    assert templated_slices[-1].templated_slice.stop == len(replaced_sql)
+
+
+def test_process_preserve_width_builds_templated_file(templater):
+    templater.preserve_width = True
+    input_sqlx = "config { type: \"view\" }\nSELECT ${x} AS x\n"
+    templated_file, errors = templater.process(fname="model.sqlx", in_str=input_sqlx)
+    assert errors == []
+    assert templated_file.templated_str == (
+        "/*                   */\nSELECT js_e AS x\n"
+    )
+    assert len(templated_file.templated_str) == len(input_sqlx)
+
+
+@mark.parametrize(
+    "input_sqlx",
+    [
+        "SELECT 1 /* see ${ref('t')} and ${x} */ AS a\nFROM t\n",
+        "SELECT 1 AS a -- from ${ref(\n    'tbl'\n  )}, then more\nFROM t\n",
+        "SELECT\n  ${fn(\n    x\n  )} AS a\nFROM t\n",
+    ],
+)
+def test_preserve_width_padding_parses_in_comments(input_sqlx):
+    config = FluffConfig(
+        configs={"templater": {"dataform": {
+            "project_id": "p", "dataset_id": "d", "preserve_width": True,
+        }}},
+        overrides={"dialect": "bigquery", "templater": "dataform", "rules": "LT01"},
+    )
+    templater = config.get_templater()
+    templated_file, _ = templater.process(fname="model.sqlx", in_str=input_sqlx, config=config)
+    linted = Linter(config=config).lint_string(input_sqlx, fname="model.sqlx")
+
+    if "--" not in input_sqlx:
+        assert templated_file.templated_str.count("\n") == input_sqlx.count("\n")
+    assert [v.rule_code() for v in linted.violations if v.rule_code() == "PRS"] == []
+
+
+def test_iter_slices_matches_slice_sqlx_template(templater):
+    input_sqlx = """config { type: "table" }
+SELECT ${column_name} FROM ${ref('test')} JOIN ${self()} USING (id)
+${when(incremental(), "WHERE true", "WHERE false")}
+"""
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(input_sqlx)
+    steps = list(templater.iter_slices(input_sqlx))
+
+    assert [step[0] for step in steps] == raw_slices
+    assert [step[1] for step in steps] == templated_slices
+    assert ''.join(step[2] for step in steps) == replaced_sql
+    for _, templated_slice, text in steps:
+        assert replaced_sql[templated_slice.templated_slice] == text
+
+
+def test_iter_slices_stops_early(templater):
+    """A consumer can stop after the config block without slicing the rest."""
+    input_sqlx = 'config { type: "table" }\n' + "SELECT * FROM ${ref('t')}\n" * 1000 + "${x"
+    steps = templater.iter_slices(input_sqlx)
+    raw_slice, templated_slice, text = next(steps)
+    steps.close()
+
+    assert raw_slice.raw == 'config { type: "table" }'
+    assert templated_slice.templated_slice == slice(0, 0)
+    assert text == ''
+    # The unterminated ${x at the end was never reached.
+    assert templater.malformed_fallbacks == 0
+    assert list(templater.iter_slices("${x"))[0][2] == "${x"
+    assert templater.malformed_fallbacks == 1
+
+
+def test_iter_slices_empty_input(templater):
+    assert list(templater.iter_slices("")) == []
+
+
+@mark.parametrize("input_sqlx", [
+    'config { type: "incremental" }\nSELECT * FROM ${ref("a")} JOIN ${ref({schema: "s", name: "b"})}\n'
+    '${when(incremental(), `WHERE ts > (SELECT MAX(ts) FROM ${self()})`)}\n',
+    'js { const f = () => { return {a: {b: 1}}; }; }\nSELECT ${f().a.b}, ${ {x: 1}.x } FROM ${self()}\n',
+    'pre_operations { DECLARE x INT64; }\npost_operations { SELECT 1 }\nSELECT 1\n',
+])
+def test_large_file_tier_matches_default_scanner(templater, input_sqlx):
+    expected = templater.slice_sqlx_template(input_sqlx)
+    templater.large_file_threshold = 1
+
+    assert templater.slice_sqlx_template(input_sqlx) == expected
+
+
+def test_large_file_tier_is_linear_on_unterminated_blocks(templater):
+    # Every unterminated config { is rescanned to the end of the file by the
+    # default scanner once the ${self()} after it has been sliced.
+    input_sqlx = "config { ${self()} " * 20000
+    templater.large_file_threshold = 1
+
+    start = time.perf_counter()
+    _, raw_slices, _ = templater.slice_sqlx_template(input_sqlx)
+
+    assert time.perf_counter() - start < 5
+    assert len(raw_slices) == 40001
+    assert templater.malformed_fallbacks == 20000
+
+
+def test_max_file_size_skips_with_reason():
+    config = FluffConfig(
+        configs={"templater": {"dataform": {"max_file_size": 10}}},
+        overrides={"dialect": "bigquery", "templater": "dataform"},
+    )
+    templater = config.get_templater()
+
+    with raises(SQLFluffSkipFile, match="over the dataform templater's max_file_size of 10"):
+        templater.process(fname="big.sqlx", in_str="SELECT 1 FROM t\n", config=config)
+
+
+def test_lint_operations_keeps_operations_sql(templater):
+    templater.lint_operations = True
+    input_sqlx = """config { type: "incremental" }
+pre_operations {
+  DELETE FROM ${self()} WHERE day = ${day}
+}
+SELECT * FROM ${ref('t')}
+post_operations {
+  INSERT INTO ${ref('log')} VALUES (1);
+}
+"""
+    replaced_sql, raw_slices, templated_slices = templater.slice_sqlx_template(input_sqlx)
+
+    assert replaced_sql == (
+        "\n"
+        "\n  DELETE FROM `my_project.my_dataset.self` WHERE day = 'js_expression';\n\n"
+        "SELECT * FROM `my_project.my_dataset.t`;\n"
+        "\n  INSERT INTO `my_project.my_dataset.log` VALUES (1);\n\n"
+    )
+    assert [s.raw for s in raw_slices] == [input_sqlx[s.source_slice] for s in templated_slices]
+    assert "".join(s.raw for s in raw_slices) == input_sqlx
+    literals = [s.raw for s in raw_slices if s.slice_type == "literal"]
+    assert "\n  INSERT INTO " in literals
+
+
+def test_lint_operations_adds_delimiters_only_where_missing(tmp_path):
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\n"
+        "rules = ST12, CV06\n\n"
+        "[sqlfluff:templater:dataform]\nproject_id = p\ndataset_id = d\nlint_operations = True\n"
+    )
+    model = tmp_path / "model.sqlx"
+    model.write_text(
+        "pre_operations {\n  DECLARE x INT64 DEFAULT 1;\n}\n"
+        "SELECT * FROM ${ref('t')};\n"
+        "post_operations {\n  SELECT 1;\n}\n"
+    )
+    config = FluffConfig.from_path(str(tmp_path))
+    templater = config.get_templater()
+    templated_file, _ = templater.process(
+        fname=str(model), in_str=model.read_text(), config=config
+    )
+
+    assert templated_file.templated_str == (
+        "\n  DECLARE x INT64 DEFAULT 1;\n\n"
+        "SELECT * FROM `p.d.t`;\n"
+        "\n  SELECT 1;\n\n"
+    )
+    linted = Linter(config=config).lint_path(str(model))
+    assert linted.files[0].violations == []
+
+
+def test_lint_operations_indented_blocks_pass_layout_rules(tmp_path):
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\n\n"
+        "[sqlfluff:templater:dataform]\nproject_id = p\ndataset_id = d\nlint_operations = True\n"
+    )
+    model = tmp_path / "model.sqlx"
+    model.write_text(
+        "config { type: \"incremental\" }\n\n"
+        "pre_operations {\n"
+        "    DECLARE x INT64 DEFAULT 1;\n"
+        "    DELETE FROM ${self()}\n"
+        "    WHERE x = 1\n"
+        "}\n\n"
+        "SELECT a\nFROM ${ref('t')}\n\n"
+        "post_operations {\n"
+        "    INSERT INTO ${ref('log')} VALUES (1)\n"
+        "}\n"
+    )
+    config = FluffConfig.from_path(str(tmp_path))
+    linted = Linter(config=config).lint_path(str(model))
+
+    # With the default rules: no indentation, delimiter or layout complaints.
+    assert [(v.rule_code(), v.line_no) for v in linted.files[0].violations] == []
+
+
+def test_lint_operations_fixes_map_into_blocks(tmp_path):
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\nrules = CP01\n\n"
+        "[sqlfluff:templater:dataform]\nproject_id = p\ndataset_id = d\nlint_operations = True\n\n"
+        "[sqlfluff:rules:capitalisation.keywords]\ncapitalisation_policy = upper\n"
+    )
+    model = tmp_path / "model.sqlx"
+    model.write_text(
+        "pre_operations {\n  delete from ${self()} where true\n}\nSELECT * FROM ${ref('t')}\n"
+    )
+    config = FluffConfig.from_path(str(tmp_path))
+    linted = Linter(config=config).lint_path(str(model), fix=True)
+
+    assert linted.files[0].fix_string()[0] == (
+        "pre_operations {\n  DELETE FROM ${self()} WHERE true\n}\nSELECT * FROM ${ref('t')}\n"
+    )
+
+
+def test_slice_sqlx_variants_renders_incremental_sql(templater):
+    input_sqlx = """config { type: "incremental" }
+SELECT * FROM ${ref('t')}
+${when(incremental(), `WHERE ts > (SELECT MAX(ts) FROM ${self()}) AND x = ${y}`)}
+"""
+    (full_sql, full_raw, _), (incremental_sql, raw_slices, templated_slices) = (
+        templater.slice_sqlx_variants(input_sqlx)
+    )
+
+    assert full_sql == templater.slice_sqlx_template(input_sqlx)[0]
+    assert incremental_sql == (
+        "\nSELECT * FROM `my_project.my_dataset.t`\n"
+        "WHERE ts > (SELECT MAX(ts) FROM `my_project.my_dataset.self`) AND x = 'js_expression'\n"
+    )
+    assert raw_slices == full_raw
+    for templated_slice in templated_slices:
+        if templated_slice.slice_type == "literal":
+            assert (
+                incremental_sql[templated_slice.templated_slice]
+                == input_sqlx[templated_slice.source_slice]
+            )
+    assert templated_slices[-1].templated_slice.stop == len(incremental_sql)
+
+
+@mark.parametrize("input_sqlx", [
+    "SELECT 1\n",
+    "SELECT ${when(is_prod(), 'a', 'b')} FROM t\n",
+])
+def test_slice_sqlx_variants_single_variant(templater, input_sqlx):
+    assert len(list(templater.slice_sqlx_variants(input_sqlx))) == 1
+
+
+def test_process_with_variants_lints_incremental_sql(tmp_path):
+    (tmp_path / ".sqlfluff").write_text(
+        "[sqlfluff]\ntemplater = dataform\ndialect = bigquery\nsql_file_exts = .sqlx\n"
+        "render_variant_limit = 2\n"
+    )
+    model = tmp_path / "model.sqlx"
+    model.write_text("SELECT a FROM t\n${when(incremental(), \"WHERE WHERE a > 1\")}\n")
+    linter = Linter(config=FluffConfig.from_path(str(tmp_path)))
+
+    rendered = linter.render_file(str(model), linter.config)
+    assert [variant.templated_str for variant in rendered.templated_variants] == [
+        "SELECT a FROM t\n\n",
+        "SELECT a FROM t\nWHERE WHERE a > 1\n",
+    ]
+    violations = linter.lint_path(str(model)).files[0].get_violations()
+    assert any(violation.rule_code() == "PRS" for violation in violations)